@@ -1,17 +1,20 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, File, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status, File, UploadFile, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import Response, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import InsertOne, UpdateOne, UpdateMany, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field, ConfigDict, EmailStr, ValidationError
+from typing import AbstractSet, List, Optional, Dict
 import uuid
 import shutil
-import requests
+import httpx
 import random
 import string
 from datetime import datetime, timezone, timedelta
@@ -20,18 +23,32 @@ import jwt
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.utils import format_datetime, parsedate_to_datetime
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import math
 import asyncio
 import json
+import orjson
+import re
+import unicodedata
+import base64
+import hashlib
+import time
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image, ImageOps
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# tz_aware: dates come back as UTC-aware datetimes, comparable with datetime.now(timezone.utc)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True)
 db = client[os.environ['DB_NAME']]
 
 # Create uploads directory
@@ -53,13 +70,124 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 43200  # 30 days
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
 # Email configuration
 GMAIL_USER = os.environ.get("GMAIL_USER", "")
 GMAIL_APP_PASSWORD = os.environ.get("GMAIL_APP_PASSWORD", "")
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+# Point SMTP_SERVER/SMTP_PORT at a local debugging server (e.g. `python -m aiosmtpd -n -l localhost:1025`)
+# with SMTP_STARTTLS=false to exercise the outbox without Gmail
+SMTP_SERVER = os.environ.get("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "true").lower() == "true"
+SMTP_TIMEOUT_SECONDS = float(os.environ.get("SMTP_TIMEOUT_SECONDS", "20"))
+SMTP_IDLE_SECONDS = int(os.environ.get("SMTP_IDLE_SECONDS", "60"))  # reconnect after this long unused
+EMAIL_FROM_ADDRESS = os.environ.get("EMAIL_FROM_ADDRESS", GMAIL_USER or "noreply@localhost")
+# Gmail needs credentials; a non-default server (local debug server) may not
+EMAIL_CONFIGURED = bool(GMAIL_USER and GMAIL_APP_PASSWORD) or SMTP_SERVER != "smtp.gmail.com"
+
+# Email outbox sender
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", "20"))
+EMAIL_OUTBOX_POLL_SECONDS = int(os.environ.get("EMAIL_OUTBOX_POLL_SECONDS", "30"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+EMAIL_OUTBOX_BACKOFF_SECONDS = int(os.environ.get("EMAIL_OUTBOX_BACKOFF_SECONDS", "30"))
+EMAIL_OUTBOX_CLAIM_TIMEOUT = timedelta(minutes=5)  # reclaim "sending" rows left by a dead worker
+EMAIL_OUTBOX_RETENTION_DAYS = int(os.environ.get("EMAIL_OUTBOX_RETENTION_DAYS", "7"))  # sent rows, then TTL-deleted
+
+# Authenticated user cache
+USER_CACHE_TTL_SECONDS = int(os.environ.get("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAX_SIZE = int(os.environ.get("USER_CACHE_MAX_SIZE", "10000"))
+
+# Per-user block sets (blocked either way), cached for listing/chat filtering
+BLOCK_CACHE_TTL_SECONDS = int(os.environ.get("BLOCK_CACHE_TTL_SECONDS", "60"))
+BLOCK_CACHE_MAX_SIZE = int(os.environ.get("BLOCK_CACHE_MAX_SIZE", "10000"))
+
+# External APIs (override to point at stub_upstream.py when testing offline)
+EXCHANGE_RATE_API_URL = os.environ.get("EXCHANGE_RATE_API_URL", "https://api.exchangerate-api.com/v4/latest")
+EMERGENT_AUTH_SESSION_URL = os.environ.get(
+    "EMERGENT_AUTH_SESSION_URL",
+    "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+
+# Outbound HTTP client
+HTTP_CLIENT_TIMEOUT_SECONDS = float(os.environ.get("HTTP_CLIENT_TIMEOUT_SECONDS", "10"))
+HTTP_CLIENT_MAX_CONNECTIONS = int(os.environ.get("HTTP_CLIENT_MAX_CONNECTIONS", "100"))
+HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST", "10"))
+HTTP_CLIENT_RETRIES = int(os.environ.get("HTTP_CLIENT_RETRIES", "2"))
+HTTP_CLIENT_BACKOFF_SECONDS = float(os.environ.get("HTTP_CLIENT_BACKOFF_SECONDS", "0.2"))
+# Longest Retry-After we'll wait out; a longer one returns the response as-is
+HTTP_CLIENT_MAX_RETRY_AFTER_SECONDS = float(os.environ.get("HTTP_CLIENT_MAX_RETRY_AFTER_SECONDS", "5"))
+
+# Conditional GET: how often each worker re-reads the shared change counters
+CHANGE_COUNTER_SYNC_SECONDS = float(os.environ.get("CHANGE_COUNTER_SYNC_SECONDS", "2"))
+EXCHANGE_CHANGES_ETAG_SECONDS = 300  # the 24h window of /exchange-rates/changes moves with time
+
+# Token revocation list sync
+REVOCATION_SYNC_INTERVAL_SECONDS = int(os.environ.get("REVOCATION_SYNC_INTERVAL_SECONDS", "5"))
+
+# Presence tracking (last_seen / is_online)
+PRESENCE_FLUSH_INTERVAL_SECONDS = int(os.environ.get("PRESENCE_FLUSH_INTERVAL_SECONDS", "5"))
+ONLINE_WINDOW = timedelta(minutes=5)
+
+# Listing view counting: views are buffered in memory and flushed as batched $inc
+VIEW_FLUSH_INTERVAL_SECONDS = int(os.environ.get("VIEW_FLUSH_INTERVAL_SECONDS", "10"))
+VIEW_DEDUP_WINDOW_SECONDS = int(os.environ.get("VIEW_DEDUP_WINDOW_SECONDS", "1800"))
+VIEW_DEDUP_MAX_ENTRIES = int(os.environ.get("VIEW_DEDUP_MAX_ENTRIES", "100000"))
+POPULAR_SELLER_VIEWS = 1000
+
+# Password hashing worker pool (bcrypt runs off the event loop)
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+# Image processing worker pool (EXIF stripping and WebP variants for uploads)
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+IMAGE_MAX_QUEUE = int(os.environ.get("IMAGE_MAX_QUEUE", "16"))
+IMAGE_VARIANTS = {"thumb": 320, "medium": 1280}  # thumb: square crop; medium: longest side
+IMAGE_WEBP_QUALITY = 80
+IMAGE_MAX_PIXELS = 40_000_000  # larger images are rejected rather than decoded
+# Decoded format: format the upload is re-saved as, without metadata. Anything
+# else is rejected. MPO (phone camera JPEGs with extra frames) keeps its first frame.
+IMAGE_RESAVE_FORMATS = {"JPEG": "JPEG", "MPO": "JPEG", "PNG": "PNG", "WEBP": "WEBP", "GIF": "GIF"}
+IMAGE_UPLOAD_TYPES = ("image/jpeg", "image/jpg", "image/png", "image/webp")  # listing and profile photos
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Member numbers (#K01000 ...) come from an atomic counter in db.counters
+MEMBER_NUMBER_START = 1000
+MEMBER_NUMBER_BLOCK_SIZE = int(os.environ.get("MEMBER_NUMBER_BLOCK_SIZE", "1"))
+
+# Expiry timer wheel (listings, exchange confirmations, meetups)
+EXPIRY_TICK_SECONDS = 1
+EXPIRY_WHEEL_SLOTS = 3600  # one revolution per hour
+EXPIRY_SYNC_INTERVAL_SECONDS = int(os.environ.get("EXPIRY_SYNC_INTERVAL_SECONDS", "300"))
+EXPIRY_SYNC_LOOKAHEAD_SECONDS = 2 * EXPIRY_SYNC_INTERVAL_SECONDS
+EXPIRY_WARNING_MINUTES = int(os.environ.get("EXPIRY_WARNING_MINUTES", "30"))  # 0 disables
+
+# POST /listings/batch
+LISTING_BATCH_MAX_OPERATIONS = int(os.environ.get("LISTING_BATCH_MAX_OPERATIONS", "100"))
+
+# Latest exchange rates, cached per worker for scoring listings
+MARKET_RATES_CACHE_SECONDS = int(os.environ.get("MARKET_RATES_CACHE_SECONDS", "300"))
+
+# In-memory active listings index (browse and nearby)
+LISTING_INDEX_REFRESH_SECONDS = int(os.environ.get("LISTING_INDEX_REFRESH_SECONDS", "60"))
+LISTING_INDEX_GEOHASH_PRECISION = 4  # cells of roughly 39km x 20km
+NEARBY_MAX_RADIUS_KM = float(os.environ.get("NEARBY_MAX_RADIUS_KM", "500"))
+
+# Auth throttling: attempts allowed per sliding window, per client IP and per email
+LOGIN_LIMIT_PER_IP = int(os.environ.get("LOGIN_LIMIT_PER_IP", "20"))
+LOGIN_LIMIT_PER_EMAIL = int(os.environ.get("LOGIN_LIMIT_PER_EMAIL", "5"))
+LOGIN_WINDOW_SECONDS = int(os.environ.get("LOGIN_WINDOW_SECONDS", "300"))
+REGISTER_LIMIT_PER_IP = int(os.environ.get("REGISTER_LIMIT_PER_IP", "5"))
+REGISTER_WINDOW_SECONDS = int(os.environ.get("REGISTER_WINDOW_SECONDS", "3600"))
+FORGOT_PASSWORD_LIMIT_PER_IP = int(os.environ.get("FORGOT_PASSWORD_LIMIT_PER_IP", "5"))
+FORGOT_PASSWORD_LIMIT_PER_EMAIL = int(os.environ.get("FORGOT_PASSWORD_LIMIT_PER_EMAIL", "3"))
+FORGOT_PASSWORD_WINDOW_SECONDS = int(os.environ.get("FORGOT_PASSWORD_WINDOW_SECONDS", "3600"))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "50000"))
+# Number of reverse proxies in front of the app that append to X-Forwarded-For.
+# With N > 0 the client is the Nth entry from the right (entries further left
+# are client-supplied and can be forged); 0 ignores the header.
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "0"))
 
 # Helper function to generate 6-character alphanumeric code
 def generate_meetup_code():
@@ -67,6 +195,181 @@ def generate_meetup_code():
     chars = string.ascii_uppercase + string.digits
     return ''.join(random.choice(chars) for _ in range(6))
 
+# Atomic sequence backed by db.counters, optionally pre-allocating a block
+# of values per worker so most allocations don't need a round trip
+class SequenceAllocator:
+    def __init__(self, name: str, block_size: int = 1, seed=None):
+        self.name = name
+        self.block_size = max(1, block_size)
+        self.seed = seed  # async callable returning the last value already in use
+        self.seeded = False
+        self.next_value = 0
+        self.block_end = -1
+        self.lock = asyncio.Lock()
+    
+    async def ensure_seeded(self):
+        if self.seeded:
+            return
+        existing = await db.counters.find_one({"_id": self.name})
+        if existing is None and self.seed is not None:
+            # $max keeps this safe when several workers seed at the same time
+            await db.counters.update_one(
+                {"_id": self.name},
+                {"$max": {"value": await self.seed()}},
+                upsert=True
+            )
+        self.seeded = True
+    
+    async def next(self) -> int:
+        async with self.lock:
+            if self.next_value > self.block_end:
+                await self.ensure_seeded()
+                counter = await db.counters.find_one_and_update(
+                    {"_id": self.name},
+                    {"$inc": {"value": self.block_size}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER
+                )
+                self.block_end = counter["value"]
+                self.next_value = self.block_end - self.block_size + 1
+            value = self.next_value
+            self.next_value += 1
+            return value
+
+async def last_member_number() -> int:
+    """Highest member number already assigned, used to seed the counter once"""
+    last_num = MEMBER_NUMBER_START - 1
+    last_user = await db.users.find_one(
+        {"member_number": {"$exists": True, "$ne": None}},
+        {"_id": 0, "member_number": 1},
+        sort=[("member_number", -1)]
+    )
+    if last_user:
+        # Son numarayı parse et (#K01000 -> 1000)
+        try:
+            last_num = max(last_num, int(last_user["member_number"].replace("#K", "")))
+        except ValueError:
+            pass
+    return last_num
+
+member_number_sequence = SequenceAllocator("member_number", MEMBER_NUMBER_BLOCK_SIZE, seed=last_member_number)
+
+async def allocate_member_number() -> str:
+    """Allocate the next unique member number, e.g. #K01000"""
+    return f"#K{await member_number_sequence.next():05d}"
+
+# Per-collection change counters behind ETag/Last-Modified on polled GETs.
+# Every write to a tracked collection bumps db.counters {"_id": "changes.<name>"}
+# so all workers agree on the version. Reads use a per-worker copy refreshed
+# every CHANGE_COUNTER_SYNC_SECONDS, so a write made on another worker can be
+# answered with 304 for at most that long when the body is read from Mongo.
+# Bodies served from a worker's ActiveListingIndex lag other workers' writes
+# until its next rebuild, so those responses also put the index generation in
+# their validators; the ETag then changes when the body does.
+class ChangeCounters:
+    def __init__(self, names: tuple):
+        self.names = names
+        self.versions: Dict[str, tuple] = {}  # name: (value, changed_at)
+        self.synced_at = float("-inf")
+        self.not_modified_responses = 0
+    
+    def _store(self, counter: dict):
+        name = counter["_id"].split(".", 1)[1]
+        current = self.versions.get(name)
+        if current is None or counter["value"] > current[0]:
+            self.versions[name] = (counter["value"], as_utc(counter["changed_at"]))
+    
+    async def bump(self, name: str, changed_at: Optional[datetime] = None):
+        counter = await db.counters.find_one_and_update(
+            {"_id": f"changes.{name}"},
+            {"$inc": {"value": 1}, "$max": {"changed_at": changed_at or datetime.now(timezone.utc)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._store(counter)
+    
+    async def get(self, names: tuple) -> List[tuple]:
+        if time.monotonic() - self.synced_at >= CHANGE_COUNTER_SYNC_SECONDS:
+            self.synced_at = time.monotonic()
+            async for counter in db.counters.find({"_id": {"$in": [f"changes.{name}" for name in self.names]}}):
+                self._store(counter)
+        return [self.versions.get(name, (0, None)) for name in names]
+    
+    async def validators(self, names: tuple, *variant) -> tuple:
+        """(ETag, Last-Modified) for a response built from `names`; `variant` holds
+        whatever else the body depends on (path and query params, viewer)"""
+        versions = await self.get(names)
+        digest = hashlib.blake2b(repr((names, versions, variant)).encode(), digest_size=12).hexdigest()
+        changed = [changed_at for _, changed_at in versions if changed_at is not None]
+        return f'"{digest}"', max(changed) if changed else None
+    
+    def not_modified(
+        self, request: Request, etag: str, last_modified: Optional[datetime], exists: bool = True
+    ) -> Optional[Response]:
+        """A 304 if the client's copy is current, else None. Pass exists=False when
+        the resource hasn't been looked up yet, so "If-None-Match: *" (which only
+        matches a resource that exists) isn't answered for one that may not."""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            fresh = ("*" in tags and exists) or etag in tags
+        elif last_modified is not None and request.headers.get("if-modified-since"):
+            try:
+                since = as_utc(parsedate_to_datetime(request.headers["if-modified-since"]))
+                fresh = last_modified.replace(microsecond=0) <= since
+            except (TypeError, ValueError):
+                fresh = False
+        else:
+            fresh = False
+        if not fresh:
+            return None
+        self.not_modified_responses += 1
+        return Response(status_code=304, headers=validator_headers(etag, last_modified))
+    
+    def stats(self) -> dict:
+        return {
+            "versions": {name: version[0] for name, version in self.versions.items()},
+            "not_modified_responses": self.not_modified_responses
+        }
+
+def validator_headers(etag: str, last_modified: Optional[datetime]) -> Dict[str, str]:
+    # no-cache: clients may keep the body but must revalidate before reuse
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+change_counters = ChangeCounters(("listings", "ratings", "user_blocks", "exchange_rates"))
+
+def normalize_username(username: str) -> str:
+    """Case-folded form stored in username_lower for exact, indexed lookups"""
+    return username.strip().lower()
+
+async def username_taken(username: str) -> bool:
+    existing = await db.users.find_one({"username_lower": normalize_username(username)}, {"_id": 0, "id": 1})
+    return existing is not None
+
+async def backfill_username_lower():
+    """Populate username_lower for users created before it existed"""
+    try:
+        updated = 0
+        while True:
+            users = await db.users.find(
+                {"username_lower": {"$exists": False}},
+                {"_id": 0, "id": 1, "username": 1}
+            ).to_list(1000)
+            if not users:
+                break
+            await db.users.bulk_write([
+                UpdateOne({"id": u["id"]}, {"$set": {"username_lower": normalize_username(u.get("username") or "")}})
+                for u in users
+            ], ordered=False)
+            updated += len(users)
+        if updated:
+            logger.info(f"👤 Backfilled username_lower for {updated} users")
+    except Exception as e:
+        logger.error(f"❌ Error backfilling username_lower: {e}")
+
 # Helper functions
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -74,35 +377,899 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# Bounded executor for bcrypt so a login burst doesn't block the event loop
+class PasswordHasher:
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self.pending = 0  # submitted and not yet finished
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        self.max_latency = 0.0
+    
+    async def _run(self, func, *args):
+        # Admission control: reject early instead of growing an unbounded queue
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "1"}
+            )
+        
+        def timed_call():
+            started = time.perf_counter()
+            result = func(*args)
+            return started, result, time.perf_counter()
+        
+        self.pending += 1
+        submitted = time.perf_counter()
+        try:
+            started, result, finished = await asyncio.get_running_loop().run_in_executor(self.executor, timed_call)
+        finally:
+            self.pending -= 1
+        
+        self.completed += 1
+        self.total_wait += started - submitted
+        self.total_run += finished - started
+        self.max_latency = max(self.max_latency, finished - submitted)
+        return result
+    
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+    
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+    
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self.pending, self.max_workers),
+            "queue_depth": max(0, self.pending - self.max_workers),
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait / completed * 1000, 2),
+            "avg_run_ms": round(self.total_run / completed * 1000, 2),
+            "max_latency_ms": round(self.max_latency * 1000, 2)
+        }
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+def image_variant_path(path: Path, variant: str) -> Path:
+    return path.with_name(f"{path.stem}_{variant}.webp")
+
+def process_image(path: str) -> dict:
+    """Runs in the image worker pool. Re-saves the upload at `path` without EXIF
+    (GPS, camera serials) and writes the IMAGE_VARIANTS next to it as WebP.
+    Returns the dimensions of the original and of each variant."""
+    source = Path(path)
+    try:
+        opened = Image.open(source)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ValueError(f"not a valid image: {e}") from None
+    
+    with opened:
+        try:
+            # Only the header has been read so far; refuse to decode huge images
+            if opened.width * opened.height > IMAGE_MAX_PIXELS:
+                raise ValueError(f"{opened.width}x{opened.height} exceeds {IMAGE_MAX_PIXELS} pixels")
+            # Formats that can't be re-saved would be served with their metadata
+            save_format = IMAGE_RESAVE_FORMATS.get(opened.format)
+            if save_format is None:
+                raise ValueError(f"unsupported format {opened.format}")
+            opened.load()
+            animated = getattr(opened, "is_animated", False) and opened.format != "MPO"
+            icc_profile = opened.info.get("icc_profile")
+            # Apply the EXIF orientation to the pixels before the tag is dropped
+            image = ImageOps.exif_transpose(opened)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            raise ValueError(f"not a valid image: {e}") from None
+        
+        # Every upload is re-saved, since the original is served as is. Animated
+        # uploads keep their frames (variants use the first one); metadata is
+        # only written when passed to save(), so none of it carries over.
+        temp_path = source.with_name(f".{source.name}.tmp")
+        if animated:
+            opened.save(temp_path, format=save_format, save_all=True, icc_profile=icc_profile)
+        else:
+            options = {"quality": 90} if save_format == "JPEG" else {}
+            image.save(temp_path, format=save_format, icc_profile=icc_profile, **options)
+        os.replace(temp_path, source)
+    
+    if image.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in image.getbands() or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    
+    variants = {}
+    for name, size in IMAGE_VARIANTS.items():
+        if name == "thumb":
+            # Square crop, never larger than the image's shorter side
+            side = min(size, image.width, image.height)
+            variant = ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+        else:
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variant_path = image_variant_path(source, name)
+        variant.save(variant_path, format="WEBP", quality=IMAGE_WEBP_QUALITY, icc_profile=icc_profile)
+        variants[name] = {"filename": variant_path.name, "width": variant.width, "height": variant.height}
+    
+    return {"width": image.width, "height": image.height, **variants}
+
+# Bounded process pool for Pillow work: decoding and resizing are CPU bound
+# and would hold the GIL in a thread. spawn rather than fork because the
+# parent already runs Mongo, executor and scheduler threads.
+class ImageProcessor:
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = self._new_executor()
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+        self.rejected = 0
+        self.total_time = 0.0
+        self.max_latency = 0.0
+    
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+    
+    async def process(self, path: Path) -> dict:
+        """Strip metadata from the upload at `path` and write its variants. Raises
+        ValueError if the file isn't a decodable image."""
+        if self.pending >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "1"}
+            )
+        
+        executor = self.executor
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(executor, process_image, str(path))
+        except ValueError:
+            self.failed += 1
+            raise
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); the pool can't be reused
+            self.failed += 1
+            if self.executor is executor:
+                executor.shutdown(wait=False)
+                self.executor = self._new_executor()
+                self.restarts += 1
+            raise HTTPException(status_code=503, detail="Image processing unavailable, please try again")
+        finally:
+            self.pending -= 1
+        
+        elapsed = time.perf_counter() - started
+        self.completed += 1
+        self.total_time += elapsed
+        self.max_latency = max(self.max_latency, elapsed)
+        return result
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def stats(self) -> dict:
+        completed = self.completed or 1
+        return {
+            "workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self.pending, self.max_workers),
+            "queue_depth": max(0, self.pending - self.max_workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+            "avg_ms": round(self.total_time / completed * 1000, 2),
+            "max_latency_ms": round(self.max_latency * 1000, 2)
+        }
+
+image_processor = ImageProcessor(IMAGE_WORKERS, IMAGE_MAX_QUEUE)
+
+def image_variant_urls(record: dict, url_prefix: str) -> dict:
+    """A process_image result with each variant's filename turned into a URL under url_prefix"""
+    return {
+        "width": record["width"],
+        "height": record["height"],
+        **{
+            name: {"url": f"{url_prefix}/{record[name]['filename']}", "width": record[name]["width"], "height": record[name]["height"]}
+            for name in IMAGE_VARIANTS
+        }
+    }
+
+async def save_upload(file: UploadFile, destination: Path, max_size: int, too_large_detail: str):
+    """Stream an upload to `destination` one chunk at a time, giving up as soon
+    as it passes max_size. Writes go to a temp file in the same directory (off
+    the event loop) and are renamed into place, so a partial file is never visible."""
+    # Starlette knows the size once the multipart body is parsed
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(status_code=400, detail=too_large_detail)
+    
+    temp_path = destination.with_name(f".{destination.name}.{uuid.uuid4().hex[:8]}.part")
+    buffer = await asyncio.to_thread(open, temp_path, "wb")
+    try:
+        size = 0
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=400, detail=too_large_detail)
+            await asyncio.to_thread(buffer.write, chunk)
+        await asyncio.to_thread(buffer.close)
+        await asyncio.to_thread(os.replace, temp_path, destination)
+    except BaseException:
+        buffer.close()
+        temp_path.unlink(missing_ok=True)
+        raise
+
+def remove_image_files(path: Path):
+    """Delete an upload along with its variants and any half-written re-save"""
+    leftover = path.with_name(f".{path.name}.tmp")
+    for file_path in [path, leftover, *(image_variant_path(path, name) for name in IMAGE_VARIANTS)]:
+        if file_path.exists():
+            file_path.unlink()
+
+# Sliding-window attempt limiter. Each key keeps the timestamps of its recent
+# attempts (at most `limit` of them); keys are evicted LRU beyond max_keys.
+class SlidingWindowLimiter:
+    def __init__(self, name: str, limit: int, window_seconds: int, max_keys: int):
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.attempts: "OrderedDict[str, deque]" = OrderedDict()
+        self.allowed = 0
+        self.rejected = 0
+        self.evictions = 0
+    
+    def retry_after(self, key: str) -> float:
+        """Seconds until `key` may try again, 0 if it is under the limit"""
+        window = self.attempts.get(key)
+        if window is None:
+            return 0
+        cutoff = time.monotonic() - self.window_seconds
+        while window and window[0] <= cutoff:
+            window.popleft()
+        if len(window) < self.limit:
+            return 0
+        return window[0] - cutoff
+    
+    def record(self, key: str):
+        window = self.attempts.get(key)
+        if window is None:
+            window = self.attempts[key] = deque(maxlen=self.limit)
+        window.append(time.monotonic())
+        self.attempts.move_to_end(key)
+        self.allowed += 1
+        while len(self.attempts) > self.max_keys:
+            self.attempts.popitem(last=False)
+            self.evictions += 1
+    
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "window_seconds": self.window_seconds,
+            "keys": len(self.attempts),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "evictions": self.evictions
+        }
+
+login_ip_limiter = SlidingWindowLimiter("login_ip", LOGIN_LIMIT_PER_IP, LOGIN_WINDOW_SECONDS, RATE_LIMIT_MAX_KEYS)
+login_email_limiter = SlidingWindowLimiter("login_email", LOGIN_LIMIT_PER_EMAIL, LOGIN_WINDOW_SECONDS, RATE_LIMIT_MAX_KEYS)
+register_ip_limiter = SlidingWindowLimiter("register_ip", REGISTER_LIMIT_PER_IP, REGISTER_WINDOW_SECONDS, RATE_LIMIT_MAX_KEYS)
+forgot_password_ip_limiter = SlidingWindowLimiter(
+    "forgot_password_ip", FORGOT_PASSWORD_LIMIT_PER_IP, FORGOT_PASSWORD_WINDOW_SECONDS, RATE_LIMIT_MAX_KEYS
+)
+forgot_password_email_limiter = SlidingWindowLimiter(
+    "forgot_password_email", FORGOT_PASSWORD_LIMIT_PER_EMAIL, FORGOT_PASSWORD_WINDOW_SECONDS, RATE_LIMIT_MAX_KEYS
+)
+auth_limiters = [
+    login_ip_limiter, login_email_limiter, register_ip_limiter,
+    forgot_password_ip_limiter, forgot_password_email_limiter
+]
+
+def client_ip(request: Request) -> str:
+    if TRUSTED_PROXY_COUNT > 0:
+        hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+        if hops:
+            return hops[-min(TRUSTED_PROXY_COUNT, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+def enforce_rate_limits(*checks):
+    """Raise 429 if any (limiter, key) pair is over its limit, else record the attempt.
+    Rejected attempts are not recorded, so hammering doesn't extend the lockout."""
+    for limiter, key in checks:
+        wait = limiter.retry_after(key)
+        if wait:
+            limiter.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Too many attempts, please try again later",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+    for limiter, key in checks:
+        limiter.record(key)
+
+def as_utc(value: datetime) -> datetime:
+    """Mongo returns naive UTC datetimes; make them timezone aware"""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+def parse_datetime(value) -> Optional[datetime]:
+    """UTC-aware datetime from a BSON date or a legacy ISO string; None if it
+    is neither. Reads that do date arithmetic go through this, since values
+    the timestamp migration couldn't parse are left as strings."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return as_utc(value) if isinstance(value, datetime) else None
+
+# Revoked tokens kept in memory so every auth check is an O(1) lookup.
+# Entries live in db.revoked_tokens and are synced incrementally from there:
+#   {"kind": "jti", "jti": ..., "expires_at": ...}  - a single token
+#   {"kind": "user", "user_id": ..., "token_version": n, "expires_at": ...}
+#       - every token of that user with ver < n
+class RevocationList:
+    SYNC_OVERLAP = timedelta(seconds=5)  # re-read recent entries to cover in-flight writes
+    
+    def __init__(self):
+        self.revoked_jtis: Dict[str, datetime] = {}  # jti: token expiry
+        self.min_token_versions: Dict[str, tuple] = {}  # user_id: (min valid version, expiry)
+        self.last_sync: Optional[datetime] = None
+        self.syncs = 0
+        self.rejected = 0
+    
+    def is_revoked(self, payload: dict) -> bool:
+        revoked = payload.get("jti") in self.revoked_jtis
+        if not revoked:
+            user_entry = self.min_token_versions.get(payload.get("sub"))
+            revoked = user_entry is not None and payload.get("ver", 0) < user_entry[0]
+        if revoked:
+            self.rejected += 1
+        return revoked
+    
+    def apply(self, entry: dict):
+        expires_at = as_utc(entry["expires_at"])
+        if entry.get("kind") == "jti":
+            self.revoked_jtis[entry["jti"]] = expires_at
+        elif entry.get("kind") == "user":
+            current = self.min_token_versions.get(entry["user_id"])
+            if current is None or entry["token_version"] >= current[0]:
+                self.min_token_versions[entry["user_id"]] = (entry["token_version"], expires_at)
+    
+    async def revoke_token(self, payload: dict):
+        """Revoke one token (by jti) until it would have expired anyway"""
+        if not payload.get("jti"):
+            return
+        entry = {
+            "kind": "jti",
+            "jti": payload["jti"],
+            "user_id": payload.get("sub"),
+            "expires_at": datetime.fromtimestamp(payload["exp"], tz=timezone.utc),
+            "revoked_at": datetime.now(timezone.utc)
+        }
+        self.apply(entry)
+        await db.revoked_tokens.insert_one(entry)
+    
+    async def revoke_user_tokens(self, user_id: str, token_version: int):
+        """Revoke every token of a user issued with a version below token_version"""
+        now = datetime.now(timezone.utc)
+        entry = {
+            "kind": "user",
+            "user_id": user_id,
+            "token_version": token_version,
+            # Refresh tokens are the longest-lived, so nothing older can still be valid after this
+            "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+            "revoked_at": now
+        }
+        self.apply(entry)
+        await db.revoked_tokens.update_one(
+            {"kind": "user", "user_id": user_id},
+            {"$set": entry},
+            upsert=True
+        )
+    
+    async def sync(self):
+        """Pull entries revoked since the last sync (by any worker) and prune expired ones"""
+        try:
+            now = datetime.now(timezone.utc)
+            query = {"expires_at": {"$gt": now}}
+            if self.last_sync is not None:
+                query["revoked_at"] = {"$gte": self.last_sync - self.SYNC_OVERLAP}
+            async for entry in db.revoked_tokens.find(query, {"_id": 0}):
+                self.apply(entry)
+            self.last_sync = now
+            self.syncs += 1
+            
+            self.revoked_jtis = {jti: exp for jti, exp in self.revoked_jtis.items() if exp > now}
+            self.min_token_versions = {uid: v for uid, v in self.min_token_versions.items() if v[1] > now}
+        except Exception as e:
+            logger.error(f"❌ Token revocation sync error: {e}")
+    
+    def stats(self) -> dict:
+        return {
+            "revoked_tokens": len(self.revoked_jtis),
+            "revoked_users": len(self.min_token_versions),
+            "syncs": self.syncs,
+            "last_sync": self.last_sync.isoformat() if self.last_sync else None,
+            "rejected": self.rejected
+        }
+
+revocation_list = RevocationList()
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.setdefault("exp", expire)
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_tokens(user: dict) -> dict:
+    """Issue a short-lived access token carrying authorization claims plus a refresh token"""
+    token_version = user.get("token_version", 0)
+    access_token = create_access_token({
+        "sub": user["id"],
+        "type": "access",
+        "role": user.get("role", "user"),
+        "username": user.get("username"),
+        "ver": token_version,
+        "jti": uuid.uuid4().hex
+    })
+    refresh_token = create_access_token({
+        "sub": user["id"],
+        "type": "refresh",
+        "ver": token_version,
+        "jti": uuid.uuid4().hex,
+        "exp": datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    })
+    return {"token": access_token, "refresh_token": refresh_token}
+
+def decode_auth_token(token: str) -> dict:
+    """Decode a bearer token, rejecting refresh and password reset tokens"""
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    # Tokens issued before claims were added have no type
+    if payload.get("type", "access") != "access":
+        raise jwt.InvalidTokenError("Not an access token")
+    if revocation_list.is_revoked(payload):
+        raise jwt.InvalidTokenError("Token revoked")
+    return payload
+
+# In-process cache of user documents for the auth dependencies
+class UserCache:
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # user_id: (expires_at, user)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self.entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[user_id]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(user_id)
+        self.hits += 1
+        # Handlers mutate current_user (e.g. pop password), so hand out copies
+        return dict(entry[1])
+    
+    def set(self, user_id: str, user: dict):
+        self.entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate(self, user_id: str):
+        self.entries.pop(user_id, None)
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+user_cache = UserCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+async def load_user(user_id: str) -> Optional[dict]:
+    """Load a user document through the in-process user cache"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
+
+# Block relations live in db.user_blocks ({blocker_id, blocked_id, created_at}),
+# one row per direction. Each user's relations are cached as two sets so
+# filtering listings and chats is a set lookup; block/unblock invalidates both
+# users here and the TTL bounds staleness on other workers.
+class BlockCache:
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()  # user_id: (expires_at, blocking, blocked_by)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    async def _load(self, user_id: str) -> tuple:
+        entry = self.entries.get(user_id)
+        if entry is not None and entry[0] >= time.monotonic():
+            self.entries.move_to_end(user_id)
+            self.hits += 1
+            return entry
+        
+        self.misses += 1
+        blocking, blocked_by = set(), set()
+        async for row in db.user_blocks.find(
+            {"$or": [{"blocker_id": user_id}, {"blocked_id": user_id}]},
+            {"_id": 0, "blocker_id": 1, "blocked_id": 1}
+        ):
+            if row["blocker_id"] == user_id:
+                blocking.add(row["blocked_id"])
+            else:
+                blocked_by.add(row["blocker_id"])
+        entry = (time.monotonic() + self.ttl_seconds, frozenset(blocking), frozenset(blocked_by))
+        self.entries[user_id] = entry
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+    
+    async def blocking(self, user_id: str) -> frozenset:
+        """Users this user has blocked"""
+        return (await self._load(user_id))[1]
+    
+    async def blocked_by(self, user_id: str) -> frozenset:
+        """Users who have blocked this user"""
+        return (await self._load(user_id))[2]
+    
+    async def hidden_ids(self, user_id: str) -> frozenset:
+        """Users blocked either way, whose content this user shouldn't see"""
+        _, blocking, blocked_by = await self._load(user_id)
+        return blocking | blocked_by if blocked_by else blocking
+    
+    def invalidate(self, *user_ids: str):
+        for user_id in user_ids:
+            self.entries.pop(user_id, None)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+block_cache = BlockCache(BLOCK_CACHE_MAX_SIZE, BLOCK_CACHE_TTL_SECONDS)
+
+# Shared async HTTP client for external APIs: pooled keep-alive connections,
+# per-host concurrency limits, timeouts and retries with jittered backoff
+class OutboundHTTPClient:
+    RETRY_STATUSES = {429, 502, 503, 504}
+    RETRY_METHODS = {"GET", "HEAD"}
+    
+    def __init__(
+        self,
+        timeout: float,
+        max_connections: int,
+        max_connections_per_host: int,
+        retries: int,
+        backoff: float,
+        max_retry_after: float
+    ):
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.client: Optional[httpx.AsyncClient] = None
+        self.host_limits: Dict[str, asyncio.Semaphore] = {}
+        self.host_stats: Dict[str, dict] = {}
+    
+    def get_client(self) -> httpx.AsyncClient:
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 5.0)),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self.client
+    
+    @staticmethod
+    def retry_after(response: httpx.Response) -> Optional[float]:
+        """Seconds the server asked us to wait (delta-seconds or HTTP-date), if it said"""
+        value = response.headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (as_utc(parsedate_to_datetime(value)) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+    
+    async def request(self, method: str, url: str, timeout: Optional[float] = None, retries: Optional[int] = None, **kwargs) -> httpx.Response:
+        host = httpx.URL(url).host
+        limit = self.host_limits.setdefault(host, asyncio.Semaphore(self.max_connections_per_host))
+        stats = self.host_stats.setdefault(host, {"requests": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        
+        attempts = 1
+        if method.upper() in self.RETRY_METHODS:
+            attempts += self.retries if retries is None else retries
+        
+        response = None
+        error = None
+        for attempt in range(attempts):
+            started = time.perf_counter()
+            try:
+                async with limit:
+                    response = await self.get_client().request(method, url, **kwargs)
+                error = None
+            except httpx.TransportError as e:
+                response, error = None, e
+            finally:
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                stats["requests"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            
+            if error is None and response.status_code not in self.RETRY_STATUSES:
+                return response
+            if attempt < attempts - 1:
+                delay = self.retry_after(response) if error is None else None
+                if delay is None:
+                    # Full jitter so retries from several requests don't line up
+                    delay = random.uniform(0, self.backoff * 2 ** attempt)
+                elif delay > self.max_retry_after:
+                    break  # rate limited for longer than we're willing to wait
+                stats["retries"] += 1
+                await asyncio.sleep(delay)
+        
+        stats["errors"] += 1
+        if error is not None:
+            raise error
+        return response
+    
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+    
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+    
+    def stats(self) -> dict:
+        return {
+            host: {
+                "requests": s["requests"],
+                "errors": s["errors"],
+                "retries": s["retries"],
+                "avg_ms": round(s["total_ms"] / s["requests"], 2) if s["requests"] else 0.0,
+                "max_ms": round(s["max_ms"], 2)
+            }
+            for host, s in self.host_stats.items()
+        }
+
+http_client = OutboundHTTPClient(
+    HTTP_CLIENT_TIMEOUT_SECONDS,
+    HTTP_CLIENT_MAX_CONNECTIONS,
+    HTTP_CLIENT_MAX_CONNECTIONS_PER_HOST,
+    HTTP_CLIENT_RETRIES,
+    HTTP_CLIENT_BACKOFF_SECONDS,
+    HTTP_CLIENT_MAX_RETRY_AFTER_SECONDS
+)
+
+# Write-behind presence tracker: activity is recorded in memory and flushed
+# to db.users with a single bulk_write instead of one update per request
+class PresenceTracker:
+    def __init__(self):
+        self.last_seen: Dict[str, datetime] = {}  # user_id: last activity
+        self.pending: Dict[str, datetime] = {}  # user_id: activity not yet written
+        self.flushes = 0
+        self.flushed_updates = 0
+        self.failed_flushes = 0
+    
+    def touch(self, user_id: str) -> datetime:
+        now = datetime.now(timezone.utc)
+        self.last_seen[user_id] = now
+        self.pending[user_id] = now
+        return now
+    
+    def get_last_seen(self, user_id: str) -> Optional[datetime]:
+        return self.last_seen.get(user_id)
+    
+    def forget(self, user_id: str):
+        self.last_seen.pop(user_id, None)
+        self.pending.pop(user_id, None)
+    
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        operations = [
+            UpdateOne({"id": user_id}, {"$set": {"last_seen": seen_at, "is_online": True}})
+            for user_id, seen_at in batch.items()
+        ]
+        try:
+            await db.users.bulk_write(operations, ordered=False)
+            self.flushes += 1
+            self.flushed_updates += len(operations)
+        except Exception as e:
+            # Put the batch back unless newer activity was recorded meanwhile
+            for user_id, seen_at in batch.items():
+                if user_id not in self.pending:
+                    self.pending[user_id] = seen_at
+            self.failed_flushes += 1
+            logger.error(f"❌ Presence flush error: {e}")
+        
+        # Drop users that went offline so the map stays bounded
+        cutoff = datetime.now(timezone.utc) - ONLINE_WINDOW
+        for user_id in [uid for uid, seen_at in self.last_seen.items() if seen_at < cutoff]:
+            if user_id not in self.pending:
+                del self.last_seen[user_id]
+    
+    def stats(self) -> dict:
+        return {
+            "tracked_users": len(self.last_seen),
+            "pending_updates": len(self.pending),
+            "flushes": self.flushes,
+            "flushed_updates": self.flushed_updates,
+            "failed_flushes": self.failed_flushes
+        }
+
+presence_tracker = PresenceTracker()
+
+# Write-behind listing view counter. A view counts once per viewer per listing
+# within VIEW_DEDUP_WINDOW_SECONDS; counts accumulate in memory and are flushed
+# as one bulk $inc on listings.view_count and one on the owners'
+# users.listing_views (the per-user total behind the popular_seller badge).
+# Deduplication is per worker.
+class ListingViewCounter:
+    def __init__(self):
+        self.recent: OrderedDict = OrderedDict()  # (listing_id, viewer): first view (monotonic)
+        self.pending_listings: Dict[str, int] = {}  # listing_id: views not yet written
+        self.pending_users: Dict[str, int] = {}  # owner user_id: views not yet written
+        self.recorded = 0
+        self.duplicates = 0
+        self.flushes = 0
+        self.flushed_updates = 0
+        self.failed_flushes = 0
+    
+    def record(self, listing_id: str, owner_id: str, viewer: str) -> bool:
+        """Count a view unless this viewer already viewed the listing recently"""
+        now = time.monotonic()
+        key = (listing_id, viewer)
+        first_seen = self.recent.get(key)
+        if first_seen is not None and now - first_seen < VIEW_DEDUP_WINDOW_SECONDS:
+            self.duplicates += 1
+            return False
+        self.recent[key] = now
+        self.recent.move_to_end(key)
+        while len(self.recent) > VIEW_DEDUP_MAX_ENTRIES:
+            self.recent.popitem(last=False)
+        
+        self.pending_listings[listing_id] = self.pending_listings.get(listing_id, 0) + 1
+        self.pending_users[owner_id] = self.pending_users.get(owner_id, 0) + 1
+        self.recorded += 1
+        return True
+    
+    def pending_views(self, listing_id: str) -> int:
+        return self.pending_listings.get(listing_id, 0)
+    
+    async def total_views(self, user_id: str) -> int:
+        """Views across all of a user's listings, including ones not yet flushed"""
+        user = await db.users.find_one({"id": user_id}, {"_id": 0, "listing_views": 1})
+        stored = user.get("listing_views", 0) if user else 0
+        return stored + self.pending_users.get(user_id, 0)
+    
+    async def _flush_counts(self, collection, field: str, batch: Dict[str, int], pending: Dict[str, int]) -> bool:
+        operations = [UpdateOne({"id": doc_id}, {"$inc": {field: count}}) for doc_id, count in batch.items()]
+        try:
+            await collection.bulk_write(operations, ordered=False)
+            self.flushed_updates += len(operations)
+            return True
+        except Exception as e:
+            # Merge the batch back into whatever was recorded meanwhile
+            for doc_id, count in batch.items():
+                pending[doc_id] = pending.get(doc_id, 0) + count
+            self.failed_flushes += 1
+            logger.error(f"❌ View counter flush error ({field}): {e}")
+            return False
+    
+    async def flush(self):
+        # Forget viewers whose dedup window has passed; oldest entries come first
+        cutoff = time.monotonic() - VIEW_DEDUP_WINDOW_SECONDS
+        while self.recent:
+            key, first_seen = next(iter(self.recent.items()))
+            if first_seen >= cutoff:
+                break
+            del self.recent[key]
+        
+        if not self.pending_listings and not self.pending_users:
+            return
+        listings, self.pending_listings = self.pending_listings, {}
+        users, self.pending_users = self.pending_users, {}
+        
+        if listings:
+            await self._flush_counts(db.listings, "view_count", listings, self.pending_listings)
+        if users and await self._flush_counts(db.users, "listing_views", users, self.pending_users):
+            # Cached user docs still hold the old listing_views
+            for user_id in users:
+                user_cache.invalidate(user_id)
+            # Award popular_seller to owners this flush pushed over the threshold
+            crossed = await db.users.find(
+                {"id": {"$in": list(users)}, "listing_views": {"$gte": POPULAR_SELLER_VIEWS}, "achievements": {"$ne": "popular_seller"}},
+                {"_id": 0, "id": 1}
+            ).to_list(None)
+            for user in crossed:
+                await check_and_award_achievements(user["id"])
+        self.flushes += 1
+    
+    def stats(self) -> dict:
+        return {
+            "tracked_viewers": len(self.recent),
+            "pending_listings": len(self.pending_listings),
+            "pending_views": sum(self.pending_listings.values()),
+            "recorded_views": self.recorded,
+            "duplicate_views": self.duplicates,
+            "flushes": self.flushes,
+            "flushed_updates": self.flushed_updates,
+            "failed_flushes": self.failed_flushes
+        }
+
+listing_view_counter = ListingViewCounter()
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_auth_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await load_user(user_id)
         if user is None:
             raise HTTPException(status_code=401, detail="User not found")
         
-        # Update last_seen and is_online
-        await db.users.update_one(
-            {"id": user_id},
-            {
-                "$set": {
-                    "last_seen": datetime.now(timezone.utc),
-                    "is_online": True
-                }
-            }
-        )
-        user["last_seen"] = datetime.now(timezone.utc)
+        # Record activity; presence_tracker flushes last_seen/is_online in bulk
+        user["last_seen"] = presence_tracker.touch(user_id)
         user["is_online"] = True
         
         return user
@@ -117,25 +1284,16 @@ async def get_current_user_optional(credentials: Optional[HTTPAuthorizationCrede
         return None
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_auth_token(token)
         user_id: str = payload.get("sub")
         if user_id is None:
             return None
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = await load_user(user_id)
         if user is None:
             return None
         
-        # Update last_seen and is_online
-        await db.users.update_one(
-            {"id": user_id},
-            {
-                "$set": {
-                    "last_seen": datetime.now(timezone.utc),
-                    "is_online": True
-                }
-            }
-        )
-        user["last_seen"] = datetime.now(timezone.utc)
+        # Record activity; presence_tracker flushes last_seen/is_online in bulk
+        user["last_seen"] = presence_tracker.touch(user_id)
         user["is_online"] = True
         
         return user
@@ -148,37 +1306,231 @@ async def get_admin_user(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
-# Email sending function
-def send_email(to_email: str, subject: str, html_content: str):
-    """Send email using Gmail SMTP"""
-    if not GMAIL_USER or not GMAIL_APP_PASSWORD:
-        logger.warning(f"Email credentials not configured. Would send to: {to_email}")
-        logger.info(f"Email subject: {subject}")
-        logger.info(f"Email content: {html_content}")
-        return False
-    
+# Claims-only auth for read-only endpoints that just need id/role
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Authorize from the signed access token claims without loading the user document"""
     try:
-        # Create message
-        message = MIMEMultipart("alternative")
-        message["Subject"] = subject
-        message["From"] = f"KAIS App <{GMAIL_USER}>"
-        message["To"] = to_email
-        
-        # Add HTML content
-        html_part = MIMEText(html_content, "html")
-        message.attach(html_part)
-        
-        # Send email
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(GMAIL_USER, GMAIL_APP_PASSWORD)
-            server.send_message(message)
-        
-        logger.info(f"Email sent successfully to {to_email}")
+        payload = decode_auth_token(credentials.credentials)
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    
+    user_id = payload.get("sub")
+    if user_id is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    
+    if "role" not in payload:
+        # Legacy token without claims - fall back to the user document
+        user = await load_user(user_id)
+        if user is None:
+            raise HTTPException(status_code=401, detail="User not found")
+        payload = {**payload, "role": user.get("role", "user"), "username": user.get("username")}
+    
+    presence_tracker.touch(user_id)
+    return {
+        "id": user_id,
+        "username": payload.get("username"),
+        "role": payload.get("role", "user"),
+        "token_version": payload.get("ver", 0)
+    }
+
+async def get_admin_claims(claims: dict = Depends(get_token_claims)) -> dict:
+    if claims["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return claims
+
+# Email sending function
+def build_email_message(to_email: str, subject: str, html_content: str) -> MIMEMultipart:
+    message = MIMEMultipart("alternative")
+    message["Subject"] = subject
+    message["From"] = f"KAIS App <{EMAIL_FROM_ADDRESS}>"
+    message["To"] = to_email
+    message.attach(MIMEText(html_content, "html"))
+    return message
+
+# One authenticated SMTP session, reused across sends. Only ever touched from
+# the outbox's single sender thread.
+class SMTPSession:
+    def __init__(self):
+        self.connection: Optional[smtplib.SMTP] = None
+        self.last_used = 0.0
+        self.connects = 0
+    
+    def _connect(self):
+        self.close()
+        connection = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=SMTP_TIMEOUT_SECONDS)
+        if SMTP_STARTTLS:
+            connection.starttls()
+        if GMAIL_USER and GMAIL_APP_PASSWORD:
+            connection.login(GMAIL_USER, GMAIL_APP_PASSWORD)
+        self.connection = connection
+        self.connects += 1
+    
+    def send(self, message: MIMEMultipart):
+        # Servers drop idle sessions; reconnect rather than fail the first send
+        if self.connection is None or time.monotonic() - self.last_used > SMTP_IDLE_SECONDS:
+            self._connect()
+        try:
+            self.connection.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self._connect()
+            self.connection.send_message(message)
+        self.last_used = time.monotonic()
+    
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except Exception:
+                pass
+            self.connection = None
+
+# Emails are written to db.email_outbox and delivered by a background task so
+# request latency doesn't depend on the SMTP server. Each row records its
+# delivery status: pending -> sending -> sent | failed (after max attempts).
+# The body (which may hold reset links) is dropped once a row is finished, and
+# sent rows are deleted EMAIL_OUTBOX_RETENTION_DAYS after sending.
+class EmailOutbox:
+    def __init__(self):
+        self.smtp = SMTPSession()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.batches = 0
+    
+    async def enqueue(self, to_email: str, subject: str, html_content: str) -> bool:
+        """Queue an email for delivery; returns False if email isn't configured"""
+        if not EMAIL_CONFIGURED:
+            logger.warning(f"Email credentials not configured. Would send to: {to_email}")
+            logger.info(f"Email subject: {subject}")
+            logger.info(f"Email content: {html_content}")
+            return False
+        
+        now = datetime.now(timezone.utc)
+        await db.email_outbox.insert_one({
+            "id": str(uuid.uuid4()),
+            "to": to_email,
+            "subject": subject,
+            "html": html_content,
+            "status": "pending",
+            "attempts": 0,
+            "last_error": None,
+            "created_at": now,
+            "next_attempt_at": now,
+            "sent_at": None
+        })
+        if self.wakeup is not None:
+            self.wakeup.set()
         return True
-    except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {str(e)}")
-        return False
+    
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "claimed_at": {"$lt": now - EMAIL_OUTBOX_CLAIM_TIMEOUT}}
+            ]},
+            {"$set": {"status": "sending", "claimed_at": now}, "$inc": {"attempts": 1}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def _send_batch(self, emails: List[dict]) -> List[Optional[str]]:
+        """Runs on the sender thread; returns an error string (or None) per email"""
+        errors = []
+        for email in emails:
+            try:
+                self.smtp.send(build_email_message(email["to"], email["subject"], email["html"]))
+                errors.append(None)
+            except Exception as e:
+                # Drop the session so the next email starts from a clean connection
+                self.smtp.close()
+                errors.append(str(e) or e.__class__.__name__)
+        return errors
+    
+    async def process_batch(self) -> int:
+        emails = []
+        while len(emails) < EMAIL_OUTBOX_BATCH_SIZE:
+            email = await self._claim()
+            if email is None:
+                break
+            emails.append(email)
+        if not emails:
+            return 0
+        
+        errors = await asyncio.get_running_loop().run_in_executor(self.executor, self._send_batch, emails)
+        
+        now = datetime.now(timezone.utc)
+        updates = []
+        for email, error in zip(emails, errors):
+            if error is None:
+                self.sent += 1
+                update = {"status": "sent", "sent_at": now, "last_error": None}
+                logger.info(f"Email sent successfully to {email['to']}")
+            elif email["attempts"] >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+                self.failed += 1
+                update = {"status": "failed", "last_error": error}
+                logger.error(f"Failed to send email to {email['to']} after {email['attempts']} attempts: {error}")
+            else:
+                self.retried += 1
+                backoff = EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** (email["attempts"] - 1)
+                update = {"status": "pending", "last_error": error, "next_attempt_at": now + timedelta(seconds=backoff)}
+                logger.warning(f"Email to {email['to']} failed (attempt {email['attempts']}), retrying in {backoff}s: {error}")
+            if update["status"] == "pending":
+                updates.append(UpdateOne({"id": email["id"]}, {"$set": update}))
+            else:
+                updates.append(UpdateOne({"id": email["id"]}, {"$set": update, "$unset": {"html": ""}}))
+        await db.email_outbox.bulk_write(updates, ordered=False)
+        self.batches += 1
+        return len(emails)
+    
+    async def run(self):
+        while True:
+            self.wakeup.clear()
+            try:
+                processed = await self.process_batch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Email outbox error: {e}")
+                processed = 0
+            if processed >= EMAIL_OUTBOX_BATCH_SIZE:
+                continue  # more may be waiting
+            try:
+                # Woken early by enqueue(); the timeout picks up retries that came due
+                await asyncio.wait_for(self.wakeup.wait(), EMAIL_OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+    
+    async def start(self):
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.get_running_loop().run_in_executor(self.executor, self.smtp.close)
+        self.executor.shutdown(wait=False)
+    
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batches": self.batches,
+            "smtp_connects": self.smtp.connects
+        }
+
+email_outbox = EmailOutbox()
 
 # Models
 class UserRegister(BaseModel):
@@ -215,7 +1567,7 @@ class User(BaseModel):
     current_location: Optional[dict] = None  # {"latitude": float, "longitude": float}
     has_seen_tutorial: bool = False  # Rehberi gördü mü?
     profile_photo: Optional[str] = None  # Profile photo URL
-    blocked_users: List[str] = []  # Engellenen kullanıcı ID'leri
+    profile_photo_variants: Optional[dict] = None  # width/height plus thumb/medium WebP {url, width, height}
     achievements: List[str] = []  # Kazanılan başarı rozetleri
 
 class ListingCreate(BaseModel):
@@ -243,11 +1595,17 @@ class Listing(BaseModel):
     description: str
     status: str = "active"  # "active", "expired", "archived"
     photos: List[str] = []  # List of photo filenames
+    photo_variants: List[dict] = []  # Per photo: filename, width/height, thumb/medium WebP variants
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     expires_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc) + timedelta(hours=12))
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     distance: Optional[float] = None  # For nearby listings
+    score: Optional[float] = None  # For search results
+    implied_rate: Optional[float] = None  # to_amount per unit of from_amount
+    market_rate: Optional[float] = None
+    rate_deviation: Optional[float] = None  # % above (+) or below (-) market
+    view_count: int = 0
 
 class ExchangeConfirmation(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -492,9 +1850,44 @@ class GiveawayParticipationCreate(BaseModel):
     invited_member1: str
     invited_member2: str
 
+# Fast path for large list responses. Documents read from our own DB are
+# already in shape, so instead of validating every row against response_model
+# (then jsonable_encoder, then stdlib json) each row is projected onto the
+# model's fields and encoded with orjson. Output matches the response_model
+# path: same fields, defaults filled in, extra keys dropped, UTC as "Z".
+class TrustedListSerializer:
+    def __init__(self, model: type):
+        self.fields = list(model.model_fields)
+        self.defaults = {}
+        self.factories = {}
+        for name, field in model.model_fields.items():
+            if field.default_factory is not None:
+                self.factories[name] = field.default_factory
+            elif not field.is_required():
+                self.defaults[name] = field.default
+    
+    def fill(self, name: str):
+        factory = self.factories.get(name)
+        return factory() if factory else self.defaults.get(name)
+    
+    def dumps(self, docs: List[dict]) -> bytes:
+        fields, fill = self.fields, self.fill
+        rows = [{name: doc[name] if name in doc else fill(name) for name in fields} for doc in docs]
+        return orjson.dumps(rows, option=orjson.OPT_UTC_Z)
+
+list_serializers: Dict[type, TrustedListSerializer] = {}
+
+def trusted_list_response(model: type, docs: List[dict], headers: Optional[Dict[str, str]] = None) -> Response:
+    serializer = list_serializers.get(model)
+    if serializer is None:
+        serializer = list_serializers[model] = TrustedListSerializer(model)
+    return Response(content=serializer.dumps(docs), media_type="application/json", headers=headers)
+
 # Auth Routes
 @api_router.post("/auth/register")
-async def register(user_data: UserRegister):
+async def register(user_data: UserRegister, request: Request):
+    enforce_rate_limits((register_ip_limiter, client_ip(request)))
+    
     # Check if email exists
     existing_user = await db.users.find_one({"email": user_data.email})
     if existing_user:
@@ -518,38 +1911,16 @@ async def register(user_data: UserRegister):
     if username_lower == "admin":
         raise HTTPException(status_code=400, detail="This username is reserved and cannot be used")
     
-    # 5. Check if username already exists (case insensitive)
-    existing_username = await db.users.find_one({
-        "$or": [
-            {"username": username},
-            {"username": {"$regex": f"^{username}$", "$options": "i"}}
-        ]
-    })
-    if existing_username:
+    # 5. Check if username already exists (case insensitive, via username_lower)
+    if await username_taken(username_lower):
         raise HTTPException(status_code=400, detail="Username already taken")
     
     # Validate password confirmation if provided
     if user_data.confirmPassword and user_data.password != user_data.confirmPassword:
         raise HTTPException(status_code=400, detail="Passwords do not match")
     
-    # Üye numarası oluştur - 1000'den başlat
-    # En son üye numarasını bul
-    last_user = await db.users.find_one(
-        {"member_number": {"$exists": True, "$ne": None}},
-        sort=[("member_number", -1)]
-    )
-    
-    if last_user and last_user.get("member_number"):
-        # Son numarayı parse et (#K01000 -> 1000)
-        try:
-            last_num = int(last_user["member_number"].replace("#K", ""))
-            new_num = last_num + 1
-        except:
-            new_num = 1000
-    else:
-        new_num = 1000
-    
-    member_number = f"#K{new_num:05d}"  # #K01000 formatında
+    # Üye numarası oluştur - 1000'den başlat, #K01000 formatında
+    member_number = await allocate_member_number()
     
     # Create user with validated lowercase username
     user = User(
@@ -565,32 +1936,37 @@ async def register(user_data: UserRegister):
     )
     
     user_dict = user.model_dump()
-    user_dict['password'] = hash_password(user_data.password)
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
-    if user_dict.get('agreements_date'):
-        user_dict['agreements_date'] = user_dict['agreements_date'].isoformat()
+    user_dict['username_lower'] = username_lower
+    user_dict['password'] = await password_hasher.hash(user_data.password)
     
-    await db.users.insert_one(user_dict)
+    try:
+        await db.users.insert_one(user_dict)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent signup for the same username
+        raise HTTPException(status_code=400, detail="Username already taken")
     
-    # Create token
-    token = create_access_token({"sub": user.id})
+    # Create tokens
+    tokens = create_user_tokens(user_dict)
     
-    return {"token": token, "user": user}
+    return {**tokens, "user": user}
 
 @api_router.post("/auth/login")
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, request: Request):
+    enforce_rate_limits(
+        (login_ip_limiter, client_ip(request)),
+        (login_email_limiter, credentials.email.lower())
+    )
+    
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user or not await password_hasher.verify(credentials.password, user['password']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    token = create_access_token({"sub": user['id']})
+    tokens = create_user_tokens(user)
     
     # Remove password from response
     user.pop('password', None)
-    if isinstance(user.get('created_at'), str):
-        user['created_at'] = datetime.fromisoformat(user['created_at'])
     
-    return {"token": token, "user": user}
+    return {**tokens, "user": user}
 
 @api_router.get("/auth/me")
 async def get_me(current_user: dict = Depends(get_current_user)):
@@ -604,6 +1980,7 @@ async def mark_tutorial_seen(current_user: dict = Depends(get_current_user)):
         {"id": current_user['id']},
         {"$set": {"has_seen_tutorial": True}}
     )
+    user_cache.invalidate(current_user['id'])
     return {"message": "Tutorial marked as seen"}
 
 @api_router.get("/user/{user_id}")
@@ -638,6 +2015,7 @@ async def update_location_sharing(
         {"id": current_user['id']},
         {"$set": update_data}
     )
+    user_cache.invalidate(current_user['id'])
     
     return {
         "message": "Konum paylaşımı güncellendi",
@@ -690,7 +2068,12 @@ class PasswordReset(BaseModel):
     new_password: str
 
 @api_router.post("/auth/forgot-password")
-async def forgot_password(request: PasswordResetRequest):
+async def forgot_password(request: PasswordResetRequest, http_request: Request):
+    enforce_rate_limits(
+        (forgot_password_ip_limiter, client_ip(http_request)),
+        (forgot_password_email_limiter, request.email.lower())
+    )
+    
     user = await db.users.find_one({"email": request.email})
     if not user:
         # Don't send email if user doesn't exist
@@ -708,7 +2091,7 @@ async def forgot_password(request: PasswordResetRequest):
     await db.password_resets.insert_one({
         "user_id": user['id'],
         "token": reset_token,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": datetime.now(timezone.utc),
         "used": False
     })
     
@@ -924,8 +2307,8 @@ async def forgot_password(request: PasswordResetRequest):
     </html>
     """
     
-    # Send email
-    email_sent = send_email(
+    # Queue email; the outbox delivers it in the background
+    await email_outbox.enqueue(
         to_email=request.email,
         subject="🔐 KAIS - Şifre Sıfırlama Talebi",
         html_content=html_content
@@ -937,7 +2320,7 @@ async def forgot_password(request: PasswordResetRequest):
     response = {"message": "Şifre sıfırlama linki email adresinize gönderildi."}
     
     # In development mode (when email not configured), include the link
-    if not GMAIL_USER or not GMAIL_APP_PASSWORD:
+    if not EMAIL_CONFIGURED:
         response["reset_link"] = reset_link
         response["dev_mode"] = True
     
@@ -964,11 +2347,18 @@ async def reset_password(reset_data: PasswordReset):
             raise HTTPException(status_code=400, detail="Token invalid or already used")
         
         # Update password
-        new_password_hash = hash_password(reset_data.new_password)
-        await db.users.update_one(
+        new_password_hash = await password_hasher.hash(reset_data.new_password)
+        updated_user = await db.users.find_one_and_update(
             {"id": user_id},
-            {"$set": {"password": new_password_hash}}
+            {"$set": {"password": new_password_hash}, "$inc": {"token_version": 1}},
+            projection={"_id": 0, "token_version": 1},
+            return_document=ReturnDocument.AFTER
         )
+        user_cache.invalidate(user_id)
+        
+        # Sign out every existing session issued before the reset
+        if updated_user:
+            await revocation_list.revoke_user_tokens(user_id, updated_user["token_version"])
         
         # Mark token as used
         await db.password_resets.update_one(
@@ -990,11 +2380,7 @@ async def process_google_session(session_request: SessionRequest):
     try:
         # Call Emergent Auth API to get user data
         headers = {"X-Session-ID": session_request.session_id}
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers=headers,
-            timeout=10
-        )
+        response = await http_client.get(EMERGENT_AUTH_SESSION_URL, headers=headers, timeout=10)
         
         if response.status_code != 200:
             raise HTTPException(status_code=400, detail="Invalid session_id")
@@ -1013,9 +2399,13 @@ async def process_google_session(session_request: SessionRequest):
             username = existing_user["username"]
         else:
             # Create new user
+            # Google display names aren't unique; add a short suffix if taken
+            base_name = name
+            while await username_taken(name):
+                name = f"{base_name}{uuid.uuid4().hex[:4]}"
+            
             # Generate member number
-            user_count = await db.users.count_documents({})
-            member_number = f"#K{str(user_count + 1).zfill(5)}"
+            member_number = await allocate_member_number()
             
             new_user = User(
                 username=name,
@@ -1030,9 +2420,7 @@ async def process_google_session(session_request: SessionRequest):
             )
             
             user_dict = new_user.model_dump()
-            user_dict['created_at'] = user_dict['created_at'].isoformat()
-            if user_dict.get('agreements_date'):
-                user_dict['agreements_date'] = user_dict['agreements_date'].isoformat()
+            user_dict['username_lower'] = normalize_username(name)
             
             # No password for OAuth users
             await db.users.insert_one(user_dict)
@@ -1046,17 +2434,16 @@ async def process_google_session(session_request: SessionRequest):
         )
         
         session_dict = google_session.model_dump()
-        session_dict['created_at'] = session_dict['created_at'].isoformat()
-        session_dict['expires_at'] = session_dict['expires_at'].isoformat()
         
         await db.google_sessions.insert_one(session_dict)
         
-        # Also create JWT token for compatibility with existing system
-        jwt_token = create_access_token(data={"sub": user_id})
+        # Also create JWT tokens for compatibility with existing system
+        tokens = create_user_tokens(existing_user or user_dict)
         
         return {
             "session_token": session_token,
-            "jwt_token": jwt_token,
+            "jwt_token": tokens["token"],
+            "refresh_token": tokens["refresh_token"],
             "user": {
                 "id": user_id,
                 "username": username,
@@ -1065,51 +2452,840 @@ async def process_google_session(session_request: SessionRequest):
             }
         }
         
-    except requests.RequestException as e:
+    except HTTPException:
+        raise
+    except httpx.HTTPError as e:
         logger.error(f"Error calling Emergent Auth API: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to authenticate with Google")
     except Exception as e:
         logger.error(f"Error in Google OAuth: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+@api_router.post("/auth/refresh")
+async def refresh_access_token(refresh_data: TokenRefresh):
+    """Exchange a refresh token for a new access/refresh token pair"""
+    try:
+        payload = jwt.decode(refresh_data.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Refresh token expired")
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    
+    if payload.get("type") != "refresh" or not payload.get("sub"):
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    
+    # Claims are re-read from the user document, so role changes apply here
+    user = await load_user(payload["sub"])
+    if user is None or revocation_list.is_revoked(payload) or payload.get("ver", 0) != user.get("token_version", 0):
+        raise HTTPException(status_code=401, detail="Refresh token revoked")
+    
+    # Rotate: the refresh token can't be replayed once exchanged
+    await revocation_list.revoke_token(payload)
+    
+    return create_user_tokens(user)
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 @api_router.post("/auth/logout")
-async def logout(current_user: dict = Depends(get_current_user)):
-    """Logout user and delete session"""
+async def logout(
+    logout_data: Optional[LogoutRequest] = None,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: dict = Depends(get_current_user)
+):
+    """Logout user, revoke the presented tokens and delete session"""
     try:
         # Delete all sessions for this user
         await db.google_sessions.delete_many({"user_id": current_user["id"]})
+        
+        # Revoke the access token used for this call and, if given, its refresh token
+        await revocation_list.revoke_token(decode_auth_token(credentials.credentials))
+        if logout_data and logout_data.refresh_token:
+            try:
+                refresh_payload = jwt.decode(logout_data.refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
+                if refresh_payload.get("type") == "refresh" and refresh_payload.get("sub") == current_user["id"]:
+                    await revocation_list.revoke_token(refresh_payload)
+            except jwt.InvalidTokenError:
+                pass
+        
         return {"message": "Logged out successfully"}
     except Exception as e:
         logger.error(f"Error during logout: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to logout")
 
+# Listings carry a GeoJSON point next to latitude/longitude for the 2dsphere index
+def listing_location(latitude: Optional[float], longitude: Optional[float]) -> Optional[dict]:
+    """GeoJSON point for a listing, None if it has no coordinates"""
+    if latitude is None or longitude is None:
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        # The 2dsphere index rejects out-of-range points, so fail the request cleanly
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+async def backfill_listing_locations():
+    """Populate the GeoJSON location of listings created before it existed"""
+    try:
+        updated = 0
+        while True:
+            listings = await db.listings.find(
+                {
+                    "location": {"$exists": False},
+                    "latitude": {"$type": "number"},
+                    "longitude": {"$type": "number"}
+                },
+                {"_id": 0, "id": 1, "latitude": 1, "longitude": 1}
+            ).to_list(1000)
+            if not listings:
+                break
+            updates = []
+            for listing in listings:
+                try:
+                    location = listing_location(listing["latitude"], listing["longitude"])
+                except HTTPException:
+                    location = None  # out-of-range legacy coordinates; mark so we don't revisit
+                updates.append(UpdateOne({"id": listing["id"]}, {"$set": {"location": location}}))
+            await db.listings.bulk_write(updates, ordered=False)
+            updated += len(listings)
+        if updated:
+            logger.info(f"📍 Backfilled location for {updated} listings")
+    except Exception as e:
+        logger.error(f"❌ Error backfilling listing locations: {e}")
+
+# Listings are scored against the latest market rate. implied_rate is what the
+# listing asks per unit offered (to_amount / from_amount) and rate_deviation is
+# how far that is from the market rate, in percent. Negative means cheaper than
+# market for whoever takes the offer, so sort=best_rate is rate_deviation
+# ascending. Scores are set on write and refreshed when rates are fetched.
+class MarketRates:
+    """The latest db.exchange_rates document, cached per worker"""
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self.base = "USD"
+        self.rates: Dict[str, float] = {}
+        self.expires_at = 0.0
+    
+    def set(self, rate_doc: dict):
+        self.base = rate_doc.get("base_currency", "USD")
+        self.rates = rate_doc.get("rates", {})
+        self.expires_at = time.monotonic() + self.ttl_seconds
+    
+    async def load(self) -> "MarketRates":
+        if time.monotonic() >= self.expires_at:
+            rate_doc = await db.exchange_rates.find_one({}, {"_id": 0}, sort=[("last_updated", -1)])
+            self.set(rate_doc or {})
+        return self
+    
+    def rate(self, from_currency: Optional[str], to_currency: Optional[str]) -> Optional[float]:
+        """Units of to_currency per unit of from_currency, None if either is unknown"""
+        def base_rate(currency):
+            currency = (currency or "").upper()
+            return 1.0 if currency == self.base else self.rates.get(currency)
+        from_rate, to_rate = base_rate(from_currency), base_rate(to_currency)
+        if not from_rate or not to_rate:
+            return None
+        return to_rate / from_rate
+
+market_rates = MarketRates(MARKET_RATES_CACHE_SECONDS)
+
+def listing_rate_fields(listing: dict, market_rate: Optional[float]) -> dict:
+    from_amount, to_amount = listing.get("from_amount"), listing.get("to_amount")
+    implied_rate = to_amount / from_amount if from_amount and to_amount and from_amount > 0 and to_amount > 0 else None
+    rate_deviation = None
+    if implied_rate is not None and market_rate:
+        rate_deviation = round((implied_rate / market_rate - 1) * 100, 4)
+    return {"implied_rate": implied_rate, "market_rate": market_rate, "rate_deviation": rate_deviation}
+
+async def listing_rate_scores(listing: dict) -> dict:
+    """implied_rate, market_rate and rate_deviation for a listing being written"""
+    rates = await market_rates.load()
+    return listing_rate_fields(listing, rates.rate(listing.get("from_currency"), listing.get("to_currency")))
+
+async def refresh_listing_rate_scores():
+    """Re-score active listings against the current rates: one UpdateMany per
+    currency pair, computed server-side from the stored implied_rate"""
+    try:
+        rates = await market_rates.load()
+        pairs = await db.listings.aggregate([
+            {"$match": {"status": "active"}},
+            {"$group": {"_id": {"from": "$from_currency", "to": "$to_currency"}}}
+        ]).to_list(None)
+        operations = []
+        for pair in pairs:
+            query = {"status": "active", "from_currency": pair["_id"].get("from"), "to_currency": pair["_id"].get("to")}
+            market_rate = rates.rate(query["from_currency"], query["to_currency"])
+            if market_rate is None:
+                operations.append(UpdateMany(query, {"$set": {"market_rate": None, "rate_deviation": None}}))
+                continue
+            operations.append(UpdateMany(query, [{"$set": {
+                "market_rate": market_rate,
+                "rate_deviation": {"$cond": [
+                    {"$gt": ["$implied_rate", 0]},
+                    {"$round": [{"$multiply": [{"$subtract": [{"$divide": ["$implied_rate", market_rate]}, 1]}, 100]}, 4]},
+                    None
+                ]}
+            }}]))
+        if operations:
+            await db.listings.bulk_write(operations, ordered=False)
+            # Pick the new scores up in memory before the new version is served
+            await active_listing_index.rebuild()
+            await change_counters.bump("listings")
+            logger.info(f"💱 Re-scored active listings for {len(operations)} currency pairs")
+    except Exception as e:
+        logger.error(f"❌ Error refreshing listing rate scores: {e}")
+
+async def backfill_listing_rates():
+    """Score listings created before rate scoring existed"""
+    try:
+        rates = await market_rates.load()
+        updated = 0
+        while True:
+            listings = await db.listings.find(
+                {"implied_rate": {"$exists": False}},
+                {"_id": 0, "id": 1, "from_currency": 1, "from_amount": 1, "to_currency": 1, "to_amount": 1}
+            ).to_list(1000)
+            if not listings:
+                break
+            updates = [
+                UpdateOne({"id": listing["id"]}, {"$set": listing_rate_fields(
+                    listing, rates.rate(listing.get("from_currency"), listing.get("to_currency"))
+                )})
+                for listing in listings
+            ]
+            await db.listings.bulk_write(updates, ordered=False)
+            updated += len(listings)
+        if updated:
+            await change_counters.bump("listings")
+            logger.info(f"💱 Backfilled rate scores for {updated} listings")
+    except Exception as e:
+        logger.error(f"❌ Error backfilling listing rate scores: {e}")
+
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(latitude: float, longitude: float, precision: int) -> str:
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        value, value_range = (longitude, lng_range) if even else (latitude, lat_range)
+        mid = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            value_range[0] = mid
+        else:
+            value_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+# Size of a geohash cell in degrees at LISTING_INDEX_GEOHASH_PRECISION
+GEOHASH_CELL_LNG = 360 / 2 ** math.ceil(5 * LISTING_INDEX_GEOHASH_PRECISION / 2)
+GEOHASH_CELL_LAT = 180 / 2 ** math.floor(5 * LISTING_INDEX_GEOHASH_PRECISION / 2)
+
+def geohash_box(latitude: float, radius_km: float) -> tuple:
+    """Half-height and half-width in degrees of a circle's bounding box"""
+    delta_lat = radius_km / 111.32
+    cos_lat = math.cos(math.radians(latitude))
+    delta_lng = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (111.32 * cos_lat))
+    return delta_lat, delta_lng
+
+def geohash_cell_estimate(latitude: float, radius_km: float) -> int:
+    """Upper bound on len(geohash_cells_within(...)) without enumerating the cells"""
+    delta_lat, delta_lng = geohash_box(latitude, radius_km)
+    return (int(2 * delta_lat / GEOHASH_CELL_LAT) + 2) * (int(2 * delta_lng / GEOHASH_CELL_LNG) + 2)
+
+def geohash_cells_within(latitude: float, longitude: float, radius_km: float) -> set:
+    """Geohash cells covering the bounding box of a circle"""
+    delta_lat, delta_lng = geohash_box(latitude, radius_km)
+    
+    def samples(start, end, step):
+        # Samples at most one cell apart hit every cell in [start, end]
+        values = []
+        value = start
+        while value < end:
+            values.append(value)
+            value += step
+        values.append(end)
+        return values
+    
+    lats = samples(max(-90.0, latitude - delta_lat), min(90.0, latitude + delta_lat), GEOHASH_CELL_LAT)
+    lngs = samples(longitude - delta_lng, longitude + delta_lng, GEOHASH_CELL_LNG)
+    cells = set()
+    for lat in lats:
+        for lng in lngs:
+            lng = (lng + 180.0) % 360.0 - 180.0  # wrap across the antimeridian
+            cells.add(geohash_encode(lat, lng, LISTING_INDEX_GEOHASH_PRECISION))
+    return cells
+
+def listing_sort_key(listing: dict) -> tuple:
+    return (listing["created_at"] or datetime.min.replace(tzinfo=timezone.utc), listing["id"])
+
+def listing_rate_sort_key(listing: dict) -> tuple:
+    return (listing["rate_deviation"], listing["id"])
+
+def has_rate_score(listing: dict) -> bool:
+    return isinstance(listing.get("rate_deviation"), (int, float))
+
+LISTING_SORTS = ("newest", "best_rate")
+
+# Listing search matches words in city and description; a city match counts
+# for more. Same weights as the listing_text Mongo index.
+SEARCH_FIELD_WEIGHTS = {"city": 3, "description": 1}
+SEARCH_TOKEN_RE = re.compile(r"\w+")
+
+def search_tokens(text: Optional[str]) -> List[str]:
+    """Case- and diacritic-insensitive words, like a Mongo text index (İzmir, izmir -> izmir)"""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text.casefold().replace("ı", "i"))
+    return SEARCH_TOKEN_RE.findall("".join(c for c in folded if not unicodedata.combining(c)))
+
+def listing_search_weights(listing: dict) -> Dict[str, int]:
+    weights: Dict[str, int] = {}
+    for field, weight in SEARCH_FIELD_WEIGHTS.items():
+        for token in set(search_tokens(listing.get(field))):
+            weights[token] = weights.get(token, 0) + weight
+    return weights
+
+# In-process index of active listings for browse and nearby queries.
+# Writes made through this worker are applied immediately; a periodic rebuild
+# picks up writes made by other workers.
+class ActiveListingIndex:
+    def __init__(self):
+        self.listings: Dict[str, dict] = {}
+        self.by_country: Dict[str, set] = {}
+        self.by_pair: Dict[tuple, set] = {}
+        self.by_cell: Dict[str, set] = {}
+        self.by_token: Dict[str, set] = {}  # search token: listing ids
+        self.search_weights: Dict[str, Dict[str, int]] = {}  # listing_id: {token: weight}
+        self.ordered: Optional[List[dict]] = None  # newest first, rebuilt lazily
+        self.ordered_by_rate: Optional[List[dict]] = None  # best rate first, rebuilt lazily
+        self.ready = False
+        self.rebuilding = False
+        self.replay: List[tuple] = []  # writes seen during a rebuild
+        self.rebuilds = 0
+        self.last_rebuild: Optional[datetime] = None
+        self.generation = 0  # bumped on every change; part of the ETag of responses built from it
+        self.queries = 0
+    
+    @staticmethod
+    def _keys(listing: dict) -> tuple:
+        cell = None
+        lat, lng = listing.get("latitude"), listing.get("longitude")
+        if lat is not None and lng is not None and -90 <= lat <= 90 and -180 <= lng <= 180:
+            cell = geohash_encode(lat, lng, LISTING_INDEX_GEOHASH_PRECISION)
+        return listing.get("country"), (listing.get("from_currency"), listing.get("to_currency")), cell
+    
+    def _add(self, listing: dict):
+        country, pair, cell = self._keys(listing)
+        self.by_country.setdefault(country, set()).add(listing["id"])
+        self.by_pair.setdefault(pair, set()).add(listing["id"])
+        if cell:
+            self.by_cell.setdefault(cell, set()).add(listing["id"])
+        weights = listing_search_weights(listing)
+        for token in weights:
+            self.by_token.setdefault(token, set()).add(listing["id"])
+        self.search_weights[listing["id"]] = weights
+        self.listings[listing["id"]] = listing
+    
+    def _remove(self, listing_id: str):
+        listing = self.listings.pop(listing_id, None)
+        if listing is None:
+            return
+        for partition, key in zip((self.by_country, self.by_pair, self.by_cell), self._keys(listing)):
+            ids = partition.get(key)
+            if ids is not None:
+                ids.discard(listing_id)
+                if not ids:
+                    del partition[key]
+        for token in self.search_weights.pop(listing_id, {}):
+            ids = self.by_token.get(token)
+            if ids is not None:
+                ids.discard(listing_id)
+                if not ids:
+                    del self.by_token[token]
+    
+    @staticmethod
+    def _normalize(listing: dict) -> dict:
+        listing = {k: v for k, v in listing.items() if k not in ("_id", "location", "distance")}
+        listing["created_at"] = parse_datetime(listing.get("created_at"))
+        listing["expires_at"] = parse_datetime(listing.get("expires_at"))
+        return listing
+    
+    def upsert(self, listing: dict):
+        """Add or refresh a listing; listings that aren't active are dropped"""
+        if self.rebuilding:
+            self.replay.append(("upsert", listing))
+        self._remove(listing["id"])
+        if listing.get("status") == "active":
+            self._add(self._normalize(listing))
+        self.ordered = self.ordered_by_rate = None
+        self.generation += 1
+    
+    def remove(self, listing_id: str):
+        if self.rebuilding:
+            self.replay.append(("remove", listing_id))
+        self._remove(listing_id)
+        self.ordered = self.ordered_by_rate = None
+        self.generation += 1
+    
+    def remove_user(self, user_id: str):
+        for listing_id in [l["id"] for l in self.listings.values() if l.get("user_id") == user_id]:
+            self.remove(listing_id)
+    
+    async def rebuild(self):
+        """Reload every active listing from Mongo and swap it in"""
+        if self.rebuilding:
+            return
+        self.rebuilding = True
+        self.replay = []
+        try:
+            listings = await db.listings.find({"status": "active"}, {"_id": 0, "location": 0}).to_list(None)
+            fresh = ActiveListingIndex()
+            for listing in listings:
+                fresh._add(self._normalize(listing))
+            self.listings, self.by_country, self.by_pair, self.by_cell = (
+                fresh.listings, fresh.by_country, fresh.by_pair, fresh.by_cell
+            )
+            self.by_token, self.search_weights = fresh.by_token, fresh.search_weights
+            self.ordered = self.ordered_by_rate = None
+            self.generation += 1
+            self.rebuilding = False
+            # Re-apply writes that raced with the load
+            for op, arg in self.replay:
+                self.upsert(arg) if op == "upsert" else self.remove(arg)
+            self.ready = True
+            self.rebuilds += 1
+            self.last_rebuild = datetime.now(timezone.utc)
+        except Exception as e:
+            logger.error(f"❌ Error rebuilding active listing index: {e}")
+        finally:
+            self.rebuilding = False
+            self.replay = []
+    
+    def _live(self, listing: dict, now: datetime, exclude_user_ids) -> bool:
+        expires_at = listing.get("expires_at")
+        if expires_at is not None and expires_at < now:
+            return False
+        return not exclude_user_ids or listing.get("user_id") not in exclude_user_ids
+    
+    def browse(
+        self,
+        country: Optional[str] = None,
+        from_currency: Optional[str] = None,
+        to_currency: Optional[str] = None,
+        exclude_user_ids: AbstractSet[str] = frozenset(),
+        limit: int = 1000,
+        after: Optional[tuple] = None,
+        sort: str = "newest"
+    ) -> List[dict]:
+        """Active listings matching the filters, newest first, strictly after the
+        (created_at, id) keyset `after` if given. With sort="best_rate", listings
+        with a rate score, lowest rate_deviation first, keyset (rate_deviation, id)."""
+        self.queries += 1
+        now = datetime.now(timezone.utc)
+        best_rate = sort == "best_rate"
+        sort_key = listing_rate_sort_key if best_rate else listing_sort_key
+        
+        candidate_sets = []
+        if country:
+            candidate_sets.append(self.by_country.get(country, set()))
+        if from_currency and to_currency:
+            candidate_sets.append(self.by_pair.get((from_currency, to_currency), set()))
+        
+        if candidate_sets:
+            ids = set.intersection(*sorted(candidate_sets, key=len))
+            candidates = [self.listings[listing_id] for listing_id in ids]
+            if best_rate:
+                candidates = [listing for listing in candidates if has_rate_score(listing)]
+            candidates.sort(key=sort_key, reverse=not best_rate)
+        elif best_rate:
+            if self.ordered_by_rate is None:
+                self.ordered_by_rate = sorted(
+                    (listing for listing in self.listings.values() if has_rate_score(listing)), key=listing_rate_sort_key
+                )
+            candidates = self.ordered_by_rate
+        else:
+            if self.ordered is None:
+                self.ordered = sorted(self.listings.values(), key=listing_sort_key, reverse=True)
+            candidates = self.ordered
+        
+        results = []
+        for listing in candidates:
+            if after is not None and (sort_key(listing) <= after if best_rate else sort_key(listing) >= after):
+                continue
+            if from_currency and listing.get("from_currency") != from_currency:
+                continue
+            if to_currency and listing.get("to_currency") != to_currency:
+                continue
+            if not self._live(listing, now, exclude_user_ids):
+                continue
+            results.append(listing)
+            if len(results) >= limit:
+                break
+        return results
+    
+    def search(
+        self,
+        terms: List[str],
+        country: Optional[str] = None,
+        from_currency: Optional[str] = None,
+        to_currency: Optional[str] = None,
+        exclude_user_ids: AbstractSet[str] = frozenset(),
+        limit: int = 100,
+        after: Optional[tuple] = None
+    ) -> List[dict]:
+        """Active listings matching any of the terms, best score first (then newest),
+        strictly after the (score, created_at, id) keyset `after` if given"""
+        self.queries += 1
+        now = datetime.now(timezone.utc)
+        
+        ids = set().union(*(self.by_token.get(term, ()) for term in set(terms)))
+        if country:
+            ids &= self.by_country.get(country, set())
+        
+        matches = []
+        for listing_id in ids:
+            listing = self.listings[listing_id]
+            if from_currency and listing.get("from_currency") != from_currency:
+                continue
+            if to_currency and listing.get("to_currency") != to_currency:
+                continue
+            if not self._live(listing, now, exclude_user_ids):
+                continue
+            weights = self.search_weights[listing_id]
+            score = float(sum(weights.get(term, 0) for term in terms))
+            key = (score, *listing_sort_key(listing))
+            if after is not None and key >= after:
+                continue
+            matches.append((key, listing))
+        
+        matches.sort(key=lambda match: match[0], reverse=True)
+        return [{**listing, "score": key[0]} for key, listing in matches[:limit]]
+    
+    def nearby(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        limit: int,
+        exclude_user_ids: AbstractSet[str] = frozenset()
+    ) -> List[dict]:
+        """Active listings within radius_km, closest first, with distance in km"""
+        self.queries += 1
+        now = datetime.now(timezone.utc)
+        results = []
+        # A wide circle covers more cells than hold listings; walk the occupied ones instead
+        if geohash_cell_estimate(latitude, radius_km) > len(self.by_cell):
+            cells = list(self.by_cell)
+        else:
+            cells = geohash_cells_within(latitude, longitude, radius_km)
+        for cell in cells:
+            for listing_id in self.by_cell.get(cell, ()):
+                listing = self.listings[listing_id]
+                if not self._live(listing, now, exclude_user_ids):
+                    continue
+                distance = calculate_distance(latitude, longitude, listing["latitude"], listing["longitude"])
+                if distance <= radius_km:
+                    results.append({**listing, "distance": round(distance, 2)})
+        results.sort(key=lambda l: l["distance"])
+        return results[:limit]
+    
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "size": len(self.listings),
+            "countries": len(self.by_country),
+            "currency_pairs": len(self.by_pair),
+            "geohash_cells": len(self.by_cell),
+            "search_tokens": len(self.by_token),
+            "queries": self.queries,
+            "rebuilds": self.rebuilds,
+            "generation": self.generation,
+            "last_rebuild": self.last_rebuild.isoformat() if self.last_rebuild else None
+        }
+
+active_listing_index = ActiveListingIndex()
+
+# Opaque keyset cursors for GET /listings: base64 of [created_at, id]
+def encode_listing_cursor(listing: dict) -> str:
+    created_at = parse_datetime(listing.get("created_at"))
+    raw = json.dumps([created_at.isoformat() if created_at else None, listing["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_listing_cursor(cursor: str) -> tuple:
+    try:
+        created_at, listing_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        parsed = parse_datetime(created_at)
+        if created_at is not None and parsed is None:
+            raise ValueError(created_at)
+        return (parsed or datetime.min.replace(tzinfo=timezone.utc), str(listing_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# sort=best_rate pages on (rate_deviation, id): base64 of [rate_deviation, id]
+def encode_rate_cursor(listing: dict) -> str:
+    raw = json.dumps([listing["rate_deviation"], listing["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_rate_cursor(cursor: str) -> tuple:
+    try:
+        rate_deviation, listing_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return (float(rate_deviation), str(listing_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Search results page on (score, created_at, id): base64 of [score, created_at, id]
+def encode_search_cursor(listing: dict) -> str:
+    created_at = parse_datetime(listing.get("created_at"))
+    raw = json.dumps([listing["score"], created_at.isoformat() if created_at else None, listing["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_search_cursor(cursor: str) -> tuple:
+    try:
+        score, created_at, listing_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        parsed = parse_datetime(created_at)
+        if created_at is not None and parsed is None:
+            raise ValueError(created_at)
+        return (float(score), parsed or datetime.min.replace(tzinfo=timezone.utc), str(listing_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def paginate_listings(listings: List[dict], limit: int, encode_cursor=encode_listing_cursor) -> Response:
+    """Trim a limit+1 fetch to one page and set X-Next-Cursor if more remain"""
+    headers = {}
+    if len(listings) > limit:
+        listings = listings[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(listings[-1])
+    return trusted_list_response(Listing, listings, headers)
+
 # Listing Routes
-@api_router.post("/listings", response_model=Listing)
-async def create_listing(listing_data: ListingCreate, current_user: dict = Depends(get_current_user)):
+async def new_listing_document(listing_data: ListingCreate, current_user: dict) -> dict:
+    """The document to insert for a new listing, scored and with its GeoJSON location"""
+    listing_fields = listing_data.model_dump()
     listing = Listing(
         user_id=current_user['id'],
         username=current_user['username'],
-        **listing_data.model_dump()
+        **listing_fields,
+        **await listing_rate_scores(listing_fields)
     )
     
-    listing_dict = listing.model_dump()
-    listing_dict['created_at'] = listing_dict['created_at'].isoformat()
+    listing_dict = listing.model_dump()
+    location = listing_location(listing.latitude, listing.longitude)
+    if location:
+        listing_dict['location'] = location
+    return listing_dict
+
+@api_router.post("/listings", response_model=Listing)
+async def create_listing(listing_data: ListingCreate, current_user: dict = Depends(get_current_user)):
+    listing_dict = await new_listing_document(listing_data, current_user)
+    
+    await db.listings.insert_one(listing_dict)
+    active_listing_index.upsert(listing_dict)
+    await change_counters.bump("listings")
+    expiry_scheduler.schedule("listing", listing_dict['id'], listing_dict['expires_at'])
+    
+    # Check for achievements
+    asyncio.create_task(check_and_award_achievements(current_user['id']))
+    
+    return listing_dict
+
+class ListingBatchOperation(BaseModel):
+    action: str  # "create", "close" or "republish"
+    listing_id: Optional[str] = None  # close / republish
+    listing: Optional[dict] = None  # create: a ListingCreate body
+
+class ListingBatchRequest(BaseModel):
+    operations: List[ListingBatchOperation] = Field(..., min_length=1, max_length=LISTING_BATCH_MAX_OPERATIONS)
+
+def batch_update_applied(intended: dict, stored: Optional[dict]) -> bool:
+    """Whether the stored listing reflects a batch close/republish"""
+    if stored is None or stored.get('status') != intended['status']:
+        return False
+    if intended['status'] != "active":
+        return True
+    # A republish sets a fresh expires_at; Mongo keeps it to the millisecond
+    expires_at = parse_datetime(stored.get('expires_at'))
+    return expires_at is not None and abs(expires_at - intended['expires_at']) < timedelta(milliseconds=1)
+
+@api_router.post("/listings/batch")
+async def batch_listings(batch: ListingBatchRequest, current_user: dict = Depends(get_current_user)):
+    """Create, close and republish many of your listings in one request.
+    Everything is written with a single unordered bulk_write; results come back
+    per operation, in request order, and a failed operation doesn't stop the rest."""
+    results = [
+        {"index": i, "action": op.action, "listing_id": op.listing_id, "ok": False, "detail": None}
+        for i, op in enumerate(batch.operations)
+    ]
+    
+    # Load every listing referenced by close/republish in one query
+    referenced_ids = {op.listing_id for op in batch.operations if op.action in ("close", "republish") and op.listing_id}
+    existing = {}
+    if referenced_ids:
+        async for listing in db.listings.find({"id": {"$in": list(referenced_ids)}}, {"_id": 0}):
+            existing[listing['id']] = listing
+    
+    now = datetime.now(timezone.utc)
+    writes = []  # (result index, write op, listing document to apply once written)
+    touched = set()
+    for result, op in zip(results, batch.operations):
+        if op.action == "create":
+            try:
+                listing_dict = await new_listing_document(ListingCreate.model_validate(op.listing or {}), current_user)
+            except ValidationError as e:
+                result["detail"] = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+                continue
+            except HTTPException as e:
+                result["detail"] = e.detail
+                continue
+            result["listing_id"] = listing_dict['id']
+            writes.append((result["index"], InsertOne(listing_dict), listing_dict))
+            continue
+        
+        if op.action not in ("close", "republish"):
+            result["detail"] = "Unknown action"
+            continue
+        listing = existing.get(op.listing_id)
+        if listing is None:
+            result["detail"] = "Listing not found"
+            continue
+        if listing['user_id'] != current_user['id']:
+            result["detail"] = "Not authorized"
+            continue
+        if op.listing_id in touched:
+            result["detail"] = "Listing already changed in this batch"
+            continue
+        touched.add(op.listing_id)
+        
+        if op.action == "close":
+            writes.append((
+                result["index"],
+                UpdateOne({"id": op.listing_id, "user_id": current_user['id']}, {"$set": {"status": "closed"}}),
+                {**listing, "status": "closed"}
+            ))
+        else:
+            if listing.get('status') != "expired":
+                result["detail"] = "Only expired listings can be republished"
+                continue
+            update = {
+                "status": "active",
+                "expires_at": now + timedelta(hours=12),
+                "expiry_warned": False,
+                **await listing_rate_scores(listing)
+            }
+            writes.append((
+                result["index"],
+                UpdateOne({"id": op.listing_id, "user_id": current_user['id'], "status": "expired"}, {"$set": update}),
+                {**listing, **update}
+            ))
     
-    await db.listings.insert_one(listing_dict)
+    failed_writes = {}
+    if writes:
+        try:
+            matched = (await db.listings.bulk_write([write for _, write, _ in writes], ordered=False)).matched_count
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                failed_writes[error["index"]] = error.get("errmsg", "Write failed")
+            matched = e.details.get("nMatched", 0)
+        
+        # An update whose filter matched nothing (listing deleted, or republished
+        # elsewhere since it was read) wrote nothing; find which from the stored state
+        updates = [
+            position for position, (_, write, _) in enumerate(writes)
+            if isinstance(write, UpdateOne) and position not in failed_writes
+        ]
+        if matched < len(updates):
+            stored = {}
+            async for listing in db.listings.find(
+                {"id": {"$in": [writes[position][2]['id'] for position in updates]}},
+                {"_id": 0, "id": 1, "status": 1, "expires_at": 1}
+            ):
+                stored[listing['id']] = listing
+            for position in updates:
+                if not batch_update_applied(writes[position][2], stored.get(writes[position][2]['id'])):
+                    failed_writes[position] = "Listing was changed by another request"
+        
+        if len(failed_writes) < len(writes):
+            await change_counters.bump("listings")
+    
+    counts = {"created": 0, "closed": 0, "republished": 0}
+    for position, (index, _, listing) in enumerate(writes):
+        result = results[index]
+        if position in failed_writes:
+            result["detail"] = failed_writes[position]
+            continue
+        result["ok"] = True
+        active_listing_index.upsert(listing)
+        if listing['status'] == "active":
+            expiry_scheduler.schedule("listing", listing['id'], listing['expires_at'])
+        else:
+            expiry_scheduler.cancel("listing", listing['id'])
+        counts[{"create": "created", "close": "closed", "republish": "republished"}[result["action"]]] += 1
     
-    # Check for achievements
-    asyncio.create_task(check_and_award_achievements(current_user['id']))
+    # One achievements check for the whole batch
+    if counts["created"]:
+        asyncio.create_task(check_and_award_achievements(current_user['id']))
     
-    return listing
+    return {"results": results, **counts, "failed": sum(1 for result in results if not result["ok"])}
 
 @api_router.get("/listings", response_model=List[Listing])
 async def get_listings(
+    request: Request,
     country: Optional[str] = None,
     from_currency: Optional[str] = None,
     to_currency: Optional[str] = None,
     status: str = "active",
+    limit: int = 1000,
+    cursor: Optional[str] = None,
+    sort: str = "newest",
     current_user: Optional[dict] = Depends(get_current_user_optional)
 ):
+    """Listings newest first, or with sort=best_rate the listings that have a
+    market comparison, cheapest relative to the market rate first. Pass `limit`
+    and the previous page's X-Next-Cursor header as `cursor` to page through results."""
+    if sort not in LISTING_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(LISTING_SORTS)}")
+    
+    # Signed-in results also depend on who the viewer blocks or is blocked by
+    viewer_id = current_user['id'] if current_user else None
+    # Active listings are served from memory once the index is loaded
+    from_index = status == "active" and active_listing_index.ready
+    etag, last_modified = await change_counters.validators(
+        ("listings", "user_blocks") if viewer_id else ("listings",),
+        "listings", sorted(request.query_params.multi_items()), viewer_id,
+        active_listing_index.generation if from_index else None
+    )
+    cached = change_counters.not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
+    
+    best_rate = sort == "best_rate"
+    encode_cursor, decode_cursor = (
+        (encode_rate_cursor, decode_rate_cursor) if best_rate else (encode_listing_cursor, decode_listing_cursor)
+    )
+    limit = max(1, min(limit, 1000))
+    after = decode_cursor(cursor) if cursor else None
+    hidden_user_ids = await block_cache.hidden_ids(current_user['id']) if current_user else frozenset()
+    
+    if from_index:
+        listings = active_listing_index.browse(
+            country, from_currency, to_currency, hidden_user_ids, limit=limit + 1, after=after, sort=sort
+        )
+        response = paginate_listings(listings, limit, encode_cursor)
+        response.headers.update(validator_headers(etag, last_modified))
+        return response
+    
     query = {"status": status}
     if country:
         query["country"] = country
@@ -1118,19 +3294,38 @@ async def get_listings(
     if to_currency:
         query["to_currency"] = to_currency
     
-    # Exclude listings from blocked users
-    if current_user:
-        blocked_users = current_user.get('blocked_users', [])
-        if blocked_users:
-            query["user_id"] = {"$nin": blocked_users}
-    
-    listings = await db.listings.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    
-    for listing in listings:
-        if isinstance(listing.get('created_at'), str):
-            listing['created_at'] = datetime.fromisoformat(listing['created_at'])
-    
-    return listings
+    if best_rate:
+        # Only listings with a market comparison can be ranked
+        query["rate_deviation"] = {"$type": "number"}
+        sort_field, sort_order = "rate_deviation", 1
+    else:
+        sort_field, sort_order = "created_at", -1
+    
+    # Blocked users are filtered here rather than with $nin, which keeps the
+    # filter + (sort field, id) index plan; pages short of rows are refilled
+    # by continuing from the last keyset
+    listings = []
+    while True:
+        # Keyset: everything strictly past the cursor in sort order, ties broken by id
+        if after:
+            value, listing_id = after
+            past = "$gt" if sort_order == 1 else "$lt"
+            query["$or"] = [
+                {sort_field: {past: value}},
+                {sort_field: value, "id": {past: listing_id}}
+            ]
+        
+        batch = await db.listings.find(query, {"_id": 0, "location": 0}).sort(
+            [(sort_field, sort_order), ("id", sort_order)]
+        ).limit(limit + 1).to_list(limit + 1)
+        listings.extend(listing for listing in batch if listing['user_id'] not in hidden_user_ids)
+        if len(batch) <= limit or len(listings) > limit:
+            break
+        after = (batch[-1][sort_field], batch[-1]['id'])
+    
+    response = paginate_listings(listings[:limit + 1], limit, encode_cursor)
+    response.headers.update(validator_headers(etag, last_modified))
+    return response
 
 # Haversine formula to calculate distance between two coordinates
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
@@ -1152,33 +3347,99 @@ async def get_nearby_listings(
     lat: float,
     lng: float,
     radius: float = 75.0,  # Default 75km
-    status: str = "active"
+    status: str = "active",
+    limit: int = 100,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
 ):
-    """Get listings within specified radius (in km) from given coordinates"""
-    # Get all active listings
+    """Get listings within specified radius (in km) from given coordinates, closest first"""
+    limit = max(1, min(limit, 500))
+    radius = max(0.0, min(radius, NEARBY_MAX_RADIUS_KM))
+    near = listing_location(lat, lng)
+    hidden_user_ids = await block_cache.hidden_ids(current_user['id']) if current_user else frozenset()
+    
+    if status == "active" and active_listing_index.ready:
+        return trusted_list_response(Listing, active_listing_index.nearby(lat, lng, radius, limit, hidden_user_ids))
+    
     query = {"status": status}
-    all_listings = await db.listings.find(query, {"_id": 0}).to_list(1000)
+    if hidden_user_ids:
+        # $geoNear always walks the 2dsphere index; this only filters what it visits
+        query["user_id"] = {"$nin": list(hidden_user_ids)}
+    
+    # $geoNear walks the 2dsphere index outward from the point, so cost
+    # depends on the results returned, not on the size of the collection
+    pipeline = [
+        {"$geoNear": {
+            "near": near,
+            "key": "location",
+            "distanceField": "distance",
+            "maxDistance": radius * 1000,  # meters
+            "query": query,
+            "spherical": True
+        }},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "location": 0}}
+    ]
+    nearby_listings = await db.listings.aggregate(pipeline).to_list(limit)
     
-    nearby_listings = []
-    for listing in all_listings:
-        # Skip if listing doesn't have coordinates
-        if not listing.get('latitude') or not listing.get('longitude'):
-            continue
-            
-        # Calculate distance
-        distance = calculate_distance(lat, lng, listing['latitude'], listing['longitude'])
-        
-        # Add to result if within radius
-        if distance <= radius:
-            listing['distance'] = round(distance, 2)  # Add distance info
-            if isinstance(listing.get('created_at'), str):
-                listing['created_at'] = datetime.fromisoformat(listing['created_at'])
-            nearby_listings.append(listing)
+    for listing in nearby_listings:
+        listing['distance'] = round(listing['distance'] / 1000, 2)  # km
     
-    # Sort by distance (closest first)
-    nearby_listings.sort(key=lambda x: x.get('distance', float('inf')))
+    return trusted_list_response(Listing, nearby_listings)
+
+@api_router.get("/listings/search", response_model=List[Listing])
+async def search_listings(
+    q: str,
+    country: Optional[str] = None,
+    from_currency: Optional[str] = None,
+    to_currency: Optional[str] = None,
+    status: str = "active",
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
+    """Search city and description. Listings matching any word are returned,
+    best match first (city matches weigh more), then newest. Page with `limit`
+    and the X-Next-Cursor header as `cursor`, like GET /listings."""
+    terms = search_tokens(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="Search query is empty")
+    limit = max(1, min(limit, 500))
+    after = decode_search_cursor(cursor) if cursor else None
+    hidden_user_ids = await block_cache.hidden_ids(current_user['id']) if current_user else frozenset()
+    
+    if status == "active" and active_listing_index.ready:
+        listings = active_listing_index.search(
+            terms, country, from_currency, to_currency, hidden_user_ids, limit=limit + 1, after=after
+        )
+        return paginate_listings(listings, limit, encode_search_cursor)
     
-    return nearby_listings
+    match = {"$text": {"$search": " ".join(terms)}, "status": status}
+    if country:
+        match["country"] = country
+    if from_currency:
+        match["from_currency"] = from_currency
+    if to_currency:
+        match["to_currency"] = to_currency
+    if hidden_user_ids:
+        # The text index drives the plan; this only filters what it matches
+        match["user_id"] = {"$nin": list(hidden_user_ids)}
+    
+    pipeline = [{"$match": match}, {"$addFields": {"score": {"$meta": "textScore"}}}]
+    if after:
+        score, created_at, listing_id = after
+        pipeline.append({"$match": {"$or": [
+            {"score": {"$lt": score}},
+            {"score": score, "created_at": {"$lt": created_at}},
+            {"score": score, "created_at": created_at, "id": {"$lt": listing_id}}
+        ]}})
+    pipeline += [
+        {"$sort": {"score": -1, "created_at": -1, "id": -1}},
+        {"$limit": limit + 1},
+        {"$project": {"_id": 0, "location": 0}}
+    ]
+    listings = await db.listings.aggregate(pipeline).to_list(limit + 1)
+    
+    return paginate_listings(listings, limit, encode_search_cursor)
 
 @api_router.get("/listings/my-listings", response_model=List[Listing])
 async def get_my_listings(current_user: dict = Depends(get_current_user)):
@@ -1188,32 +3449,41 @@ async def get_my_listings(current_user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).sort("created_at", -1).to_list(1000)
     
-    # Format dates and calculate time remaining
+    # Calculate time remaining in seconds
     now = datetime.now(timezone.utc)
     for listing in listings:
-        if isinstance(listing.get('created_at'), str):
-            listing['created_at'] = datetime.fromisoformat(listing['created_at'])
-        if isinstance(listing.get('expires_at'), str):
-            listing['expires_at'] = datetime.fromisoformat(listing['expires_at'])
-        
-        # Calculate time remaining in seconds
-        if listing.get('expires_at'):
-            expires_at = listing['expires_at']
-            if isinstance(expires_at, str):
-                expires_at = datetime.fromisoformat(expires_at)
+        expires_at = parse_datetime(listing.get('expires_at'))
+        if expires_at:
             time_remaining = (expires_at - now).total_seconds()
             listing['time_remaining'] = max(0, int(time_remaining))
     
-    return listings
+    return trusted_list_response(Listing, listings)
 
 @api_router.get("/listings/{listing_id}", response_model=Listing)
-async def get_listing(listing_id: str):
+async def get_listing(
+    listing_id: str,
+    request: Request,
+    response: Response,
+    current_user: Optional[dict] = Depends(get_current_user_optional)
+):
+    # view_count isn't part of the version, so a 304 may carry an older count.
+    # A 304 also means this client has fetched the listing before, so it's a
+    # repeat view and isn't recorded.
+    etag, last_modified = await change_counters.validators(("listings",), "listing", listing_id)
+    cached = change_counters.not_modified(request, etag, last_modified, exists=False)
+    if cached is not None:
+        return cached
+    
     listing = await db.listings.find_one({"id": listing_id}, {"_id": 0})
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
+    response.headers.update(validator_headers(etag, last_modified))
     
-    if isinstance(listing.get('created_at'), str):
-        listing['created_at'] = datetime.fromisoformat(listing['created_at'])
+    # Owners viewing their own listing don't count; anonymous viewers are keyed by IP
+    viewer = current_user['id'] if current_user else f"ip:{client_ip(request)}"
+    if viewer != listing['user_id']:
+        listing_view_counter.record(listing_id, listing['user_id'], viewer)
+    listing['view_count'] = listing.get('view_count', 0) + listing_view_counter.pending_views(listing_id)
     
     return listing
 
@@ -1227,11 +3497,16 @@ async def update_listing(listing_id: str, listing_data: ListingCreate, current_u
         raise HTTPException(status_code=403, detail="Not authorized")
     
     update_data = listing_data.model_dump()
-    await db.listings.update_one({"id": listing_id}, {"$set": update_data})
+    update_data.update(await listing_rate_scores(update_data))
+    location = listing_location(listing_data.latitude, listing_data.longitude)
+    if location:
+        await db.listings.update_one({"id": listing_id}, {"$set": {**update_data, "location": location}})
+    else:
+        await db.listings.update_one({"id": listing_id}, {"$set": update_data, "$unset": {"location": ""}})
     
     updated_listing = await db.listings.find_one({"id": listing_id}, {"_id": 0})
-    if isinstance(updated_listing.get('created_at'), str):
-        updated_listing['created_at'] = datetime.fromisoformat(updated_listing['created_at'])
+    active_listing_index.upsert(updated_listing)
+    await change_counters.bump("listings")
     
     return updated_listing
 
@@ -1245,6 +3520,8 @@ async def delete_listing(listing_id: str, current_user: dict = Depends(get_curre
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.listings.update_one({"id": listing_id}, {"$set": {"status": "closed"}})
+    active_listing_index.remove(listing_id)
+    await change_counters.bump("listings")
     return {"message": "Listing closed"}
 
 @api_router.post("/listings/{listing_id}/republish")
@@ -1263,16 +3540,22 @@ async def republish_listing(listing_id: str, current_user: dict = Depends(get_cu
     # Update to active and reset expiry
     now = datetime.now(timezone.utc)
     new_expires_at = now + timedelta(hours=12)
+    rate_fields = await listing_rate_scores(listing)  # re-score against today's market
     
     await db.listings.update_one(
         {"id": listing_id},
         {
             "$set": {
                 "status": "active",
-                "expires_at": new_expires_at.isoformat()
+                "expires_at": new_expires_at,
+                "expiry_warned": False,
+                **rate_fields
             }
         }
     )
+    active_listing_index.upsert({**listing, **rate_fields, "status": "active", "expires_at": new_expires_at})
+    await change_counters.bump("listings")
+    expiry_scheduler.schedule("listing", listing_id, new_expires_at)
     
     return {"message": "Listing republished successfully", "expires_at": new_expires_at.isoformat()}
 
@@ -1291,38 +3574,63 @@ async def upload_listing_photos(
         raise HTTPException(status_code=403, detail="Not authorized")
     
     uploaded_filenames = []
+    photo_variants = []
+    written = []  # every upload saved by this request, removed again if any step fails
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB in bytes
     
-    for file in files:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail=f"File {file.filename} is not a valid image")
-        
-        # Read file to check size
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=400, detail=f"File {file.filename} is too large. Maximum size is 5MB")
-        
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
-        unique_filename = f"{listing_id}_{uuid.uuid4().hex[:8]}.{file_extension}"
-        file_path = UPLOAD_DIR / unique_filename
-        
-        # Save file
-        try:
-            with open(file_path, "wb") as buffer:
-                buffer.write(file_content)
+    try:
+        for file in files:
+            # Validate file type
+            if file.content_type not in IMAGE_UPLOAD_TYPES:
+                raise HTTPException(status_code=400, detail=f"File {file.filename} is not a valid image")
+            
+            # Generate unique filename
+            file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'jpg'
+            unique_filename = f"{listing_id}_{uuid.uuid4().hex[:8]}.{file_extension}"
+            file_path = UPLOAD_DIR / unique_filename
+            
+            # Save file, enforcing the size limit as it streams
+            try:
+                await save_upload(file, file_path, MAX_FILE_SIZE, f"File {file.filename} is too large. Maximum size is 5MB")
+            except HTTPException:
+                raise
+            except Exception:
+                raise HTTPException(status_code=500, detail=f"Failed to save file {file.filename}")
+            written.append(file_path)
+            
+            # Strip EXIF and write the thumb/medium variants
+            try:
+                record = await image_processor.process(file_path)
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"File {file.filename} is not a valid image")
             uploaded_filenames.append(unique_filename)
-        except Exception:
-            raise HTTPException(status_code=500, detail=f"Failed to save file {file.filename}")
-    
-    # Update listing with photo filenames
-    await db.listings.update_one(
-        {"id": listing_id}, 
-        {"$push": {"photos": {"$each": uploaded_filenames}}}
-    )
+            photo_variants.append({"filename": unique_filename, **record})
+        
+        # Update listing with photo filenames
+        await db.listings.update_one(
+            {"id": listing_id}, 
+            {"$push": {"photos": {"$each": uploaded_filenames}, "photo_variants": {"$each": photo_variants}}}
+        )
+    except BaseException:
+        for file_path in written:
+            remove_image_files(file_path)
+        raise
+    if listing.get('status') == "active":
+        active_listing_index.upsert({
+            **listing,
+            "photos": listing.get('photos', []) + uploaded_filenames,
+            "photo_variants": listing.get('photo_variants', []) + photo_variants
+        })
+    await change_counters.bump("listings")
     
-    return {"message": "Photos uploaded successfully", "filenames": uploaded_filenames}
+    return {
+        "message": "Photos uploaded successfully",
+        "filenames": uploaded_filenames,
+        "photos": [
+            {"filename": record["filename"], "url": f"/uploads/{record['filename']}", **image_variant_urls(record, "/uploads")}
+            for record in photo_variants
+        ]
+    }
 
 # Message Routes
 @api_router.post("/messages", response_model=Message)
@@ -1333,11 +3641,11 @@ async def send_message(message_data: MessageCreate, current_user: dict = Depends
         raise HTTPException(status_code=404, detail="Recipient not found")
     
     # Check if current user is blocked by recipient
-    if current_user['id'] in recipient.get('blocked_users', []):
+    if message_data.recipient_id in await block_cache.blocked_by(current_user['id']):
         raise HTTPException(status_code=403, detail="You cannot message this user")
     
     # Check if recipient is blocked by current user
-    if message_data.recipient_id in current_user.get('blocked_users', []):
+    if message_data.recipient_id in await block_cache.blocking(current_user['id']):
         raise HTTPException(status_code=403, detail="You have blocked this user")
     
     # Check if listing is active
@@ -1360,7 +3668,6 @@ async def send_message(message_data: MessageCreate, current_user: dict = Depends
     )
     
     message_dict = message.model_dump()
-    message_dict['timestamp'] = message_dict['timestamp'].isoformat()
     
     await db.messages.insert_one(message_dict)
     
@@ -1371,7 +3678,6 @@ async def send_message(message_data: MessageCreate, current_user: dict = Depends
         content=f"New message from {current_user['username']}"
     )
     notif_dict = notification.model_dump()
-    notif_dict['created_at'] = notif_dict['created_at'].isoformat()
     await db.notifications.insert_one(notif_dict)
     
     # Check for achievements
@@ -1420,10 +3726,15 @@ async def get_chats(current_user: dict = Depends(get_current_user)):
     
     # Group by listing and other user
     chats_map = {}
+    hidden_user_ids = await block_cache.hidden_ids(current_user['id'])
     
     for msg in messages:
         other_user_id = msg['recipient_id'] if msg['sender_id'] == current_user['id'] else msg['sender_id']
+        # Hide conversations with users blocked either way
+        if other_user_id in hidden_user_ids:
+            continue
         key = f"{msg['listing_id']}_{other_user_id}"
+        message_time = parse_datetime(msg.get('timestamp')) or datetime.min.replace(tzinfo=timezone.utc)
         
         if key not in chats_map:
             other_user = await db.users.find_one({"id": other_user_id}, {"_id": 0, "password": 0})
@@ -1435,16 +3746,13 @@ async def get_chats(current_user: dict = Depends(get_current_user)):
                 "listing_from_currency": listing.get('from_currency', 'N/A') if listing else 'N/A',
                 "listing_to_currency": listing.get('to_currency', 'N/A') if listing else 'N/A',
                 "last_message": msg['content'],
-                "last_message_time": msg['timestamp'],
+                "last_message_time": message_time,
                 "unread_count": 0
             }
         else:
-            msg_time = datetime.fromisoformat(msg['timestamp']) if isinstance(msg['timestamp'], str) else msg['timestamp']
-            current_time = datetime.fromisoformat(chats_map[key]['last_message_time']) if isinstance(chats_map[key]['last_message_time'], str) else chats_map[key]['last_message_time']
-            
-            if msg_time > current_time:
+            if message_time > chats_map[key]['last_message_time']:
                 chats_map[key]['last_message'] = msg['content']
-                chats_map[key]['last_message_time'] = msg['timestamp']
+                chats_map[key]['last_message_time'] = message_time
         
         if msg['recipient_id'] == current_user['id'] and not msg['read']:
             chats_map[key]['unread_count'] += 1
@@ -1452,7 +3760,7 @@ async def get_chats(current_user: dict = Depends(get_current_user)):
     # Sort by last message time
     sorted_chats = sorted(chats_map.values(), key=lambda x: x['last_message_time'], reverse=True)
     
-    return sorted_chats
+    return trusted_list_response(Chat, sorted_chats)
 
 @api_router.delete("/chats/{listing_id}/{other_user_id}")
 async def delete_chat(listing_id: str, other_user_id: str, current_user: dict = Depends(get_current_user)):
@@ -1489,7 +3797,7 @@ async def delete_chat(listing_id: str, other_user_id: str, current_user: dict =
     }
 
 @api_router.get("/chats/unread-count")
-async def get_unread_messages_count(current_user: dict = Depends(get_current_user)):
+async def get_unread_messages_count(current_user: dict = Depends(get_token_claims)):
     """Get total count of unread messages and latest unread chat info"""
     unread_count = await db.messages.count_documents({
         "recipient_id": current_user['id'],
@@ -1517,7 +3825,7 @@ async def get_unread_messages_count(current_user: dict = Depends(get_current_use
 
 # Admin Routes
 @api_router.get("/admin/users")
-async def get_all_users(admin_user: dict = Depends(get_admin_user)):
+async def get_all_users(admin_user: dict = Depends(get_admin_claims)):
     """Get all users for admin panel"""
     users = await db.users.find({}, {"_id": 0}).to_list(length=None)
     
@@ -1531,22 +3839,22 @@ async def get_all_users(admin_user: dict = Depends(get_admin_user)):
         }
         user.update(user_stats)
     
-    return users
+    return ORJSONResponse(users)
 
 @api_router.get("/admin/listings")
-async def get_all_listings(admin_user: dict = Depends(get_admin_user)):
+async def get_all_listings(admin_user: dict = Depends(get_admin_claims)):
     """Get all listings for admin panel"""
     listings = await db.listings.find({}, {"_id": 0}).to_list(length=None)
-    return listings
+    return ORJSONResponse(listings)
 
 @api_router.get("/admin/messages")
-async def get_all_messages(admin_user: dict = Depends(get_admin_user)):
+async def get_all_messages(admin_user: dict = Depends(get_admin_claims)):
     """Get all messages for admin panel - including soft deleted ones"""
     messages = await db.messages.find({}, {"_id": 0}).to_list(length=None)
-    return messages
+    return ORJSONResponse(messages)
 
 @api_router.get("/admin/chats")
-async def get_all_chats(admin_user: dict = Depends(get_admin_user)):
+async def get_all_chats(admin_user: dict = Depends(get_admin_claims)):
     """Get all chats for admin panel - including those deleted by users"""
     # Get ALL messages (no deleted_by filter)
     messages = await db.messages.find({}, {"_id": 0}).to_list(10000)
@@ -1558,6 +3866,7 @@ async def get_all_chats(admin_user: dict = Depends(get_admin_user)):
         # Create a unique key for each conversation
         users = sorted([msg['sender_id'], msg['recipient_id']])
         key = f"{msg['listing_id']}_{users[0]}_{users[1]}"
+        message_time = parse_datetime(msg.get('timestamp')) or datetime.min.replace(tzinfo=timezone.utc)
         
         if key not in chats_map:
             sender = await db.users.find_one({"id": msg['sender_id']}, {"_id": 0, "password": 0})
@@ -1570,17 +3879,14 @@ async def get_all_chats(admin_user: dict = Depends(get_admin_user)):
                 "user2": recipient,
                 "listing_info": listing,
                 "last_message": msg['content'],
-                "last_message_time": msg['timestamp'],
+                "last_message_time": message_time,
                 "total_messages": 1,
                 "deleted_by": msg.get('deleted_by', [])
             }
         else:
-            msg_time = datetime.fromisoformat(msg['timestamp']) if isinstance(msg['timestamp'], str) else msg['timestamp']
-            current_time = datetime.fromisoformat(chats_map[key]['last_message_time']) if isinstance(chats_map[key]['last_message_time'], str) else chats_map[key]['last_message_time']
-            
-            if msg_time > current_time:
+            if message_time > chats_map[key]['last_message_time']:
                 chats_map[key]['last_message'] = msg['content']
-                chats_map[key]['last_message_time'] = msg['timestamp']
+                chats_map[key]['last_message_time'] = message_time
             
             chats_map[key]['total_messages'] += 1
             
@@ -1592,10 +3898,10 @@ async def get_all_chats(admin_user: dict = Depends(get_admin_user)):
     # Sort by last message time
     sorted_chats = sorted(chats_map.values(), key=lambda x: x['last_message_time'], reverse=True)
     
-    return sorted_chats
+    return ORJSONResponse(sorted_chats)
 
 @api_router.get("/admin/stats")
-async def get_admin_stats(admin_user: dict = Depends(get_admin_user)):
+async def get_admin_stats(admin_user: dict = Depends(get_admin_claims)):
     """Get general statistics for admin dashboard"""
     total_users = await db.users.count_documents({})
     total_listings = await db.listings.count_documents({})
@@ -1610,11 +3916,33 @@ async def get_admin_stats(admin_user: dict = Depends(get_admin_user)):
         "generated_at": datetime.now(timezone.utc).isoformat()
     }
 
+@api_router.get("/admin/metrics")
+async def get_admin_metrics(admin_user: dict = Depends(get_admin_claims)):
+    """Get in-process cache and worker metrics for this API worker"""
+    return {
+        "user_cache": user_cache.stats(),
+        "change_counters": change_counters.stats(),
+        "block_cache": block_cache.stats(),
+        "presence": presence_tracker.stats(),
+        "listing_views": listing_view_counter.stats(),
+        "password_hasher": password_hasher.stats(),
+        "image_processor": image_processor.stats(),
+        "http_client": http_client.stats(),
+        "token_revocation": revocation_list.stats(),
+        "email_outbox": email_outbox.stats(),
+        "active_listings": active_listing_index.stats(),
+        "expiry": expiry_scheduler.stats(),
+        "rate_limits": {limiter.name: limiter.stats() for limiter in auth_limiters},
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
 @api_router.delete("/admin/users/{user_id}")
 async def delete_user(user_id: str, admin_user: dict = Depends(get_admin_user)):
     """Delete a user and all related data"""
     # Delete user's listings
     await db.listings.delete_many({"user_id": user_id})
+    active_listing_index.remove_user(user_id)
+    await change_counters.bump("listings")
     
     # Delete user's messages
     await db.messages.delete_many({"$or": [{"sender_id": user_id}, {"recipient_id": user_id}]})
@@ -1622,8 +3950,18 @@ async def delete_user(user_id: str, admin_user: dict = Depends(get_admin_user)):
     # Delete user's notifications
     await db.notifications.delete_many({"user_id": user_id})
     
+    # Delete user's block relations, both ways
+    block_query = {"$or": [{"blocker_id": user_id}, {"blocked_id": user_id}]}
+    blocks = await db.user_blocks.find(block_query, {"_id": 0}).to_list(None)
+    await db.user_blocks.delete_many(block_query)
+    block_cache.invalidate(user_id, *(b['blocker_id'] for b in blocks), *(b['blocked_id'] for b in blocks))
+    if blocks:
+        await change_counters.bump("user_blocks")
+    
     # Delete user
     result = await db.users.delete_one({"id": user_id})
+    user_cache.invalidate(user_id)
+    presence_tracker.forget(user_id)
     
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1651,6 +3989,8 @@ async def delete_listing_by_admin(listing_id: str, request_data: DeleteListingRe
     
     # Delete the listing
     await db.listings.delete_one({"id": listing_id})
+    active_listing_index.remove(listing_id)
+    await change_counters.bump("listings")
     
     # Create in-app notification for the user
     notification_content = f"İlanınız ({listing['from_amount']} {listing['from_currency']} → {listing['to_amount']} {listing['to_currency']}) yönetici tarafından kaldırılmıştır. Sebep: {reason}"
@@ -1684,13 +4024,13 @@ async def delete_listing_by_admin(listing_id: str, request_data: DeleteListingRe
     </html>
     """
     
-    # Send email
-    email_sent = send_email(user["email"], email_subject, email_html)
+    # Queue email; the outbox delivers it in the background
+    email_queued = await email_outbox.enqueue(user["email"], email_subject, email_html)
     
     return {
         "message": "Listing deleted successfully", 
         "notification_sent": True,
-        "email_sent": email_sent,
+        "email_queued": email_queued,
         "listing_title": f"{listing['from_amount']} {listing['from_currency']} → {listing['to_amount']} {listing['to_currency']}",
         "user": user["username"]
     }
@@ -1752,19 +4092,19 @@ async def send_support_message(message: dict, current_user: dict = Depends(get_c
     return {"message": "Message sent successfully", "message_id": new_message.id}
 
 @api_router.get("/admin/support")
-async def get_all_support_conversations(admin_user: dict = Depends(get_admin_user)):
+async def get_all_support_conversations(admin_user: dict = Depends(get_admin_claims)):
     """Get all support conversations for admin"""
     conversations = await db.support_conversations.find({}, {"_id": 0}).sort("updated_at", -1).to_list(length=None)
     return conversations
 
 @api_router.get("/admin/support/unread-count")
-async def get_unread_support_count(admin_user: dict = Depends(get_admin_user)):
+async def get_unread_support_count(admin_user: dict = Depends(get_admin_claims)):
     """Get count of unread support conversations"""
     count = await db.support_conversations.count_documents({"unread_admin": {"$gt": 0}})
     return {"count": count}
 
 @api_router.get("/admin/notifications")
-async def get_admin_notifications(admin_user: dict = Depends(get_admin_user)):
+async def get_admin_notifications(admin_user: dict = Depends(get_admin_claims)):
     """Get recent admin notifications"""
     # Get recent support messages
     recent_conversations = await db.support_conversations.find(
@@ -1854,7 +4194,7 @@ async def support_websocket(websocket: WebSocket, token: str):
     """WebSocket endpoint for live support"""
     try:
         # Verify token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_auth_token(token)
         user_id = payload.get("sub")
         if not user_id:
             await websocket.close(code=4001)
@@ -2033,13 +4373,8 @@ async def upload_support_image(file: UploadFile = File(...), current_user: dict
         if file.content_type not in allowed_types:
             raise HTTPException(status_code=400, detail="Invalid file type. Only images allowed.")
         
-        # Validate file size (max 5MB)
-        file_content = await file.read()
-        if len(file_content) > 5 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File too large. Max 5MB allowed.")
-        
         # Create uploads directory if not exists
-        upload_dir = Path("/app/backend/uploads/support")
+        upload_dir = UPLOAD_DIR / "support"
         upload_dir.mkdir(parents=True, exist_ok=True)
         
         # Generate unique filename
@@ -2047,9 +4382,18 @@ async def upload_support_image(file: UploadFile = File(...), current_user: dict
         unique_filename = f"{current_user['id']}_{uuid.uuid4()}.{file_extension}"
         file_path = upload_dir / unique_filename
         
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # Save file (max 5MB, checked as it streams)
+        await save_upload(file, file_path, 5 * 1024 * 1024, "File too large. Max 5MB allowed.")
+        
+        # Strip EXIF and write the thumb/medium variants
+        try:
+            record = await image_processor.process(file_path)
+        except ValueError:
+            remove_image_files(file_path)
+            raise HTTPException(status_code=400, detail="File is not a valid image")
+        except BaseException:
+            remove_image_files(file_path)
+            raise
         
         # Return URL
         image_url = f"/uploads/support/{unique_filename}"
@@ -2058,9 +4402,12 @@ async def upload_support_image(file: UploadFile = File(...), current_user: dict
         return {
             "success": True,
             "image_url": image_url,
-            "filename": unique_filename
+            "filename": unique_filename,
+            "variants": image_variant_urls(record, "/uploads/support")
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error uploading image: {e}")
         raise HTTPException(status_code=500, detail="Error uploading image")
@@ -2070,49 +4417,56 @@ async def upload_profile_photo(file: UploadFile = File(...), current_user: dict
     """Upload profile photo for user"""
     try:
         # Validate file type
-        allowed_types = ["image/jpeg", "image/jpg", "image/png", "image/webp"]
-        if file.content_type not in allowed_types:
+        if file.content_type not in IMAGE_UPLOAD_TYPES:
             raise HTTPException(status_code=400, detail="Invalid file type. Only JPEG, PNG, WebP allowed.")
         
-        # Validate file size (max 2MB for profile photos)
-        file_content = await file.read()
-        if len(file_content) > 2 * 1024 * 1024:
-            raise HTTPException(status_code=400, detail="File too large. Max 2MB allowed.")
-        
         # Create uploads directory
-        upload_dir = Path("/app/backend/uploads/profiles")
+        upload_dir = UPLOAD_DIR / "profiles"
         upload_dir.mkdir(parents=True, exist_ok=True)
         
-        # Delete old profile photo if exists
-        old_photo = current_user.get('profile_photo')
-        if old_photo:
-            old_path = Path(f"/app/backend{old_photo}")
-            if old_path.exists():
-                old_path.unlink()
-        
-        # Generate unique filename
+        # Generate unique filename. The suffix keeps the old photo intact until
+        # the new one is in place, and gives each photo its own URL.
         file_extension = file.filename.split('.')[-1]
-        unique_filename = f"profile_{current_user['id']}.{file_extension}"
+        unique_filename = f"profile_{current_user['id']}_{uuid.uuid4().hex[:8]}.{file_extension}"
         file_path = upload_dir / unique_filename
         
-        # Save file
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # Save file (max 2MB for profile photos, checked as it streams)
+        await save_upload(file, file_path, 2 * 1024 * 1024, "File too large. Max 2MB allowed.")
+        
+        # Strip EXIF and write the thumb/medium variants
+        try:
+            record = await image_processor.process(file_path)
+        except ValueError:
+            remove_image_files(file_path)
+            raise HTTPException(status_code=400, detail="File is not a valid image")
+        except BaseException:
+            remove_image_files(file_path)
+            raise
         
         # Update user profile
         photo_url = f"/uploads/profiles/{unique_filename}"
+        photo_variants = image_variant_urls(record, "/uploads/profiles")
         await db.users.update_one(
             {"id": current_user['id']},
-            {"$set": {"profile_photo": photo_url}}
+            {"$set": {"profile_photo": photo_url, "profile_photo_variants": photo_variants}}
         )
+        user_cache.invalidate(current_user['id'])
+        
+        # Delete old profile photo if exists
+        old_photo = current_user.get('profile_photo')
+        if old_photo and old_photo != photo_url:
+            remove_image_files(UPLOAD_DIR / old_photo.removeprefix("/uploads/"))
         
         logger.info(f"👤 Profile photo uploaded: {photo_url} by user {current_user['id']}")
         
         return {
             "success": True,
-            "profile_photo": photo_url
+            "profile_photo": photo_url,
+            "profile_photo_variants": photo_variants
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Error uploading profile photo: {e}")
         raise HTTPException(status_code=500, detail="Error uploading profile photo")
@@ -2126,17 +4480,16 @@ async def delete_profile_photo(current_user: dict = Depends(get_current_user)):
         if not old_photo:
             raise HTTPException(status_code=404, detail="No profile photo to delete")
         
-        # Delete file from disk
-        old_path = Path(f"/app/backend{old_photo}")
-        if old_path.exists():
-            old_path.unlink()
-            logger.info(f"🗑️ Profile photo file deleted: {old_photo}")
+        # Delete file (and its variants) from disk
+        remove_image_files(UPLOAD_DIR / old_photo.removeprefix("/uploads/"))
+        logger.info(f"🗑️ Profile photo file deleted: {old_photo}")
         
         # Update user profile - remove photo
         await db.users.update_one(
             {"id": current_user['id']},
-            {"$set": {"profile_photo": None}}
+            {"$set": {"profile_photo": None, "profile_photo_variants": None}}
         )
+        user_cache.invalidate(current_user['id'])
         
         logger.info(f"👤 Profile photo removed for user {current_user['id']}")
         
@@ -2189,8 +4542,9 @@ async def create_admin_account():
     )
     
     # Hash password
-    hashed_password = hash_password("kais")
+    hashed_password = await password_hasher.hash("kais")
     admin_dict = admin_user.model_dump()
+    admin_dict['username_lower'] = normalize_username(admin_user.username)
     admin_dict['password'] = hashed_password
     
     await db.users.insert_one(admin_dict)
@@ -2219,13 +4573,11 @@ async def get_messages(listing_id: str, other_user_id: str, current_user: dict =
     
     # Update the messages in the response to reflect the read status change
     for msg in messages:
-        if isinstance(msg.get('timestamp'), str):
-            msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
         # Mark messages from other_user to current_user as read in the response
         if msg['sender_id'] == other_user_id and msg['recipient_id'] == current_user['id']:
             msg['read'] = True
     
-    return messages
+    return trusted_list_response(Message, messages)
 
 # Rating Routes
 @api_router.post("/ratings", response_model=Rating)
@@ -2264,9 +4616,9 @@ async def create_rating(rating_data: RatingCreate, current_user: dict = Depends(
     )
     
     rating_dict = rating.model_dump()
-    rating_dict['created_at'] = rating_dict['created_at'].isoformat()
     
     await db.ratings.insert_one(rating_dict)
+    await change_counters.bump("ratings")
     
     # Update user rating
     user_ratings = await db.ratings.find({"rated_user_id": rating_data.rated_user_id}).to_list(1000)
@@ -2276,18 +4628,20 @@ async def create_rating(rating_data: RatingCreate, current_user: dict = Depends(
             {"id": rating_data.rated_user_id},
             {"$set": {"rating": round(avg_rating, 2), "total_ratings": len(user_ratings)}}
         )
+        user_cache.invalidate(rating_data.rated_user_id)
     
     return rating
 
 @api_router.get("/ratings/{user_id}", response_model=List[Rating])
-async def get_user_ratings(user_id: str):
-    ratings = await db.ratings.find({"rated_user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
+async def get_user_ratings(user_id: str, request: Request):
+    etag, last_modified = await change_counters.validators(("ratings",), "ratings", user_id)
+    cached = change_counters.not_modified(request, etag, last_modified)
+    if cached is not None:
+        return cached
     
-    for rating in ratings:
-        if isinstance(rating.get('created_at'), str):
-            rating['created_at'] = datetime.fromisoformat(rating['created_at'])
+    ratings = await db.ratings.find({"rated_user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
     
-    return ratings
+    return trusted_list_response(Rating, ratings, validator_headers(etag, last_modified))
 
 # Meetup Routes
 @api_router.post("/meetups", response_model=Meetup)
@@ -2331,16 +4685,9 @@ async def create_meetup(meetup_data: MeetupCreate, current_user: dict = Depends(
     )
     
     meetup_dict = meetup.model_dump()
-    meetup_dict['created_at'] = meetup_dict['created_at'].isoformat()
-    meetup_dict['expires_at'] = meetup_dict['expires_at'].isoformat()
-    if meetup_dict.get('accepted_at'):
-        meetup_dict['accepted_at'] = meetup_dict['accepted_at'].isoformat()
-    if meetup_dict.get('verified_at'):
-        meetup_dict['verified_at'] = meetup_dict['verified_at'].isoformat()
-    if meetup_dict.get('completed_at'):
-        meetup_dict['completed_at'] = meetup_dict['completed_at'].isoformat()
     
     await db.meetups.insert_one(meetup_dict)
+    expiry_scheduler.schedule("meetup", meetup.id, meetup.expires_at)
     
     # Send notification to receiver
     notification = Notification(
@@ -2349,7 +4696,6 @@ async def create_meetup(meetup_data: MeetupCreate, current_user: dict = Depends(
         content=f"New Meet Up Request! 🤝 {current_user['username']} wants to meet up for exchange"
     )
     notif_dict = notification.model_dump()
-    notif_dict['created_at'] = notif_dict['created_at'].isoformat()
     await db.notifications.insert_one(notif_dict)
     
     logger.info(f"🤝 Meetup created: {current_user['username']} → {receiver['username']}")
@@ -2367,12 +4713,6 @@ async def get_meetups_for_listing(listing_id: str, current_user: dict = Depends(
         ]
     }, {"_id": 0}).sort("created_at", -1).to_list(100)
     
-    # Parse datetime strings
-    for meetup in meetups:
-        for field in ['created_at', 'expires_at', 'accepted_at', 'verified_at', 'completed_at']:
-            if meetup.get(field) and isinstance(meetup[field], str):
-                meetup[field] = datetime.fromisoformat(meetup[field].replace('Z', '+00:00'))
-    
     return meetups
 
 @api_router.put("/meetups/{meetup_id}/accept")
@@ -2390,15 +4730,15 @@ async def accept_meetup(meetup_id: str, current_user: dict = Depends(get_current
         raise HTTPException(status_code=400, detail="Meetup is not pending")
     
     # Check if expired
-    expires_at = datetime.fromisoformat(meetup['expires_at'].replace('Z', '+00:00')) if isinstance(meetup['expires_at'], str) else meetup['expires_at']
-    if datetime.now(timezone.utc) > expires_at:
+    expires_at = parse_datetime(meetup.get('expires_at'))
+    if expires_at is not None and datetime.now(timezone.utc) > expires_at:
         await db.meetups.update_one({"id": meetup_id}, {"$set": {"status": "expired"}})
         raise HTTPException(status_code=400, detail="Meetup request has expired")
     
     # Accept meetup
     await db.meetups.update_one(
         {"id": meetup_id},
-        {"$set": {"status": "accepted", "accepted_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": "accepted", "accepted_at": datetime.now(timezone.utc)}}
     )
     
     # Send notification to requester
@@ -2408,7 +4748,6 @@ async def accept_meetup(meetup_id: str, current_user: dict = Depends(get_current
         content=f"Meet Up Accepted! ✅ {current_user['username']} accepted your meet up request. Your code: {meetup['requester_code']}"
     )
     notif_dict = notification.model_dump()
-    notif_dict['created_at'] = notif_dict['created_at'].isoformat()
     await db.notifications.insert_one(notif_dict)
     
     logger.info(f"✅ Meetup accepted: {meetup_id}")
@@ -2442,7 +4781,6 @@ async def reject_meetup(meetup_id: str, current_user: dict = Depends(get_current
         content=f"Meet Up Declined ❌ {current_user['username']} declined your meet up request"
     )
     notif_dict = notification.model_dump()
-    notif_dict['created_at'] = notif_dict['created_at'].isoformat()
     await db.notifications.insert_one(notif_dict)
     
     logger.info(f"❌ Meetup rejected: {meetup_id}")
@@ -2482,7 +4820,7 @@ async def verify_meetup(meetup_id: str, verify_data: MeetupVerify, current_user:
     if updated_meetup['requester_verified'] and updated_meetup['receiver_verified']:
         await db.meetups.update_one(
             {"id": meetup_id},
-            {"$set": {"status": "verified", "verified_at": datetime.now(timezone.utc).isoformat()}}
+            {"$set": {"status": "verified", "verified_at": datetime.now(timezone.utc)}}
         )
         logger.info(f"✅ Both parties verified meetup: {meetup_id}")
         return {"message": "Code verified! Both parties confirmed. You can now complete the exchange.", "both_verified": True}
@@ -2507,7 +4845,7 @@ async def complete_meetup(meetup_id: str, current_user: dict = Depends(get_curre
     # Complete meetup
     await db.meetups.update_one(
         {"id": meetup_id},
-        {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"status": "completed", "completed_at": datetime.now(timezone.utc)}}
     )
     
     # Record exchange for rating purposes
@@ -2516,7 +4854,7 @@ async def complete_meetup(meetup_id: str, current_user: dict = Depends(get_curre
         "listing_id": meetup['listing_id'],
         "user1_id": meetup['requester_id'],
         "user2_id": meetup['receiver_id'],
-        "completed_at": datetime.now(timezone.utc).isoformat()
+        "completed_at": datetime.now(timezone.utc)
     }
     await db.exchanges.insert_one(exchange_record)
     
@@ -2561,7 +4899,6 @@ async def cancel_meetup(meetup_id: str, current_user: dict = Depends(get_current
         content=f"Meet Up Cancelled ⚠️ {current_user['username']} cancelled the meet up"
     )
     notif_dict = notification.model_dump()
-    notif_dict['created_at'] = notif_dict['created_at'].isoformat()
     await db.notifications.insert_one(notif_dict)
     
     logger.info(f"⚠️ Meetup cancelled: {meetup_id}")
@@ -2602,10 +4939,9 @@ async def initiate_exchange(exchange_data: ExchangeInitiate, current_user: dict
     )
     
     exchange_dict = exchange.model_dump()
-    exchange_dict['initiated_at'] = exchange_dict['initiated_at'].isoformat()
-    exchange_dict['deadline'] = exchange_dict['deadline'].isoformat()
     
     await db.exchange_confirmations.insert_one(exchange_dict)
+    expiry_scheduler.schedule("exchange", exchange.id, exchange.deadline)
     
     return {"message": "Exchange confirmation initiated", "exchange_id": exchange.id}
 
@@ -2653,13 +4989,7 @@ async def get_my_exchanges(current_user: dict = Depends(get_current_user)):
         ]
     }, {"_id": 0}).sort("initiated_at", -1).to_list(100)
     
-    # Format dates
     for exchange in exchanges:
-        if isinstance(exchange.get('initiated_at'), str):
-            exchange['initiated_at'] = datetime.fromisoformat(exchange['initiated_at'])
-        if isinstance(exchange.get('deadline'), str):
-            exchange['deadline'] = datetime.fromisoformat(exchange['deadline'])
-        
         # Add listing info
         listing = await db.listings.find_one({"id": exchange['listing_id']}, {"_id": 0})
         if listing:
@@ -2686,15 +5016,7 @@ async def get_notifications(current_user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).sort("created_at", -1).to_list(100)
     
-    for notif in notifications:
-        # Ensure created_at is timezone-aware datetime
-        if isinstance(notif.get('created_at'), str):
-            notif['created_at'] = datetime.fromisoformat(notif['created_at'].replace('Z', '+00:00'))
-        elif isinstance(notif.get('created_at'), datetime):
-            if notif['created_at'].tzinfo is None:
-                notif['created_at'] = notif['created_at'].replace(tzinfo=timezone.utc)
-    
-    return notifications
+    return trusted_list_response(Notification, notifications)
 
 @api_router.post("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, current_user: dict = Depends(get_current_user)):
@@ -2734,7 +5056,6 @@ async def create_report(report_data: ReportCreate, current_user: dict = Depends(
     )
     
     report_dict = report.model_dump()
-    report_dict['created_at'] = report_dict['created_at'].isoformat()
     
     await db.reports.insert_one(report_dict)
     
@@ -2756,14 +5077,7 @@ async def get_reports(current_user: dict = Depends(get_current_user)):
         {"_id": 0}
     ).sort("created_at", -1).to_list(1000)
     
-    for report in reports:
-        if isinstance(report.get('created_at'), str):
-            report['created_at'] = datetime.fromisoformat(report['created_at'].replace('Z', '+00:00'))
-        elif isinstance(report.get('created_at'), datetime):
-            if report['created_at'].tzinfo is None:
-                report['created_at'] = report['created_at'].replace(tzinfo=timezone.utc)
-    
-    return reports
+    return trusted_list_response(Report, reports)
 
 # Block User Routes
 @api_router.post("/users/block/{user_id}")
@@ -2777,15 +5091,16 @@ async def block_user(user_id: str, current_user: dict = Depends(get_current_user
     if not blocked_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Check if already blocked
-    if user_id in current_user.get('blocked_users', []):
-        raise HTTPException(status_code=400, detail="User already blocked")
-    
-    # Add to blocked list
-    await db.users.update_one(
-        {"id": current_user['id']},
-        {"$addToSet": {"blocked_users": user_id}}
+    # Add the block unless it already exists
+    result = await db.user_blocks.update_one(
+        {"blocker_id": current_user['id'], "blocked_id": user_id},
+        {"$setOnInsert": {"created_at": datetime.now(timezone.utc)}},
+        upsert=True
     )
+    if result.upserted_id is None:
+        raise HTTPException(status_code=400, detail="User already blocked")
+    block_cache.invalidate(current_user['id'], user_id)
+    await change_counters.bump("user_blocks")
     
     logger.info(f"🚫 Kullanıcı engellendi: {current_user['username']} -> {blocked_user['username']}")
     
@@ -2794,15 +5109,12 @@ async def block_user(user_id: str, current_user: dict = Depends(get_current_user
 @api_router.delete("/users/unblock/{user_id}")
 async def unblock_user(user_id: str, current_user: dict = Depends(get_current_user)):
     """Unblock a user"""
-    # Check if user is actually blocked
-    if user_id not in current_user.get('blocked_users', []):
+    # Remove the block, if there is one
+    result = await db.user_blocks.delete_one({"blocker_id": current_user['id'], "blocked_id": user_id})
+    if result.deleted_count == 0:
         raise HTTPException(status_code=400, detail="User is not blocked")
-    
-    # Remove from blocked list
-    await db.users.update_one(
-        {"id": current_user['id']},
-        {"$pull": {"blocked_users": user_id}}
-    )
+    block_cache.invalidate(current_user['id'], user_id)
+    await change_counters.bump("user_blocks")
     
     blocked_user = await db.users.find_one({"id": user_id})
     username = blocked_user['username'] if blocked_user else "Unknown"
@@ -2814,16 +5126,22 @@ async def unblock_user(user_id: str, current_user: dict = Depends(get_current_us
 @api_router.get("/users/blocked")
 async def get_blocked_users(current_user: dict = Depends(get_current_user)):
     """Get list of blocked users"""
-    blocked_ids = current_user.get('blocked_users', [])
+    blocks = await db.user_blocks.find(
+        {"blocker_id": current_user['id']},
+        {"_id": 0, "blocked_id": 1}
+    ).sort("created_at", -1).to_list(1000)
     
-    if not blocked_ids:
+    if not blocks:
         return {"blocked_users": []}
     
-    # Get user details for blocked users
-    blocked_users = await db.users.find(
+    # Get user details for blocked users, most recently blocked first
+    blocked_ids = [block['blocked_id'] for block in blocks]
+    users = await db.users.find(
         {"id": {"$in": blocked_ids}},
         {"_id": 0, "id": 1, "username": 1, "profile_photo": 1}
     ).to_list(1000)
+    users_by_id = {user['id']: user for user in users}
+    blocked_users = [users_by_id[user_id] for user_id in blocked_ids if user_id in users_by_id]
     
     return {"blocked_users": blocked_users}
 
@@ -2920,11 +5238,8 @@ async def check_and_award_achievements(user_id: str):
         
         # Check popular_seller
         if 'popular_seller' not in current_achievements:
-            total_views = 0
-            user_listings = await db.listings.find({"user_id": user_id}).to_list(1000)
-            for listing in user_listings:
-                total_views += listing.get('view_count', 0)
-            if total_views >= 1000:
+            total_views = user.get('listing_views', 0) + listing_view_counter.pending_users.get(user_id, 0)
+            if total_views >= POPULAR_SELLER_VIEWS:
                 new_achievements.append('popular_seller')
         
         # Check chat_master
@@ -2959,6 +5274,8 @@ async def check_and_award_achievements(user_id: str):
                 )
                 new_achievements.append('master_user')
             
+            user_cache.invalidate(user_id)
+            
             # Send notifications for new achievements
             for achievement in new_achievements:
                 achievement_names = {
@@ -2979,7 +5296,6 @@ async def check_and_award_achievements(user_id: str):
                 )
                 
                 notif_dict = notification.model_dump()
-                notif_dict['created_at'] = notif_dict['created_at'].isoformat()
                 await db.notifications.insert_one(notif_dict)
                 
                 logger.info(f"🏆 Yeni rozet kazanıldı: {user['username']} -> {achievement}")
@@ -3057,7 +5373,7 @@ async def get_exchange_rate_history(
         
         # Fetch historical data
         history = await db.exchange_rate_history.find(
-            {"recorded_at": {"$gte": start_date.isoformat()}},
+            {"recorded_at": {"$gte": start_date}},
             {"_id": 0, "recorded_at": 1, "date": 1, "rates": 1}
         ).sort("recorded_at", 1).to_list(1000)
         
@@ -3092,11 +5408,21 @@ async def get_exchange_rate_history(
         raise HTTPException(status_code=500, detail="Error fetching historical data")
 
 @api_router.get("/exchange-rates/changes")
-async def get_exchange_rate_changes(currencies: str = "TRY,EUR,GBP,JPY"):
+async def get_exchange_rate_changes(request: Request, response: Response, currencies: str = "TRY,EUR,GBP,JPY"):
     """Get 24-hour change percentages for currencies"""
     try:
         currency_list = [c.strip().upper() for c in currencies.split(",")]
         
+        # The 24h-ago snapshot shifts as time passes, so the version also
+        # rolls over every EXCHANGE_CHANGES_ETAG_SECONDS
+        etag, last_modified = await change_counters.validators(
+            ("exchange_rates",), "changes", currency_list, int(time.time() // EXCHANGE_CHANGES_ETAG_SECONDS)
+        )
+        cached = change_counters.not_modified(request, etag, None)
+        if cached is not None:
+            return cached
+        response.headers.update(validator_headers(etag, None))
+        
         # Get current rates
         current_data = await db.exchange_rates.find_one({}, {"_id": 0}, sort=[("last_updated", -1)])
         if not current_data:
@@ -3105,7 +5431,7 @@ async def get_exchange_rate_changes(currencies: str = "TRY,EUR,GBP,JPY"):
         # Get rates from 24 hours ago
         yesterday = datetime.now(timezone.utc) - timedelta(hours=24)
         old_data = await db.exchange_rate_history.find_one(
-            {"recorded_at": {"$lte": yesterday.isoformat()}},
+            {"recorded_at": {"$lte": yesterday}},
             {"_id": 0},
             sort=[("recorded_at", -1)]
         )
@@ -3144,8 +5470,8 @@ async def get_exchange_rates(base_currency: str):
     """Get current exchange rates for a base currency using free API"""
     try:
         # Using exchangerate-api.com free tier (1500 requests/month)
-        url = f"https://api.exchangerate-api.com/v4/latest/{base_currency.upper()}"
-        response = requests.get(url, timeout=10)
+        url = f"{EXCHANGE_RATE_API_URL}/{base_currency.upper()}"
+        response = await http_client.get(url, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -3156,7 +5482,7 @@ async def get_exchange_rates(base_currency: str):
             }
         else:
             raise HTTPException(status_code=503, detail="Exchange rate service unavailable")
-    except requests.RequestException:
+    except httpx.HTTPError:
         # Fallback with mock data if API is down based on common exchange rates
         base = base_currency.upper()
         mock_rates_usd = {
@@ -3180,36 +5506,41 @@ async def get_exchange_rates(base_currency: str):
             "note": "Fallback rates - API service unavailable"
         }
 
+POPULAR_CURRENCIES = {
+    "currencies": [
+        {"code": "USD", "name": "US Dollar", "symbol": "$"},
+        {"code": "EUR", "name": "Euro", "symbol": "€"},
+        {"code": "TRY", "name": "Turkish Lira", "symbol": "₺"},
+        {"code": "GBP", "name": "British Pound", "symbol": "£"},
+        {"code": "AED", "name": "UAE Dirham", "symbol": "د.إ"},
+        {"code": "SAR", "name": "Saudi Riyal", "symbol": "﷼"},
+        {"code": "JPY", "name": "Japanese Yen", "symbol": "¥"},
+        {"code": "CHF", "name": "Swiss Franc", "symbol": "CHF"},
+        {"code": "CAD", "name": "Canadian Dollar", "symbol": "C$"},
+        {"code": "AUD", "name": "Australian Dollar", "symbol": "A$"},
+        {"code": "CNY", "name": "Chinese Yuan", "symbol": "¥"},
+        {"code": "INR", "name": "Indian Rupee", "symbol": "₹"},
+        {"code": "KRW", "name": "South Korean Won", "symbol": "₩"},
+        {"code": "RUB", "name": "Russian Ruble", "symbol": "₽"},
+        {"code": "BRL", "name": "Brazilian Real", "symbol": "R$"},
+        {"code": "MXN", "name": "Mexican Peso", "symbol": "$"},
+    ]
+}
+POPULAR_CURRENCIES_ETAG = '"%s"' % hashlib.blake2b(json.dumps(POPULAR_CURRENCIES).encode(), digest_size=12).hexdigest()
+
 @api_router.get("/popular-currencies")
-async def get_popular_currencies():
+async def get_popular_currencies(request: Request, response: Response):
     """Get list of popular currencies for exchange rate display"""
-    return {
-        "currencies": [
-            {"code": "USD", "name": "US Dollar", "symbol": "$"},
-            {"code": "EUR", "name": "Euro", "symbol": "€"},
-            {"code": "TRY", "name": "Turkish Lira", "symbol": "₺"},
-            {"code": "GBP", "name": "British Pound", "symbol": "£"},
-            {"code": "AED", "name": "UAE Dirham", "symbol": "د.إ"},
-            {"code": "SAR", "name": "Saudi Riyal", "symbol": "﷼"},
-            {"code": "JPY", "name": "Japanese Yen", "symbol": "¥"},
-            {"code": "CHF", "name": "Swiss Franc", "symbol": "CHF"},
-            {"code": "CAD", "name": "Canadian Dollar", "symbol": "C$"},
-            {"code": "AUD", "name": "Australian Dollar", "symbol": "A$"},
-            {"code": "CNY", "name": "Chinese Yuan", "symbol": "¥"},
-            {"code": "INR", "name": "Indian Rupee", "symbol": "₹"},
-            {"code": "KRW", "name": "South Korean Won", "symbol": "₩"},
-            {"code": "RUB", "name": "Russian Ruble", "symbol": "₽"},
-            {"code": "BRL", "name": "Brazilian Real", "symbol": "R$"},
-            {"code": "MXN", "name": "Mexican Peso", "symbol": "$"},
-        ]
-    }
+    # Static list: the ETag only changes when the list does
+    cached = change_counters.not_modified(request, POPULAR_CURRENCIES_ETAG, None)
+    if cached is not None:
+        return cached
+    response.headers.update(validator_headers(POPULAR_CURRENCIES_ETAG, None))
+    return POPULAR_CURRENCIES
 
 @api_router.get("/reports/listing/{listing_id}")
 async def get_listing_reports(listing_id: str):
     reports = await db.reports.find({"listing_id": listing_id}, {"_id": 0}).to_list(100)
-    for report in reports:
-        if isinstance(report.get('created_at'), str):
-            report['created_at'] = datetime.fromisoformat(report['created_at'])
     return reports
 
 # User Status Routes
@@ -3220,7 +5551,7 @@ async def update_user_status(status: str, current_user: dict = Depends(get_curre
         {"$set": {
             "user_id": current_user['id'],
             "status": status,
-            "last_seen": datetime.now(timezone.utc).isoformat()
+            "last_seen": datetime.now(timezone.utc)
         }},
         upsert=True
     )
@@ -3229,47 +5560,33 @@ async def update_user_status(status: str, current_user: dict = Depends(get_curre
 @api_router.get("/users/{user_id}/status")
 async def get_user_status(user_id: str):
     """Get user online/offline status"""
-    user = await db.users.find_one({"id": user_id}, {"_id": 0, "last_seen": 1, "is_online": 1, "username": 1})
+    user = await load_user(user_id)
     
     if not user:
         return {"user_id": user_id, "is_online": False, "last_seen": None, "username": "Unknown"}
     
+    # Prefer in-memory activity; fall back to the last flushed value
+    last_seen = presence_tracker.get_last_seen(user_id) or parse_datetime(user.get('last_seen'))
+    
     # Check if user is still online (last activity within 5 minutes)
     is_online = False
-    if user.get('last_seen'):
-        last_seen = user['last_seen']
-        if isinstance(last_seen, str):
-            last_seen = datetime.fromisoformat(last_seen.replace('Z', '+00:00'))
-        
-        # Ensure timezone aware
-        if last_seen.tzinfo is None:
-            last_seen = last_seen.replace(tzinfo=timezone.utc)
-        
-        time_diff = datetime.now(timezone.utc) - last_seen
-        is_online = time_diff < timedelta(minutes=5)
-        
-        # Update is_online in database if changed
-        if is_online != user.get('is_online', False):
-            await db.users.update_one(
-                {"id": user_id},
-                {"$set": {"is_online": is_online}}
-            )
+    if last_seen:
+        is_online = datetime.now(timezone.utc) - last_seen < ONLINE_WINDOW
     
     return {
         "user_id": user_id,
         "username": user.get("username", "Unknown"),
         "is_online": is_online,
-        "last_seen": user.get('last_seen')
+        "last_seen": last_seen
     }
 
 # Exchange Rate Route (using external API)
 @api_router.get("/exchange-rate/{from_currency}/{to_currency}")
 async def get_exchange_rate(from_currency: str, to_currency: str):
     try:
-        import requests
         # Using exchangerate-api.com (free tier: 1500 requests/month)
-        url = f"https://api.exchangerate-api.com/v4/latest/{from_currency}"
-        response = requests.get(url, timeout=5)
+        url = f"{EXCHANGE_RATE_API_URL}/{from_currency}"
+        response = await http_client.get(url, timeout=5)
         data = response.json()
         
         if to_currency in data['rates']:
@@ -3306,6 +5623,7 @@ async def get_user_stats(user_id: str):
     return {
         "total_listings": total_listings,
         "active_listings": active_listings,
+        "total_views": await listing_view_counter.total_views(user_id),
         "total_messages_sent": total_messages_sent,
         "total_ratings": len(ratings),
         "average_rating": round(avg_rating, 2),
@@ -3320,14 +5638,6 @@ async def get_active_giveaway():
     if not giveaway:
         return None
     
-    # ISO string'leri datetime'a çevir
-    if isinstance(giveaway.get('start_date'), str):
-        giveaway['start_date'] = datetime.fromisoformat(giveaway['start_date'])
-    if isinstance(giveaway.get('end_date'), str):
-        giveaway['end_date'] = datetime.fromisoformat(giveaway['end_date'])
-    if isinstance(giveaway.get('created_at'), str):
-        giveaway['created_at'] = datetime.fromisoformat(giveaway['created_at'])
-    
     return giveaway
 
 @api_router.post("/giveaway/participate")
@@ -3359,22 +5669,15 @@ async def participate_giveaway(
         raise HTTPException(status_code=400, detail=f"Üye numarası {participation_data.invited_member2} bulunamadı")
     
     # Aynı gün kayıt olmuş mu kontrol et
-    user_created = current_user.get('created_at')
-    if isinstance(user_created, str):
-        user_created = datetime.fromisoformat(user_created)
-    
-    invited1_created = invited1.get('created_at')
-    if isinstance(invited1_created, str):
-        invited1_created = datetime.fromisoformat(invited1_created)
-        
-    invited2_created = invited2.get('created_at')
-    if isinstance(invited2_created, str):
-        invited2_created = datetime.fromisoformat(invited2_created)
+    user_created = parse_datetime(current_user.get('created_at'))
+    invited1_created = parse_datetime(invited1.get('created_at'))
+    invited2_created = parse_datetime(invited2.get('created_at'))
     
     # Aynı gün kontrolü (tarih kısmı)
-    same_day1 = user_created.date() == invited1_created.date()
-    same_day2 = user_created.date() == invited2_created.date()
-    invited_verified = same_day1 and same_day2
+    invited_verified = user_created is not None and all(
+        created is not None and created.date() == user_created.date()
+        for created in (invited1_created, invited2_created)
+    )
     
     # Katılım oluştur
     participation = GiveawayParticipation(
@@ -3390,7 +5693,6 @@ async def participate_giveaway(
     )
     
     participation_dict = participation.model_dump()
-    participation_dict['participated_at'] = participation_dict['participated_at'].isoformat()
     
     await db.giveaway_participations.insert_one(participation_dict)
     
@@ -3419,9 +5721,6 @@ async def get_my_participation(current_user: dict = Depends(get_current_user)):
         "user_id": current_user["id"]
     }, {"_id": 0})
     
-    if participation and isinstance(participation.get('participated_at'), str):
-        participation['participated_at'] = datetime.fromisoformat(participation['participated_at'])
-    
     return participation
 
 @api_router.get("/giveaway/admin/participations")
@@ -3432,10 +5731,6 @@ async def get_all_participations(current_user: dict = Depends(get_current_user))
     
     participations = await db.giveaway_participations.find({}, {"_id": 0}).to_list(length=None)
     
-    for p in participations:
-        if isinstance(p.get('participated_at'), str):
-            p['participated_at'] = datetime.fromisoformat(p['participated_at'])
-    
     return participations
 
 @api_router.put("/giveaway/admin/approve/{participation_id}")
@@ -3482,9 +5777,15 @@ async def reject_participation(
 
 # Exchange Rates Routes
 @api_router.get("/exchange-rates")
-async def get_exchange_rates():
+async def get_exchange_rates(request: Request, response: Response):
     """Get current exchange rates"""
     try:
+        # Last-Modified is the snapshot's last_updated (the counter's changed_at)
+        etag, last_modified = await change_counters.validators(("exchange_rates",), "rates")
+        cached = change_counters.not_modified(request, etag, last_modified)
+        if cached is not None:
+            return cached
+        
         # Fetch latest exchange rates from database
         rate_data = await db.exchange_rates.find_one({}, {"_id": 0}, sort=[("last_updated", -1)])
         
@@ -3495,7 +5796,9 @@ async def get_exchange_rates():
             
             if not rate_data:
                 raise HTTPException(status_code=503, detail="Exchange rates not available")
+            etag, last_modified = await change_counters.validators(("exchange_rates",), "rates")
         
+        response.headers.update(validator_headers(etag, last_modified))
         return rate_data
         
     except Exception as e:
@@ -3504,6 +5807,366 @@ async def get_exchange_rates():
 
 # Moved convert function before parameterized endpoint
 
+# ==================== Data Migrations ====================
+# Timestamp fields that used to be written as ISO strings, per collection
+TIMESTAMP_FIELDS: Dict[str, List[str]] = {
+    "users": ["created_at", "agreements_date", "last_seen"],
+    "listings": ["created_at", "expires_at"],
+    "messages": ["timestamp"],
+    "notifications": ["created_at"],
+    "ratings": ["created_at"],
+    "meetups": ["created_at", "expires_at", "accepted_at", "verified_at", "completed_at"],
+    "exchange_confirmations": ["initiated_at", "deadline"],
+    "exchanges": ["completed_at"],
+    "reports": ["created_at"],
+    "google_sessions": ["created_at", "expires_at"],
+    "password_resets": ["created_at"],
+    "user_status": ["last_seen"],
+    "exchange_rates": ["last_updated"],
+    "exchange_rate_history": ["recorded_at"],
+    "giveaways": ["start_date", "end_date", "created_at"],
+    "giveaway_participations": ["participated_at"],
+}
+
+async def migrate_timestamps_to_dates(batch_size: int = 500):
+    """Rewrite ISO-string timestamps as BSON dates. Resumable: finished fields are
+    recorded in db.migrations and only string-typed values are ever touched."""
+    migration_id = "timestamps_to_dates"
+    try:
+        state = await db.migrations.find_one({"_id": migration_id}) or {}
+        if state.get("completed_at"):
+            return
+        done = set(state.get("done", []))
+        
+        for collection, fields in TIMESTAMP_FIELDS.items():
+            for field in fields:
+                key = f"{collection}.{field}"
+                if key in done:
+                    continue
+                converted = skipped = 0
+                last_id = None
+                while True:
+                    query = {field: {"$type": "string"}}
+                    if last_id is not None:
+                        query["_id"] = {"$gt": last_id}
+                    docs = await db[collection].find(query, {field: 1}).sort("_id", 1).limit(batch_size).to_list(batch_size)
+                    if not docs:
+                        break
+                    last_id = docs[-1]["_id"]
+                    updates = []
+                    for doc in docs:
+                        value = parse_datetime(doc[field])
+                        if value is None:
+                            skipped += 1  # unparseable; left as is
+                            continue
+                        # Match the string too, so a concurrent native write isn't overwritten
+                        updates.append(UpdateOne({"_id": doc["_id"], field: doc[field]}, {"$set": {field: value}}))
+                    if updates:
+                        await db[collection].bulk_write(updates, ordered=False)
+                        converted += len(updates)
+                
+                await db.migrations.update_one({"_id": migration_id}, {"$addToSet": {"done": key}}, upsert=True)
+                if converted or skipped:
+                    logger.info(f"🕒 Migrated {converted} {key} timestamps to dates ({skipped} unparseable)")
+        
+        await db.migrations.update_one(
+            {"_id": migration_id},
+            {"$set": {"completed_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        logger.info("🕒 Timestamp migration complete")
+    except Exception as e:
+        # Progress is kept per field; the next startup resumes from here
+        logger.error(f"❌ Error migrating timestamps: {e}")
+
+async def migrate_blocked_users(batch_size: int = 500):
+    """Move users.blocked_users arrays into db.user_blocks and drop the arrays.
+    Safe to re-run: rows are upserted and each array is only unset once copied."""
+    migration_id = "blocked_users_to_user_blocks"
+    try:
+        if (await db.migrations.find_one({"_id": migration_id}) or {}).get("completed_at"):
+            return
+        
+        moved = 0
+        while True:
+            users = await db.users.find(
+                {"blocked_users": {"$exists": True}},
+                {"_id": 0, "id": 1, "blocked_users": 1}
+            ).limit(batch_size).to_list(batch_size)
+            if not users:
+                break
+            now = datetime.now(timezone.utc)
+            blocks = [
+                UpdateOne(
+                    {"blocker_id": user["id"], "blocked_id": blocked_id},
+                    {"$setOnInsert": {"created_at": now}},
+                    upsert=True
+                )
+                for user in users for blocked_id in set(user.get("blocked_users") or [])
+            ]
+            if blocks:
+                await db.user_blocks.bulk_write(blocks, ordered=False)
+                moved += len(blocks)
+            await db.users.update_many(
+                {"id": {"$in": [user["id"] for user in users]}},
+                {"$unset": {"blocked_users": ""}}
+            )
+            for user in users:
+                user_cache.invalidate(user["id"])
+        
+        block_cache.clear()
+        if moved:
+            await change_counters.bump("user_blocks")
+        await db.migrations.update_one(
+            {"_id": migration_id},
+            {"$set": {"completed_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
+        if moved:
+            logger.info(f"🚫 Moved {moved} block relations to user_blocks")
+    except Exception as e:
+        logger.error(f"❌ Error migrating blocked users: {e}")
+
+# ==================== Index Registry ====================
+# Every index the app relies on, ensured on startup. Options are passed to
+# create_index as-is; "fallback" is created instead when a unique index
+# can't be built because of legacy duplicates.
+INDEX_REGISTRY: Dict[str, List[dict]] = {
+    "users": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("email", 1)]},
+        {"keys": [("member_number", 1)]},
+        {
+            "keys": [("username_lower", 1)], "unique": True, "name": "username_lower_unique",
+            "fallback": {"keys": [("username_lower", 1)], "name": "username_lower_1"}
+        },
+    ],
+    "listings": [
+        {"keys": [("id", 1)], "unique": True},
+        {"keys": [("user_id", 1), ("status", 1)]},
+        {"keys": [("status", 1), ("expires_at", 1)]},
+        {"keys": [("location", "2dsphere")], "name": "location_2dsphere"},
+        # GET /listings/search; "none" disables stemming and stop words, like the in-memory index
+        {
+            "keys": [("city", "text"), ("description", "text")], "name": "listing_text",
+            "weights": SEARCH_FIELD_WEIGHTS, "default_language": "none"
+        },
+        # GET /listings: status + filters, ending in the (created_at, id) keyset sort
+        {"keys": [("status", 1), ("created_at", -1), ("id", -1)]},
+        {"keys": [("status", 1), ("country", 1), ("created_at", -1), ("id", -1)]},
+        {"keys": [("status", 1), ("from_currency", 1), ("to_currency", 1), ("created_at", -1), ("id", -1)]},
+        {"keys": [("status", 1), ("country", 1), ("from_currency", 1), ("to_currency", 1), ("created_at", -1), ("id", -1)]},
+        # GET /listings?sort=best_rate
+        {"keys": [("status", 1), ("rate_deviation", 1), ("id", 1)]},
+        {"keys": [("status", 1), ("from_currency", 1), ("to_currency", 1), ("rate_deviation", 1), ("id", 1)]},
+    ],
+    "messages": [
+        {"keys": [("id", 1)]},
+        {"keys": [("sender_id", 1), ("timestamp", -1)]},
+        {"keys": [("recipient_id", 1), ("read", 1), ("timestamp", -1)]},
+        {"keys": [("listing_id", 1), ("timestamp", 1)]},
+    ],
+    "notifications": [
+        {"keys": [("user_id", 1), ("created_at", -1)]},
+    ],
+    "support_conversations": [
+        {"keys": [("user_id", 1)]},
+        {"keys": [("id", 1)]},
+        {"keys": [("status", 1), ("last_activity", 1)]},
+        {"keys": [("unread_admin", 1), ("updated_at", -1)]},
+    ],
+    "exchange_rates": [
+        {"keys": [("last_updated", -1)]},
+    ],
+    "exchange_rate_history": [
+        {"keys": [("recorded_at", 1)]},
+    ],
+    "exchange_confirmations": [
+        {"keys": [("id", 1)]},
+        {"keys": [("listing_id", 1), ("status", 1)]},
+        {"keys": [("user1_id", 1), ("initiated_at", -1)]},
+        {"keys": [("user2_id", 1), ("initiated_at", -1)]},
+        {"keys": [("status", 1), ("deadline", 1)]},
+    ],
+    "meetups": [
+        {"keys": [("id", 1)]},
+        {"keys": [("listing_id", 1), ("created_at", -1)]},
+        {"keys": [("status", 1), ("expires_at", 1)]},
+    ],
+    "user_blocks": [
+        {"keys": [("blocker_id", 1), ("blocked_id", 1)], "unique": True},
+        {"keys": [("blocked_id", 1), ("blocker_id", 1)]},
+        {"keys": [("blocker_id", 1), ("created_at", -1)]},
+    ],
+    "ratings": [
+        {"keys": [("rated_user_id", 1)]},
+        {"keys": [("rater_id", 1), ("listing_id", 1)]},
+    ],
+    "reports": [
+        {"keys": [("listing_id", 1), ("reporter_id", 1)]},
+        {"keys": [("created_at", -1)]},
+    ],
+    "password_resets": [
+        {"keys": [("token", 1)]},
+    ],
+    "google_sessions": [
+        {"keys": [("user_id", 1)]},
+    ],
+    "giveaway_participations": [
+        {"keys": [("id", 1)]},
+        {"keys": [("giveaway_id", 1), ("user_id", 1)]},
+    ],
+    "revoked_tokens": [
+        {"keys": [("expires_at", 1)], "expireAfterSeconds": 0},
+        {"keys": [("revoked_at", 1)]},
+        {"keys": [("kind", 1), ("user_id", 1)]},
+    ],
+    "email_outbox": [
+        {"keys": [("status", 1), ("next_attempt_at", 1)]},
+        # Only sent rows have a date here; pending and failed rows are kept
+        {"keys": [("sent_at", 1)], "expireAfterSeconds": EMAIL_OUTBOX_RETENTION_DAYS * 86400},
+    ],
+}
+
+# Hot query shapes checked by the index audit. Values are placeholders;
+# the planner's choice depends on the shape, not the values.
+HOT_QUERIES: List[dict] = [
+    {"name": "auth: user by id", "collection": "users", "filter": {"id": "x"}},
+    {"name": "login: user by email", "collection": "users", "filter": {"email": "x"}},
+    {"name": "register: username taken", "collection": "users", "filter": {"username_lower": "x"}},
+    {"name": "giveaway: user by member number", "collection": "users", "filter": {"member_number": "x"}},
+    {"name": "listing by id", "collection": "listings", "filter": {"id": "x"}},
+    {"name": "listings: browse", "collection": "listings", "filter": {"status": "active"},
+     "sort": {"created_at": -1, "id": -1}},
+    {"name": "listings: browse by country and pair", "collection": "listings",
+     "filter": {"status": "active", "country": "x", "from_currency": "x", "to_currency": "x"},
+     "sort": {"created_at": -1, "id": -1}},
+    {"name": "listings: best rate", "collection": "listings",
+     "filter": {"status": "active", "rate_deviation": {"$type": "number"}}, "sort": {"rate_deviation": 1, "id": 1}},
+    {"name": "listings: best rate for pair", "collection": "listings",
+     "filter": {"status": "active", "from_currency": "x", "to_currency": "x", "rate_deviation": {"$type": "number"}},
+     "sort": {"rate_deviation": 1, "id": 1}},
+    {"name": "listings: nearby", "collection": "listings",
+     "filter": {"status": "active", "location": {"$nearSphere": {
+         "$geometry": {"type": "Point", "coordinates": [0, 0]}, "$maxDistance": 75000
+     }}}},
+    {"name": "listings: search", "collection": "listings",
+     "filter": {"$text": {"$search": "x"}, "status": "active"}},
+    {"name": "listings: by user", "collection": "listings", "filter": {"user_id": "x", "status": "active"}},
+    {"name": "listings: expiry sync", "collection": "listings", "filter": {"status": "active", "expires_at": {"$lte": "x"}}},
+    {"name": "messages: user's chats", "collection": "messages",
+     "filter": {"$or": [{"sender_id": "x"}, {"recipient_id": "x"}]}},
+    {"name": "messages: unread count", "collection": "messages", "filter": {"recipient_id": "x", "read": False},
+     "sort": {"timestamp": -1}},
+    {"name": "messages: conversation", "collection": "messages", "filter": {"listing_id": "x", "$or": [
+        {"sender_id": "x", "recipient_id": "y"}, {"sender_id": "y", "recipient_id": "x"}
+    ]}, "sort": {"timestamp": 1}},
+    {"name": "notifications: by user", "collection": "notifications", "filter": {"user_id": "x"},
+     "sort": {"created_at": -1}},
+    {"name": "support: conversation by user", "collection": "support_conversations", "filter": {"user_id": "x"}},
+    {"name": "support: inactivity job", "collection": "support_conversations",
+     "filter": {"status": "open", "last_activity": {"$lt": "x"}}},
+    {"name": "support: unread for admin", "collection": "support_conversations",
+     "filter": {"unread_admin": {"$gt": 0}}, "sort": {"updated_at": -1}},
+    {"name": "exchange rates: latest", "collection": "exchange_rates", "filter": {}, "sort": {"last_updated": -1}},
+    {"name": "exchange rates: history", "collection": "exchange_rate_history",
+     "filter": {"recorded_at": {"$gte": "x"}}, "sort": {"recorded_at": 1}},
+    {"name": "exchanges: by user", "collection": "exchange_confirmations",
+     "filter": {"$or": [{"user1_id": "x"}, {"user2_id": "x"}]}, "sort": {"initiated_at": -1}},
+    {"name": "exchanges: expiry sync", "collection": "exchange_confirmations",
+     "filter": {"status": "pending", "deadline": {"$lte": "x"}}},
+    {"name": "meetups: by listing", "collection": "meetups", "filter": {"listing_id": "x"}, "sort": {"created_at": -1}},
+    {"name": "meetups: expiry sync", "collection": "meetups", "filter": {"status": "pending", "expires_at": {"$lte": "x"}}},
+    {"name": "blocks: either way", "collection": "user_blocks",
+     "filter": {"$or": [{"blocker_id": "x"}, {"blocked_id": "x"}]}},
+    {"name": "blocks: blocked by user", "collection": "user_blocks", "filter": {"blocker_id": "x"},
+     "sort": {"created_at": -1}},
+    {"name": "ratings: by rated user", "collection": "ratings", "filter": {"rated_user_id": "x"}},
+    {"name": "password reset token", "collection": "password_resets", "filter": {"token": "x", "used": False}},
+    {"name": "revocation sync", "collection": "revoked_tokens", "filter": {"revoked_at": {"$gte": "x"}}},
+    {"name": "email outbox claim", "collection": "email_outbox",
+     "filter": {"status": "pending", "next_attempt_at": {"$lte": "x"}}, "sort": {"next_attempt_at": 1}},
+]
+
+async def ensure_indexes():
+    """Create every index in INDEX_REGISTRY (a no-op for ones that already exist)"""
+    created = 0
+    for collection, specs in INDEX_REGISTRY.items():
+        for spec in specs:
+            options = {k: v for k, v in spec.items() if k not in ("keys", "fallback")}
+            try:
+                await db[collection].create_index(spec["keys"], **options)
+                created += 1
+            except (DuplicateKeyError, OperationFailure) as e:
+                fallback = spec.get("fallback")
+                if fallback is None:
+                    logger.error(f"❌ Could not create index {spec['keys']} on {collection}: {e}")
+                    continue
+                # Legacy duplicates block the unique index; keep lookups indexed until they are cleaned up
+                logger.error(f"❌ Duplicates in {collection} {spec['keys']}, unique index not created: {e}")
+                await db[collection].create_index(fallback["keys"], name=fallback["name"])
+            except Exception as e:
+                logger.error(f"❌ Could not create index {spec['keys']} on {collection}: {e}")
+    logger.info(f"🗂️ Ensured {created} indexes")
+
+async def bootstrap_indexes():
+    """Backfill fields that unique/geo/rate indexes depend on, then ensure the registry"""
+    await backfill_username_lower()
+    await backfill_listing_locations()
+    await backfill_listing_rates()
+    await ensure_indexes()
+
+def summarize_plan(plan: dict) -> dict:
+    """Walk an explain() winning plan and collect its stages and indexes"""
+    stages, indexes = [], []
+    pending = [plan]
+    while pending:
+        node = pending.pop()
+        if not isinstance(node, dict):
+            continue
+        if "stage" in node:
+            stages.append(node["stage"])
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        # Classic plans nest via inputStage(s); SBE plans wrap the tree in queryPlan
+        for key in ("inputStage", "queryPlan"):
+            pending.append(node.get(key))
+        pending.extend(node.get("inputStages", []))
+    return {
+        "stages": stages,
+        "indexes": sorted(set(indexes)),
+        "collection_scan": "COLLSCAN" in stages,
+        "in_memory_sort": "SORT" in stages
+    }
+
+async def audit_indexes() -> List[dict]:
+    """Explain every registered hot query and report whether an index serves it"""
+    report = []
+    for query in HOT_QUERIES:
+        command = {"find": query["collection"], "filter": query["filter"], "limit": 1}
+        if query.get("sort"):
+            command["sort"] = query["sort"]
+        entry = {"name": query["name"], "collection": query["collection"]}
+        try:
+            explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+            entry.update(summarize_plan(explain["queryPlanner"]["winningPlan"]))
+            entry["covered"] = not entry["collection_scan"] and not entry["in_memory_sort"]
+        except Exception as e:
+            entry.update({"covered": False, "error": str(e)})
+        report.append(entry)
+    return report
+
+@api_router.get("/admin/index-audit")
+async def get_index_audit(admin_user: dict = Depends(get_admin_claims)):
+    """Report, for every registered hot query shape, whether an index covers it"""
+    report = await audit_indexes()
+    return {
+        "queries": report,
+        "uncovered": [entry["name"] for entry in report if not entry["covered"]],
+        "generated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -3513,6 +6176,7 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+logging.getLogger("httpx").setLevel(logging.WARNING)  # don't log every outbound request
 
 # Scheduler for giveaway
 scheduler = AsyncIOScheduler()
@@ -3699,62 +6363,194 @@ async def auto_delete_old_messages():
     
     except Exception as e:
         logger.error(f"❌ Error deleting old messages: {e}")
-async def check_expired_listings():
-    """Check and expire listings older than 12 hours"""
-    try:
-        now = datetime.now(timezone.utc)
-        
-        # Find active listings that have expired
-        expired_listings = await db.listings.find({
-            "status": "active",
-            "expires_at": {"$lt": now.isoformat()}
-        }).to_list(1000)
-        
-        if expired_listings:
-            # Update to expired status
-            await db.listings.update_many(
-                {
-                    "status": "active",
-                    "expires_at": {"$lt": now.isoformat()}
-                },
-                {"$set": {"status": "expired"}}
+# Expiry for listings (expires_at), exchange confirmations (deadline) and
+# meetups (expires_at). Deadlines sit on a hashed timer wheel: one slot per
+# EXPIRY_TICK_SECONDS, EXPIRY_WHEEL_SLOTS slots per revolution; entries due on
+# a later revolution stay in their slot until their deadline has passed.
+# Each firing is a single conditional update on the document's id, so a
+# stale entry (item closed, republished, or expired by another worker) is a
+# no-op. Items are scheduled when created here, and sync() picks up anything
+# due within the lookahead window from the (status, deadline) indexes, which
+# covers startup and items created on other workers.
+EXPIRY_KINDS = {
+    "listing": {"collection": "listings", "field": "expires_at", "status": "active"},
+    "exchange": {"collection": "exchange_confirmations", "field": "deadline", "status": "pending"},
+    "meetup": {"collection": "meetups", "field": "expires_at", "status": "pending"},
+}
+
+class TimerWheel:
+    def __init__(self, slots: int, tick_seconds: float):
+        self.slots: List[Dict[tuple, float]] = [{} for _ in range(slots)]  # key: deadline (epoch seconds)
+        self.slot_of: Dict[tuple, int] = {}
+        self.tick_seconds = tick_seconds
+        self.current_tick = int(time.time() // tick_seconds)
+    
+    def __len__(self) -> int:
+        return len(self.slot_of)
+    
+    def add(self, key: tuple, deadline: float):
+        self.remove(key)
+        # Anything already due lands in the next tick
+        tick = max(math.ceil(deadline / self.tick_seconds), self.current_tick + 1)
+        slot = tick % len(self.slots)
+        self.slots[slot][key] = deadline
+        self.slot_of[key] = slot
+    
+    def remove(self, key: tuple):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            self.slots[slot].pop(key, None)
+    
+    def advance(self, now: float) -> List[tuple]:
+        """Move the wheel up to now and return the keys that came due"""
+        target = int(now // self.tick_seconds)
+        first = max(self.current_tick + 1, target - len(self.slots) + 1)
+        due = []
+        for tick in range(first, target + 1):
+            bucket = self.slots[tick % len(self.slots)]
+            for key in [key for key, deadline in bucket.items() if deadline <= now]:
+                del bucket[key]
+                del self.slot_of[key]
+                due.append(key)
+        self.current_tick = max(self.current_tick, target)
+        return due
+
+class ExpiryScheduler:
+    def __init__(self):
+        self.wheel = TimerWheel(EXPIRY_WHEEL_SLOTS, EXPIRY_TICK_SECONDS)
+        self.task: Optional[asyncio.Task] = None
+        self.expired = {kind: 0 for kind in EXPIRY_KINDS}
+        self.warned = 0
+        self.stale = 0
+        self.syncs = 0
+    
+    def schedule(self, kind: str, doc_id: str, deadline: datetime, warn: bool = True):
+        """(Re)schedule expiry, and the "expiring soon" warning if enabled"""
+        deadline_ts = as_utc(deadline).timestamp()
+        warn_ts = deadline_ts - EXPIRY_WARNING_MINUTES * 60
+        self.wheel.add((kind, doc_id, "expire"), deadline_ts)
+        # No warning for items already inside the warning window
+        if warn and EXPIRY_WARNING_MINUTES > 0 and kind in ("listing", "exchange") and warn_ts > time.time():
+            self.wheel.add((kind, doc_id, "warn"), warn_ts)
+        else:
+            self.wheel.remove((kind, doc_id, "warn"))
+    
+    def cancel(self, kind: str, doc_id: str):
+        self.wheel.remove((kind, doc_id, "expire"))
+        self.wheel.remove((kind, doc_id, "warn"))
+    
+    async def sync(self):
+        """Schedule everything due (or due a warning) within the lookahead window"""
+        horizon = datetime.now(timezone.utc) + timedelta(seconds=EXPIRY_SYNC_LOOKAHEAD_SECONDS, minutes=EXPIRY_WARNING_MINUTES)
+        for kind, spec in EXPIRY_KINDS.items():
+            field = spec["field"]
+            cursor = db[spec["collection"]].find(
+                {"status": spec["status"], field: {"$lte": horizon}},
+                {"_id": 0, "id": 1, field: 1, "expiry_warned": 1}
             )
-            logger.info(f"⏰ Expired {len(expired_listings)} listings")
-    except Exception as e:
-        logger.error(f"❌ Error checking expired listings: {e}")
-
-async def check_expired_exchanges():
-    """Check and expire exchange confirmations older than 12 hours"""
-    try:
+            async for doc in cursor:
+                if isinstance(doc.get(field), datetime):
+                    self.schedule(kind, doc["id"], doc[field], warn=not doc.get("expiry_warned"))
+        self.syncs += 1
+    
+    async def expire(self, kind: str, doc_id: str):
+        spec = EXPIRY_KINDS[kind]
         now = datetime.now(timezone.utc)
+        result = await db[spec["collection"]].update_one(
+            {"id": doc_id, "status": spec["status"], spec["field"]: {"$lte": now}},
+            {"$set": {"status": "expired"}}
+        )
+        if result.modified_count == 0:
+            self.stale += 1
+            return
+        self.expired[kind] += 1
+        if kind == "listing":
+            active_listing_index.remove(doc_id)
+            await change_counters.bump("listings")
+        logger.info(f"⏰ Expired {kind} {doc_id}")
+    
+    async def warn(self, kind: str, doc_id: str):
+        spec = EXPIRY_KINDS[kind]
+        warn_until = datetime.now(timezone.utc) + timedelta(minutes=EXPIRY_WARNING_MINUTES)
+        # Flag first so only one worker sends the warning
+        doc = await db[spec["collection"]].find_one_and_update(
+            {"id": doc_id, "status": spec["status"], "expiry_warned": {"$ne": True}, spec["field"]: {"$lte": warn_until}},
+            {"$set": {"expiry_warned": True}},
+            projection={"_id": 0}
+        )
+        if doc is None:
+            self.stale += 1
+            return
         
-        # Find pending exchanges that have expired
-        expired_exchanges = await db.exchange_confirmations.find({
-            "status": "pending",
-            "deadline": {"$lt": now.isoformat()}
-        }).to_list(1000)
-        
-        if expired_exchanges:
-            # Update to expired status
-            await db.exchange_confirmations.update_many(
-                {
-                    "status": "pending",
-                    "deadline": {"$lt": now.isoformat()}
-                },
-                {"$set": {"status": "expired"}}
-            )
-            logger.info(f"⏰ Expired {len(expired_exchanges)} exchange confirmations")
-    except Exception as e:
-        logger.error(f"❌ Error checking expired exchanges: {e}")
+        if kind == "listing":
+            notifications = [Notification(
+                user_id=doc["user_id"],
+                type="listing_expiring",
+                content=f"⏳ Your {doc['from_currency']} → {doc['to_currency']} listing expires in {EXPIRY_WARNING_MINUTES} minutes"
+            )]
+        else:
+            notifications = [
+                Notification(
+                    user_id=user_id,
+                    type="exchange_expiring",
+                    content=f"⏳ Exchange confirmation expires in {EXPIRY_WARNING_MINUTES} minutes"
+                )
+                for user_id in (doc["user1_id"], doc["user2_id"])
+            ]
+        await db.notifications.insert_many([n.model_dump() for n in notifications])
+        self.warned += 1
+    
+    async def fire(self, key: tuple):
+        kind, doc_id, action = key
+        try:
+            if action == "expire":
+                await self.expire(kind, doc_id)
+            else:
+                await self.warn(kind, doc_id)
+        except Exception as e:
+            # Leave it to the next sync to reschedule
+            logger.error(f"❌ Expiry error ({kind} {doc_id} {action}): {e}")
+    
+    async def run(self):
+        while True:
+            for key in self.wheel.advance(time.time()):
+                await self.fire(key)
+            await asyncio.sleep(EXPIRY_TICK_SECONDS)
+    
+    async def start(self):
+        try:
+            await self.sync()
+        except Exception as e:
+            logger.error(f"❌ Error loading expiry deadlines: {e}")
+        self.task = asyncio.create_task(self.run())
+    
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+    
+    def stats(self) -> dict:
+        return {
+            "scheduled": len(self.wheel),
+            "expired": dict(self.expired),
+            "warned": self.warned,
+            "stale": self.stale,
+            "syncs": self.syncs
+        }
+
+expiry_scheduler = ExpiryScheduler()
 
 async def fetch_exchange_rates():
     """Fetch live currency exchange rates and store in database"""
     try:
         # Using exchangerate-api.com free tier (1,500 requests/month)
         # Base currency: USD
-        api_url = "https://api.exchangerate-api.com/v4/latest/USD"
+        api_url = f"{EXCHANGE_RATE_API_URL}/USD"
         
-        response = requests.get(api_url, timeout=10)
+        response = await http_client.get(api_url, timeout=10)
         response.raise_for_status()
         
         data = response.json()
@@ -3766,7 +6562,7 @@ async def fetch_exchange_rates():
             "id": str(uuid.uuid4()),
             "base_currency": data.get("base", "USD"),
             "rates": data.get("rates", {}),
-            "last_updated": current_time.isoformat(),
+            "last_updated": current_time,
             "timestamp": data.get("time_last_updated", None)
         }
         
@@ -3774,12 +6570,18 @@ async def fetch_exchange_rates():
         await db.exchange_rates.delete_many({})  # Clear old rates
         await db.exchange_rates.insert_one(exchange_rate_doc)
         
+        await change_counters.bump("exchange_rates", changed_at=current_time)
+        
+        # Re-score active listings against the new rates
+        market_rates.set(exchange_rate_doc)
+        await refresh_listing_rate_scores()
+        
         # Save historical data for trend analysis
         historical_doc = {
             "id": str(uuid.uuid4()),
             "base_currency": data.get("base", "USD"),
             "rates": data.get("rates", {}),
-            "recorded_at": current_time.isoformat(),
+            "recorded_at": current_time,
             "date": current_time.strftime("%Y-%m-%d"),
             "timestamp": current_time.timestamp()
         }
@@ -3788,12 +6590,12 @@ async def fetch_exchange_rates():
         # Clean up old historical data (keep only last 30 days)
         thirty_days_ago = current_time - timedelta(days=30)
         await db.exchange_rate_history.delete_many({
-            "recorded_at": {"$lt": thirty_days_ago.isoformat()}
+            "recorded_at": {"$lt": thirty_days_ago}
         })
         
         logger.info(f"💱 Successfully updated exchange rates with {len(exchange_rate_doc['rates'])} currencies and saved to history")
         
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"❌ Error fetching exchange rates from API: {e}")
     except Exception as e:
         logger.error(f"❌ Error updating exchange rates in database: {e}")
@@ -3833,20 +6635,14 @@ async def startup_scheduler():
         replace_existing=True
     )
     
-    # Check expired listings every 30 minutes
-    scheduler.add_job(
-        check_expired_listings,
-        CronTrigger(minute="*/30"),  # Every 30 minutes
-        id="check_expired_listings",
-        replace_existing=True
-    )
-    
-    # Check expired exchanges every 30 minutes
+    # Pick up deadlines coming into range (including ones set by other workers)
     scheduler.add_job(
-        check_expired_exchanges,
-        CronTrigger(minute="*/30"),  # Every 30 minutes
-        id="check_expired_exchanges",
-        replace_existing=True
+        expiry_scheduler.sync,
+        IntervalTrigger(seconds=EXPIRY_SYNC_INTERVAL_SECONDS),
+        id="expiry_sync",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
     )
     
     # Fetch exchange rates every 5 hours
@@ -3857,6 +6653,73 @@ async def startup_scheduler():
         replace_existing=True
     )
     
+    # Flush buffered presence updates every few seconds
+    scheduler.add_job(
+        presence_tracker.flush,
+        IntervalTrigger(seconds=PRESENCE_FLUSH_INTERVAL_SECONDS),
+        id="presence_flush",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Flush buffered listing views as batched $inc updates
+    scheduler.add_job(
+        listing_view_counter.flush,
+        IntervalTrigger(seconds=VIEW_FLUSH_INTERVAL_SECONDS),
+        id="listing_view_flush",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Convert legacy ISO-string timestamps to dates before serving, so expiry
+    # and range queries (which only match dates) see every document. Once
+    # recorded complete in db.migrations this is a single lookup.
+    await migrate_timestamps_to_dates()
+    
+    # Seed the member number counter from existing users if it's missing
+    try:
+        await member_number_sequence.ensure_seeded()
+    except Exception as e:
+        logger.error(f"❌ Error seeding member number counter: {e}")
+    
+    # Sync revoked tokens from other workers
+    scheduler.add_job(
+        revocation_list.sync,
+        IntervalTrigger(seconds=REVOCATION_SYNC_INTERVAL_SECONDS),
+        id="token_revocation_sync",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Load the revocation list before the first scheduled sync
+    asyncio.create_task(revocation_list.sync())
+    
+    # Backfill indexed fields, then ensure every registered index, in the background
+    asyncio.create_task(bootstrap_indexes())
+    
+    # Move legacy blocked_users arrays into user_blocks
+    asyncio.create_task(migrate_blocked_users())
+    
+    # Load active listings into memory, then keep in sync with other workers
+    asyncio.create_task(active_listing_index.rebuild())
+    scheduler.add_job(
+        active_listing_index.rebuild,
+        IntervalTrigger(seconds=LISTING_INDEX_REFRESH_SECONDS),
+        id="active_listing_index_rebuild",
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    
+    # Deliver queued emails in the background
+    await email_outbox.start()
+    
+    # Expire listings, exchanges and meetups as their deadlines pass
+    await expiry_scheduler.start()
+    
     # Fetch exchange rates immediately on startup
     asyncio.create_task(fetch_exchange_rates())
     
@@ -3867,6 +6730,13 @@ async def startup_scheduler():
 async def shutdown_all():
     """Uygulama kapandığında temizlik yap"""
     scheduler.shutdown()
+    await presence_tracker.flush()
+    await listing_view_counter.flush()
+    await expiry_scheduler.stop()
+    await email_outbox.stop()
+    password_hasher.shutdown()
+    image_processor.shutdown()
+    await http_client.aclose()
     client.close()
     logger.info("🛑 Scheduler ve MongoDB bağlantısı kapatıldı")
 
@@ -3876,4 +6746,5 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
\ No newline at end of file
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Serialization benchmark for the large list endpoints.
+
+Compares, per endpoint, FastAPI's response_model path (validate every row,
+jsonable_encoder, stdlib json) with the fast path the endpoints now use
+(project each row onto the model fields + orjson, or plain orjson for
+raw admin dumps),
+on synthetic documents shaped like the ones read from Mongo.
+
+Usage (from the repo root):
+    MONGO_URL=mongodb://localhost:27017 DB_NAME=bench python bench_serialization.py [--rows 1000] [--repeat 20]
+
+No database connection is made; server.py is only imported for its models
+and routes.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import APIRoute, serialize_response  # noqa: E402
+
+import server  # noqa: E402
+
+NOW = datetime.now(timezone.utc)
+
+
+def listing_doc(i):
+    return {
+        "id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "username": f"user{i}",
+        "from_currency": "USD", "from_amount": 100.0 + i, "to_currency": "TRY", "to_amount": 3400.0 + i,
+        "country": "TR", "city": "Istanbul", "description": "Cash exchange near Taksim " * 3,
+        "status": "active", "photos": [f"{i}_a.jpg", f"{i}_b.jpg"],
+        "created_at": NOW - timedelta(minutes=i), "expires_at": NOW + timedelta(hours=12),
+        "latitude": 41.03, "longitude": 28.98,
+        "location": {"type": "Point", "coordinates": [28.98, 41.03]}
+    }
+
+
+def message_doc(i):
+    return {
+        "id": str(uuid.uuid4()), "listing_id": str(uuid.uuid4()), "sender_id": "a", "sender_username": "alice",
+        "recipient_id": "b", "content": "Hello, is this still available? " * 2, "read": i % 2 == 0,
+        "timestamp": NOW - timedelta(seconds=i), "deleted_by": []
+    }
+
+
+def notification_doc(i):
+    return {
+        "id": str(uuid.uuid4()), "user_id": "a", "type": "message",
+        "content": f"New message from user{i}", "read": False, "created_at": NOW - timedelta(seconds=i)
+    }
+
+
+def chat_doc(i):
+    return {
+        "listing_id": str(uuid.uuid4()),
+        "other_user": {"id": str(uuid.uuid4()), "username": f"user{i}", "email": f"user{i}@example.com",
+                       "country": "TR", "languages": ["tr", "en"], "rating": 4.5, "created_at": NOW},
+        "listing_from_currency": "USD", "listing_to_currency": "TRY",
+        "last_message": "See you at 5", "last_message_time": NOW - timedelta(seconds=i), "unread_count": i % 3
+    }
+
+
+# (label, route path, response model, document factory)
+ENDPOINTS = [
+    ("GET /listings", "/api/listings", server.Listing, listing_doc),
+    ("GET /listings/nearby", "/api/listings/nearby", server.Listing, listing_doc),
+    ("GET /messages/{listing}/{user}", "/api/messages/{listing_id}/{other_user_id}", server.Message, message_doc),
+    ("GET /notifications", "/api/notifications", server.Notification, notification_doc),
+    ("GET /chats", "/api/chats", server.Chat, chat_doc),
+]
+
+# Raw admin dumps (no response_model): jsonable_encoder + json vs orjson
+RAW_ENDPOINTS = [
+    ("GET /admin/listings", listing_doc),
+    ("GET /admin/messages", message_doc),
+]
+
+
+def find_route(path):
+    for route in server.app.routes:
+        if isinstance(route, APIRoute) and route.path == path and "GET" in route.methods:
+            return route
+    raise LookupError(path)
+
+
+def timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list endpoint serialization")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    print(f"{'endpoint':34} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+
+    for label, path, model, factory in ENDPOINTS:
+        docs = [factory(i) for i in range(args.rows)]
+        field = find_route(path).response_field
+
+        def before():
+            content = loop.run_until_complete(serialize_response(field=field, response_content=docs))
+            return JSONResponse(content).body
+
+        def after():
+            return server.trusted_list_response(model, docs).body
+
+        # Both paths must produce the same document
+        assert server.json.loads(before()) == server.json.loads(after()), label
+        t_before, t_after = timed(before, args.repeat), timed(after, args.repeat)
+        print(f"{label:34} {t_before * 1000:10.2f} {t_after * 1000:10.2f} {t_before / t_after:7.1f}x")
+
+    for label, factory in RAW_ENDPOINTS:
+        docs = [factory(i) for i in range(args.rows)]
+
+        def before():
+            return JSONResponse(jsonable_encoder(docs)).body
+
+        def after():
+            return server.ORJSONResponse(docs).body
+
+        assert server.json.loads(before()) == server.json.loads(after()), label
+        t_before, t_after = timed(before, args.repeat), timed(after, args.repeat)
+        print(f"{label:34} {t_before * 1000:10.2f} {t_after * 1000:10.2f} {t_before / t_after:7.1f}x")
+
+    print(f"\n{args.rows} rows per response, best of {args.repeat}")
+
+
+if __name__ == "__main__":
+    main()
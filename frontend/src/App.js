@@ -46,6 +46,40 @@ axios.interceptors.request.use((config) => {
   return config;
 });
 
+// Access tokens are short-lived: on 401, refresh once and retry the request
+let refreshPromise = null;
+axios.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const originalRequest = error.config;
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (
+      error.response?.status !== 401 ||
+      !refreshToken ||
+      !originalRequest ||
+      originalRequest._retried ||
+      originalRequest.url?.endsWith('/auth/refresh')
+    ) {
+      return Promise.reject(error);
+    }
+
+    originalRequest._retried = true;
+    try {
+      // Share one refresh between requests that fail at the same time
+      refreshPromise = refreshPromise || axios.post(`${API}/auth/refresh`, { refresh_token: refreshToken });
+      const { data } = await refreshPromise;
+      localStorage.setItem('token', data.token);
+      localStorage.setItem('refresh_token', data.refresh_token);
+    } catch (refreshError) {
+      localStorage.removeItem('refresh_token');
+      return Promise.reject(error);
+    } finally {
+      refreshPromise = null;
+    }
+    return axios(originalRequest);
+  }
+);
+
 function App() {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -113,6 +147,7 @@ function App() {
         setUser(response.data);
       } catch (error) {
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
       }
     }
     
@@ -122,7 +157,17 @@ function App() {
   };
 
   const logout = () => {
+    // Revoke tokens server-side; don't block the UI on it. The request
+    // interceptor runs after storage is cleared below, so the access token
+    // has to be attached here.
+    const token = localStorage.getItem('token');
+    axios.post(
+      `${API}/auth/logout`,
+      { refresh_token: localStorage.getItem('refresh_token') },
+      { headers: { Authorization: `Bearer ${token}` } }
+    ).catch(() => {});
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     setUser(null);
     window.location.href = '/';
   };
@@ -80,6 +80,7 @@ export default function Dashboard({ user, logout, unreadCount = 0, setUser }) {
           
           // Store JWT token
           localStorage.setItem('token', response.data.jwt_token);
+          localStorage.setItem('refresh_token', response.data.refresh_token);
           
           console.log('✅ Token stored');
           
@@ -68,6 +68,7 @@ export default function LandingPage({ setUser }) {
 
       const response = await axios.post(`${API}${endpoint}`, payload);
       localStorage.setItem('token', response.data.token);
+      localStorage.setItem('refresh_token', response.data.refresh_token);
       setUser(response.data.user);
     } catch (err) {
       setError(err.response?.data?.detail || "An error occurred");
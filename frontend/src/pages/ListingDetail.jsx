@@ -124,7 +124,7 @@ export default function ListingDetail({ user, logout }) {
                   {listing.photos.map((photo, index) => (
                     <img
                       key={index}
-                      src={`${API}/uploads/${photo}`}
+                      src={`${API}/uploads/${listing.photo_variants?.find((variant) => variant.filename === photo)?.medium?.filename || photo}`}
                       alt={`Listing photo ${index + 1}`}
                       className="w-full h-48 object-cover rounded-lg border border-gray-200 dark:border-gray-700"
                     />
@@ -82,7 +82,8 @@ export default function Profile({ user, logout, unreadCount = 0 }) {
 
       setProfileUser({
         ...profileUser,
-        profile_photo: response.data.profile_photo
+        profile_photo: response.data.profile_photo,
+        profile_photo_variants: response.data.profile_photo_variants
       });
 
       toast({
@@ -117,7 +118,8 @@ export default function Profile({ user, logout, unreadCount = 0 }) {
 
       setProfileUser({
         ...profileUser,
-        profile_photo: null
+        profile_photo: null,
+        profile_photo_variants: null
       });
 
       toast({
@@ -505,7 +507,7 @@ export default function Profile({ user, logout, unreadCount = 0 }) {
                   <div className="relative w-24 h-24 mx-auto mb-4">
                     {profileUser?.profile_photo ? (
                       <img 
-                        src={`${API}${profileUser.profile_photo}`}
+                        src={`${API}${profileUser.profile_photo_variants?.thumb?.url || profileUser.profile_photo}`}
                         alt={profileUser?.username}
                         className="w-24 h-24 rounded-full object-cover border-4 border-teal-500"
                       />
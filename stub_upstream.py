@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Local stub for the external APIs the backend calls, so outbound HTTP
+(exchange rates, Emergent Auth) can be exercised offline.
+
+Usage:
+    python stub_upstream.py --port 8099 [--delay 0.5] [--fail-rate 0.3]
+
+Then start the backend with:
+    EXCHANGE_RATE_API_URL=http://127.0.0.1:8099/v4/latest
+    EMERGENT_AUTH_SESSION_URL=http://127.0.0.1:8099/auth/v1/env/oauth/session-data
+"""
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_RATES_USD = {
+    "USD": 1.0, "EUR": 0.92, "TRY": 34.5, "GBP": 0.79,
+    "AED": 3.67, "SAR": 3.75, "JPY": 149.8, "CHF": 0.88,
+    "CAD": 1.36, "AUD": 1.53, "CNY": 7.24, "INR": 83.2,
+    "KRW": 1342.5, "RUB": 96.8, "BRL": 5.15, "MXN": 17.2
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+    delay = 0.0
+    fail_rate = 0.0
+
+    def send_json(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.delay:
+            time.sleep(self.delay)
+        if random.random() < self.fail_rate:
+            self.send_json(503, {"error": "stub failure"})
+            return
+
+        path = self.path.split("?")[0]
+        if path.startswith("/v4/latest/"):
+            base = path.rsplit("/", 1)[-1].upper()
+            if base not in MOCK_RATES_USD:
+                self.send_json(404, {"error": "unsupported currency"})
+                return
+            base_rate = MOCK_RATES_USD[base]
+            now = datetime.now(timezone.utc)
+            self.send_json(200, {
+                "base": base,
+                "date": now.strftime("%Y-%m-%d"),
+                "time_last_updated": int(now.timestamp()),
+                "rates": {code: round(rate / base_rate, 6) for code, rate in MOCK_RATES_USD.items()}
+            })
+        elif path == "/auth/v1/env/oauth/session-data":
+            session_id = self.headers.get("X-Session-ID")
+            if not session_id:
+                self.send_json(400, {"error": "missing session id"})
+                return
+            self.send_json(200, {
+                "email": f"{session_id}@example.com",
+                "name": f"stub{session_id[:6]}",
+                "picture": None,
+                "session_token": f"stub-session-{session_id}"
+            })
+        else:
+            self.send_json(404, {"error": "not found"})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub upstream APIs for offline backend testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before each response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    StubHandler.delay = args.delay
+    StubHandler.fail_rate = args.fail_rate
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"🧪 Stub upstream listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
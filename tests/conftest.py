@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """An empty mongomock database standing in for server.db"""
+    database = AsyncMongoMockClient(tz_aware=True)["test"]
+    monkeypatch.setattr(server, "db", database)
+    return database
+
+
+@pytest.fixture
+def make_listing():
+    """Factory for active listing documents; created_at counts back from now
+    so listings built later are older unless created_at is given"""
+    now = datetime.now(timezone.utc)
+    count = 0
+
+    def make(**fields):
+        nonlocal count
+        count += 1
+        listing = {
+            "id": str(uuid.uuid4()),
+            "user_id": "seller",
+            "username": "seller",
+            "from_currency": "USD",
+            "from_amount": 100.0,
+            "to_currency": "TRY",
+            "to_amount": 3400.0,
+            "country": "TR",
+            "city": "Istanbul",
+            "description": "Cash exchange",
+            "status": "active",
+            "photos": [],
+            "created_at": now - timedelta(minutes=count),
+            "expires_at": now + timedelta(hours=12),
+            "latitude": None,
+            "longitude": None,
+        }
+        listing.update(fields)
+        return listing
+
+    return make
+
+
+class Clock:
+    """time.monotonic() plus an offset that tests move forward by hand. Real
+    time keeps running underneath so the event loop's timers still work."""
+
+    def __init__(self):
+        self.offset = 0.0
+        self.real_monotonic = time.monotonic
+
+    def __call__(self):
+        return self.real_monotonic() + self.offset
+
+    def advance(self, seconds):
+        self.offset += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = Clock()
+    monkeypatch.setattr(server.time, "monotonic", fake)
+    return fake
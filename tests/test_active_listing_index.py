@@ -0,0 +1,135 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+ISTANBUL = (41.0082, 28.9784)
+IZMIT = (40.7654, 29.9408)  # ~85 km from Istanbul
+ANKARA = (39.9334, 32.8597)  # ~350 km from Istanbul
+
+
+def index_of(*listings):
+    index = server.ActiveListingIndex()
+    for listing in listings:
+        index.upsert(listing)
+    return index
+
+
+def ids(listings):
+    return [listing["id"] for listing in listings]
+
+
+def test_browse_is_newest_first_and_filtered(make_listing):
+    newest = make_listing()
+    eur = make_listing(to_currency="EUR")
+    german = make_listing(country="DE")
+    oldest = make_listing()
+    index = index_of(oldest, german, eur, newest)
+
+    assert ids(index.browse()) == ids([newest, eur, german, oldest])
+    assert ids(index.browse(country="TR")) == ids([newest, eur, oldest])
+    assert ids(index.browse(country="TR", from_currency="USD", to_currency="TRY")) == ids([newest, oldest])
+    assert ids(index.browse(to_currency="EUR")) == ids([eur])
+    assert ids(index.browse(limit=2)) == ids([newest, eur])
+
+
+def test_browse_skips_expired_and_excluded_users(make_listing):
+    live = make_listing()
+    expired = make_listing(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    blocked = make_listing(user_id="blocked")
+    index = index_of(live, expired, blocked)
+
+    assert ids(index.browse(exclude_user_ids={"blocked"})) == ids([live])
+
+
+def test_upsert_of_inactive_listing_removes_it(make_listing):
+    listing = make_listing()
+    index = index_of(listing)
+    index.upsert({**listing, "status": "archived"})
+
+    assert index.browse() == []
+    assert index.by_country == {} and index.by_pair == {}
+
+
+def test_remove_user(make_listing):
+    keep, drop = make_listing(user_id="a"), make_listing(user_id="b")
+    index = index_of(keep, drop)
+    index.remove_user("b")
+
+    assert ids(index.browse()) == ids([keep])
+
+
+async def test_rebuild_loads_active_listings_and_parses_dates(db, make_listing):
+    active = make_listing()
+    active["created_at"] = active["created_at"].isoformat()  # legacy string timestamp
+    await db.listings.insert_many([active, make_listing(status="expired")])
+    index = server.ActiveListingIndex()
+
+    await index.rebuild()
+
+    assert index.ready
+    assert ids(index.browse()) == [active["id"]]
+    assert isinstance(index.listings[active["id"]]["created_at"], datetime)
+
+
+def test_nearby_sorts_by_distance_within_radius(make_listing):
+    istanbul = make_listing(latitude=ISTANBUL[0], longitude=ISTANBUL[1])
+    izmit = make_listing(latitude=IZMIT[0], longitude=IZMIT[1])
+    ankara = make_listing(latitude=ANKARA[0], longitude=ANKARA[1])
+    unlocated = make_listing()
+    index = index_of(ankara, izmit, istanbul, unlocated)
+
+    results = index.nearby(*ISTANBUL, radius_km=100, limit=10)
+
+    assert ids(results) == ids([istanbul, izmit])
+    assert results[0]["distance"] == 0
+    assert 80 < results[1]["distance"] < 90
+    assert ids(index.nearby(*ISTANBUL, radius_km=400, limit=10)) == ids([istanbul, izmit, ankara])
+    assert ids(index.nearby(*ISTANBUL, radius_km=400, limit=1)) == ids([istanbul])
+
+
+def test_wide_radius_scans_occupied_cells_with_same_results(make_listing, monkeypatch):
+    listings = [
+        make_listing(latitude=lat, longitude=lng)
+        for lat, lng in (ISTANBUL, IZMIT, ANKARA, (52.52, 13.405), (-33.87, 151.21))
+    ]
+    index = index_of(*listings)
+    expected = ids(index.nearby(*ISTANBUL, radius_km=3000, limit=10))
+
+    def no_enumeration(*args):
+        raise AssertionError("cells enumerated for a radius wider than the index")
+
+    monkeypatch.setattr(server, "geohash_cells_within", no_enumeration)
+    assert ids(index.nearby(*ISTANBUL, radius_km=3000, limit=10)) == expected
+    assert len(index.nearby(*ISTANBUL, radius_km=20000, limit=10)) == 5
+
+
+def test_geohash_cell_estimate_bounds_enumeration():
+    for latitude, radius in ((41.0, 5), (41.0, 75), (0.0, 300), (70.0, 500)):
+        cells = server.geohash_cells_within(latitude, 29.0, radius)
+        assert len(cells) <= server.geohash_cell_estimate(latitude, radius)
+
+
+def test_nearby_endpoint_caps_radius(make_listing, monkeypatch):
+    index = index_of(make_listing(latitude=ISTANBUL[0], longitude=ISTANBUL[1]))
+    index.ready = True
+    monkeypatch.setattr(server, "active_listing_index", index)
+    seen = []
+    real_nearby = index.nearby
+    monkeypatch.setattr(index, "nearby", lambda lat, lng, radius, *args: seen.append(radius) or real_nearby(lat, lng, radius, *args))
+    client = TestClient(server.app)
+
+    started = time.perf_counter()
+    response = client.get("/api/listings/nearby", params={"lat": ISTANBUL[0], "lng": ISTANBUL[1], "radius": 20000})
+
+    assert response.status_code == 200
+    assert time.perf_counter() - started < 1
+    assert seen == [server.NEARBY_MAX_RADIUS_KM]
+    assert len(response.json()) == 1
+    client.get("/api/listings/nearby", params={"lat": 0, "lng": 0, "radius": -5})
+    assert seen[-1] == 0
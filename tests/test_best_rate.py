@@ -0,0 +1,92 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def test_market_rate_crosses_through_the_base_currency():
+    rates = server.MarketRates(ttl_seconds=60)
+    rates.set({"base_currency": "USD", "rates": {"TRY": 34.0, "EUR": 0.9}})
+
+    assert rates.rate("USD", "TRY") == 34.0
+    assert rates.rate("eur", "try") == pytest.approx(34.0 / 0.9)
+    assert rates.rate("USD", "XYZ") is None
+    assert rates.rate(None, "TRY") is None
+
+
+@pytest.mark.parametrize("from_amount, to_amount, market_rate, deviation", [
+    (100, 3400, 34.0, 0.0),
+    (100, 3230, 34.0, -5.0),
+    (100, 3500, 34.0, 2.9412),
+    (100, 3400, None, None),
+    (0, 3400, 34.0, None),
+    (100, -1, 34.0, None),
+])
+def test_listing_rate_fields(from_amount, to_amount, market_rate, deviation):
+    fields = server.listing_rate_fields({"from_amount": from_amount, "to_amount": to_amount}, market_rate)
+    assert fields["rate_deviation"] == deviation
+    assert fields["market_rate"] == market_rate
+
+
+async def test_listing_rate_scores_use_the_latest_rates(db, monkeypatch):
+    monkeypatch.setattr(server, "market_rates", server.MarketRates(ttl_seconds=60))
+    await db.exchange_rates.insert_one({"base_currency": "USD", "rates": {"TRY": 34.0}, "last_updated": 1})
+
+    scores = await server.listing_rate_scores({"from_currency": "USD", "from_amount": 100, "to_currency": "TRY", "to_amount": 3230})
+
+    assert scores == {"implied_rate": 32.3, "market_rate": 34.0, "rate_deviation": -5.0}
+
+
+def test_browse_best_rate_is_cheapest_first_and_skips_unscored(make_listing):
+    index = server.ActiveListingIndex()
+    cheap = make_listing(id="b", rate_deviation=-5.0)
+    tie = make_listing(id="a", rate_deviation=-5.0)
+    dear = make_listing(id="c", rate_deviation=3.0)
+    eur = make_listing(id="d", rate_deviation=-10.0, to_currency="EUR")
+    for listing in (dear, make_listing(rate_deviation=None), cheap, eur, tie):
+        index.upsert(listing)
+
+    assert [listing["id"] for listing in index.browse(sort="best_rate")] == ["d", "a", "b", "c"]
+    assert [listing["id"] for listing in index.browse("TR", "USD", "TRY", sort="best_rate")] == ["a", "b", "c"]
+    assert [listing["id"] for listing in index.browse(sort="best_rate", after=(-5.0, "a"))] == ["b", "c"]
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def listings_api(request, db, monkeypatch):
+    index = server.ActiveListingIndex()
+    index.ready = request.param == "memory"
+    monkeypatch.setattr(server, "active_listing_index", index)
+    monkeypatch.setattr(server, "change_counters", server.ChangeCounters(("listings", "user_blocks")))
+
+    async def store(*listings):
+        await db.listings.insert_many([dict(listing) for listing in listings])
+        for listing in listings:
+            index.upsert(listing)
+
+    return TestClient(server.app), store
+
+
+async def test_endpoint_pages_by_rate(listings_api, make_listing):
+    client, store = listings_api
+    deviations = [4.0, -2.0, 0.5, -2.0, 7.5]
+    listings = [make_listing(id=f"l{i}", rate_deviation=deviation) for i, deviation in enumerate(deviations)]
+    await store(*listings, make_listing(id="unscored", rate_deviation=None))
+
+    pages, cursor = [], None
+    while True:
+        params = {"sort": "best_rate", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/listings", params=params)
+        assert response.status_code == 200
+        pages.append([listing["id"] for listing in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert pages == [["l1", "l3"], ["l2", "l0"], ["l4"]]
+
+
+def test_endpoint_rejects_unknown_sort(listings_api):
+    client, _ = listings_api
+    assert client.get("/api/listings", params={"sort": "cheapest"}).status_code == 400
@@ -0,0 +1,107 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def blocks(db):
+    async def store(*pairs):
+        await db.user_blocks.insert_many([{"blocker_id": blocker, "blocked_id": blocked} for blocker, blocked in pairs])
+    return store
+
+
+async def test_loads_both_directions(db, blocks):
+    await blocks(("a", "b"), ("c", "a"), ("b", "c"))
+    cache = server.BlockCache(max_size=10, ttl_seconds=60)
+
+    assert await cache.blocking("a") == {"b"}
+    assert await cache.blocked_by("a") == {"c"}
+    assert await cache.hidden_ids("a") == {"b", "c"}
+    assert await cache.hidden_ids("nobody") == frozenset()
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["hits"] == 2
+
+
+async def test_entries_expire_after_ttl(db, blocks, clock):
+    cache = server.BlockCache(max_size=10, ttl_seconds=60)
+    assert await cache.hidden_ids("a") == frozenset()
+    await blocks(("a", "b"))
+
+    clock.advance(59)
+    assert await cache.hidden_ids("a") == frozenset()
+    clock.advance(2)
+    assert await cache.hidden_ids("a") == {"b"}
+
+
+async def test_invalidate_reloads(db, blocks):
+    cache = server.BlockCache(max_size=10, ttl_seconds=60)
+    await cache.hidden_ids("a")
+    await cache.hidden_ids("b")
+    await blocks(("a", "b"))
+
+    cache.invalidate("a", "b")
+
+    assert await cache.blocking("a") == {"b"}
+    assert await cache.blocked_by("b") == {"a"}
+
+
+async def test_evicts_least_recently_used(db):
+    cache = server.BlockCache(max_size=2, ttl_seconds=60)
+    await cache.hidden_ids("a")
+    await cache.hidden_ids("b")
+    await cache.hidden_ids("a")
+    await cache.hidden_ids("c")
+
+    assert list(cache.entries) == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.fixture
+def migration_env(db, monkeypatch):
+    monkeypatch.setattr(server, "block_cache", server.BlockCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(server, "change_counters", server.ChangeCounters(("user_blocks",)))
+    return db
+
+
+async def block_rows(db):
+    rows = await db.user_blocks.find({}, {"_id": 0, "blocker_id": 1, "blocked_id": 1}).to_list(None)
+    return sorted((row["blocker_id"], row["blocked_id"]) for row in rows)
+
+
+async def test_migration_moves_arrays_into_user_blocks(migration_env):
+    db = migration_env
+    await db.users.insert_many([
+        {"id": "a", "blocked_users": ["b", "c", "b"]},
+        {"id": "b", "blocked_users": []},
+        {"id": "c"},
+    ])
+    await db.user_blocks.insert_one({"blocker_id": "a", "blocked_id": "c"})  # already moved
+    server.block_cache.entries["a"] = (float("inf"), frozenset(), frozenset())
+
+    await server.migrate_blocked_users(batch_size=1)
+
+    assert await block_rows(db) == [("a", "b"), ("a", "c")]
+    assert await db.users.count_documents({"blocked_users": {"$exists": True}}) == 0
+    assert server.block_cache.entries == {}
+    assert server.change_counters.versions["user_blocks"][0] == 1
+    assert (await db.migrations.find_one({"_id": "blocked_users_to_user_blocks"}))["completed_at"]
+
+
+async def test_migration_is_idempotent(migration_env):
+    db = migration_env
+    await db.users.insert_one({"id": "a", "blocked_users": ["b"]})
+    await server.migrate_blocked_users()
+
+    # A completed migration doesn't look again
+    await db.users.update_one({"id": "a"}, {"$set": {"blocked_users": ["z"]}})
+    await server.migrate_blocked_users()
+    assert await block_rows(db) == [("a", "b")]
+
+    # Re-running an interrupted one (rows written, arrays not yet unset) adds no duplicates
+    await db.migrations.delete_many({})
+    await db.users.update_one({"id": "a"}, {"$set": {"blocked_users": ["b"]}})
+    await server.migrate_blocked_users()
+    assert await block_rows(db) == [("a", "b")]
+    assert server.change_counters.versions["user_blocks"][0] == 2
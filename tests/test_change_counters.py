@@ -0,0 +1,176 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def make_request(**headers):
+    return Request({"type": "http", "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]})
+
+
+async def test_bump_changes_the_etag_only_for_that_collection(db):
+    counters = server.ChangeCounters(("listings", "ratings"))
+    listings_etag, _ = await counters.validators(("listings",), "listings")
+    ratings_etag, _ = await counters.validators(("ratings",), "ratings")
+
+    await counters.bump("listings")
+
+    assert (await counters.validators(("listings",), "listings"))[0] != listings_etag
+    assert (await counters.validators(("ratings",), "ratings"))[0] == ratings_etag
+    assert counters.stats()["versions"] == {"listings": 1}
+
+
+async def test_variant_and_last_modified(db):
+    counters = server.ChangeCounters(("listings",))
+    changed_at = datetime(2026, 5, 1, 12, tzinfo=timezone.utc)
+    await counters.bump("listings", changed_at)
+    await counters.bump("listings", changed_at - timedelta(hours=1))  # $max keeps the later time
+
+    etag, last_modified = await counters.validators(("listings",), "listings", "viewer-a")
+
+    assert etag != (await counters.validators(("listings",), "listings", "viewer-b"))[0]
+    assert last_modified == changed_at
+
+
+async def test_other_workers_bumps_seen_after_sync_interval(db, clock):
+    worker_a, worker_b = server.ChangeCounters(("listings",)), server.ChangeCounters(("listings",))
+    before, _ = await worker_b.validators(("listings",), "listings")
+
+    await worker_a.bump("listings")
+
+    assert (await worker_b.validators(("listings",), "listings"))[0] == before
+    clock.advance(server.CHANGE_COUNTER_SYNC_SECONDS)
+    assert (await worker_b.validators(("listings",), "listings"))[0] == (await worker_a.validators(("listings",), "listings"))[0]
+
+
+@pytest.mark.parametrize("headers, fresh", [
+    ({"if_none_match": '"abc"'}, True),
+    ({"if_none_match": 'W/"abc"'}, True),
+    ({"if_none_match": '"old", "abc"'}, True),
+    ({"if_none_match": "*"}, True),
+    ({"if_none_match": '"old"'}, False),
+    # If-None-Match wins over If-Modified-Since
+    ({"if_none_match": '"old"', "if_modified_since": "Fri, 01 May 2026 13:00:00 GMT"}, False),
+    ({"if_modified_since": "Fri, 01 May 2026 12:00:00 GMT"}, True),
+    ({"if_modified_since": "Fri, 01 May 2026 11:59:59 GMT"}, False),
+    ({"if_modified_since": "not a date"}, False),
+    ({}, False),
+])
+def test_not_modified(headers, fresh):
+    counters = server.ChangeCounters(("listings",))
+    last_modified = datetime(2026, 5, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)
+
+    response = counters.not_modified(make_request(**headers), '"abc"', last_modified)
+
+    if fresh:
+        assert response.status_code == 304
+        assert response.headers["etag"] == '"abc"'
+        assert response.headers["last-modified"] == format_datetime(last_modified.replace(microsecond=0), usegmt=True)
+    else:
+        assert response is None
+
+
+@pytest.fixture
+def listings_client(db, monkeypatch):
+    index = server.ActiveListingIndex()
+    index.ready = True
+    monkeypatch.setattr(server, "active_listing_index", index)
+    monkeypatch.setattr(server, "change_counters", server.ChangeCounters(("listings", "user_blocks")))
+    return TestClient(server.app), index
+
+
+async def test_listings_revalidate_to_304_until_a_write(listings_client, make_listing):
+    client, index = listings_client
+    index.upsert(make_listing())
+    await server.change_counters.bump("listings")
+
+    first = client.get("/api/listings", params={"country": "TR"})
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.headers["cache-control"] == "no-cache"
+
+    assert client.get("/api/listings", params={"country": "TR"}, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/api/listings", params={"country": "DE"}, headers={"If-None-Match": etag}).status_code == 200
+    assert client.get("/api/listings", params={"country": "TR"},
+                      headers={"If-Modified-Since": first.headers["last-modified"]}).status_code == 304
+
+    index.upsert(make_listing())
+    await server.change_counters.bump("listings")
+
+    second = client.get("/api/listings", params={"country": "TR"}, headers={"If-None-Match": etag})
+    assert second.status_code == 200
+    assert len(second.json()) == 2
+    assert second.headers["etag"] != etag
+
+
+async def test_index_catching_up_changes_the_etag(listings_client, db, clock, make_listing):
+    client, index = listings_client
+    served = make_listing()
+    await db.listings.insert_one(dict(served))
+    await index.rebuild()
+    first = client.get("/api/listings")
+
+    # Another worker writes a listing; its counter reaches this worker before the index does
+    await db.listings.insert_one(make_listing())
+    await server.ChangeCounters(("listings",)).bump("listings")
+    clock.advance(server.CHANGE_COUNTER_SYNC_SECONDS)
+    lagging = client.get("/api/listings", headers={"If-None-Match": first.headers["etag"]})
+    assert lagging.status_code == 200 and len(lagging.json()) == 1
+
+    await index.rebuild()
+    caught_up = client.get("/api/listings", headers={"If-None-Match": lagging.headers["etag"]})
+    assert caught_up.status_code == 200
+    assert len(caught_up.json()) == 2
+
+
+async def test_rate_refresh_rebuilds_the_index_before_bumping(db, monkeypatch):
+    calls = []
+
+    class Cursor:
+        async def to_list(self, length):
+            return [{"_id": {"from": "USD", "to": "TRY"}}]
+
+    async def bulk_write(operations, ordered):
+        calls.append("bulk_write")
+
+    async def rebuild():
+        calls.append("rebuild")
+
+    async def bump(name):
+        calls.append(f"bump {name}")
+
+    rates = server.MarketRates(ttl_seconds=60)
+    rates.set({"base_currency": "USD", "rates": {"TRY": 34.0}})
+    monkeypatch.setattr(server, "market_rates", rates)
+    monkeypatch.setattr(server, "db", SimpleNamespace(listings=SimpleNamespace(aggregate=lambda pipeline: Cursor(), bulk_write=bulk_write)))
+    monkeypatch.setattr(server, "active_listing_index", SimpleNamespace(rebuild=rebuild))
+    monkeypatch.setattr(server, "change_counters", SimpleNamespace(bump=bump))
+
+    await server.refresh_listing_rate_scores()
+
+    assert calls == ["bulk_write", "rebuild", "bump listings"]
+
+
+@pytest.mark.parametrize("if_none_match, listing_exists, status", [
+    ("*", False, 404),
+    ("*", True, 200),
+    ("current", True, 304),
+])
+async def test_get_listing_wildcard_only_matches_existing(db, monkeypatch, make_listing, if_none_match, listing_exists, status):
+    monkeypatch.setattr(server, "change_counters", server.ChangeCounters(("listings",)))
+    listing = make_listing()
+    if listing_exists:
+        await db.listings.insert_one(dict(listing))
+    client = TestClient(server.app)
+    if if_none_match == "current":
+        if_none_match = client.get(f"/api/listings/{listing['id']}").headers["etag"]
+
+    response = client.get(f"/api/listings/{listing['id']}", headers={"If-None-Match": if_none_match})
+
+    assert response.status_code == status
@@ -0,0 +1,65 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def outbox(db, monkeypatch):
+    monkeypatch.setattr(server, "EMAIL_CONFIGURED", True)
+    monkeypatch.setattr(server, "EMAIL_OUTBOX_MAX_ATTEMPTS", 2)
+    email_outbox = server.EmailOutbox()
+
+    async def claim():
+        # mongomock re-applies the filter for ReturnDocument.AFTER, which the
+        # claimed row no longer matches; claim the same row in two steps instead
+        row = await db.email_outbox.find_one(
+            {"status": "pending", "next_attempt_at": {"$lte": server.datetime.now(server.timezone.utc)}}, {"_id": 0}
+        )
+        if row is not None:
+            await db.email_outbox.update_one({"id": row["id"]}, {"$set": {"status": "sending"}, "$inc": {"attempts": 1}})
+            row = {**row, "status": "sending", "attempts": row["attempts"] + 1}
+        return row
+
+    monkeypatch.setattr(email_outbox, "_claim", claim)
+    yield email_outbox
+    email_outbox.executor.shutdown(wait=False)
+
+
+def send_results(outbox, monkeypatch, *errors):
+    """Make the outbox's SMTP step return `errors`, one per email, in order"""
+    pending = list(errors)
+    monkeypatch.setattr(outbox, "_send_batch", lambda emails: [pending.pop(0) for _ in emails])
+
+
+async def test_sent_rows_drop_the_body(outbox, db, monkeypatch):
+    await outbox.enqueue("a@example.com", "Reset your password", "<a href='/reset?token=secret'>reset</a>")
+    send_results(outbox, monkeypatch, None)
+
+    assert await outbox.process_batch() == 1
+
+    row = await db.email_outbox.find_one({"to": "a@example.com"})
+    assert row["status"] == "sent"
+    assert row["sent_at"] is not None
+    assert "html" not in row
+
+
+async def test_retried_rows_keep_the_body_until_they_fail(outbox, db, monkeypatch):
+    await outbox.enqueue("a@example.com", "Hello", "<p>body</p>")
+    send_results(outbox, monkeypatch, "timeout", "timeout")
+
+    await outbox.process_batch()
+    row = await db.email_outbox.find_one({"to": "a@example.com"})
+    assert (row["status"], row["html"]) == ("pending", "<p>body</p>")
+
+    await db.email_outbox.update_one({"id": row["id"]}, {"$set": {"next_attempt_at": row["created_at"]}})
+    await outbox.process_batch()
+    row = await db.email_outbox.find_one({"to": "a@example.com"})
+    assert row["status"] == "failed"
+    assert "html" not in row
+
+
+def test_sent_rows_expire():
+    ttl = [index for index in server.INDEX_REGISTRY["email_outbox"] if "expireAfterSeconds" in index]
+    assert ttl == [{"keys": [("sent_at", 1)], "expireAfterSeconds": server.EMAIL_OUTBOX_RETENTION_DAYS * 86400}]
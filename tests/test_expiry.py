@@ -0,0 +1,147 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def test_wheel_fires_keys_once_their_deadline_passes():
+    wheel = server.TimerWheel(slots=60, tick_seconds=1)
+    now = float(int(time.time()))  # tick-aligned
+    wheel.add(("listing", "soon", "expire"), now + 2.5)
+    wheel.add(("listing", "later", "expire"), now + 5.5)
+
+    assert wheel.advance(now + 2) == []
+    assert wheel.advance(now + 3) == [("listing", "soon", "expire")]
+    assert wheel.advance(now + 4) == []
+    assert wheel.advance(now + 6) == [("listing", "later", "expire")]
+    assert len(wheel) == 0
+
+
+def test_wheel_keeps_deadlines_beyond_one_revolution():
+    wheel = server.TimerWheel(slots=4, tick_seconds=1)
+    now = float(int(time.time()))  # tick-aligned
+    wheel.add(("listing", "far", "expire"), now + 10.5)
+
+    assert wheel.advance(now + 4) == []
+    assert wheel.advance(now + 8) == []
+    assert wheel.advance(now + 11) == [("listing", "far", "expire")]
+
+
+def test_wheel_readd_replaces_and_remove_cancels():
+    wheel = server.TimerWheel(slots=60, tick_seconds=1)
+    now = float(int(time.time()))  # tick-aligned
+    key = ("listing", "l1", "expire")
+    wheel.add(key, now + 2)
+    wheel.add(key, now + 20)
+    wheel.add(("listing", "l2", "expire"), now + 2)
+    wheel.remove(("listing", "l2", "expire"))
+
+    assert len(wheel) == 1
+    assert wheel.advance(now + 5) == []
+    assert wheel.advance(now + 21) == [key]
+
+
+def test_overdue_deadline_fires_on_next_tick():
+    wheel = server.TimerWheel(slots=60, tick_seconds=1)
+    now = float(int(time.time()))  # tick-aligned
+    wheel.add(("listing", "late", "expire"), now - 100)
+
+    assert wheel.advance(now + 2) == [("listing", "late", "expire")]
+
+
+def test_schedule_adds_warning_only_outside_the_warning_window():
+    scheduler = server.ExpiryScheduler()
+    now = datetime.now(timezone.utc)
+    scheduler.schedule("listing", "far", now + timedelta(hours=2))
+    scheduler.schedule("listing", "close", now + timedelta(minutes=server.EXPIRY_WARNING_MINUTES - 1))
+    scheduler.schedule("meetup", "m1", now + timedelta(hours=2))
+    scheduler.schedule("listing", "warned", now + timedelta(hours=2), warn=False)
+
+    assert set(scheduler.wheel.slot_of) == {
+        ("listing", "far", "expire"), ("listing", "far", "warn"),
+        ("listing", "close", "expire"),
+        ("meetup", "m1", "expire"),
+        ("listing", "warned", "expire"),
+    }
+    scheduler.cancel("listing", "far")
+    assert ("listing", "far", "warn") not in scheduler.wheel.slot_of
+
+
+@pytest.fixture
+def scheduler(db, monkeypatch):
+    monkeypatch.setattr(server, "active_listing_index", server.ActiveListingIndex())
+    monkeypatch.setattr(server, "change_counters", server.ChangeCounters(("listings",)))
+    return server.ExpiryScheduler()
+
+
+async def test_sync_schedules_only_deadlines_within_the_horizon(scheduler, db, make_listing):
+    now = datetime.now(timezone.utc)
+    await db.listings.insert_many([
+        make_listing(id="due", expires_at=now + timedelta(minutes=1)),
+        make_listing(id="distant", expires_at=now + timedelta(days=3)),
+        make_listing(id="closed", status="expired", expires_at=now + timedelta(minutes=1)),
+    ])
+    await db.meetups.insert_one({"id": "m1", "status": "pending", "expires_at": now + timedelta(minutes=1)})
+
+    await scheduler.sync()
+
+    assert {key[:2] for key in scheduler.wheel.slot_of} == {("listing", "due"), ("meetup", "m1")}
+
+
+async def test_expire_marks_listing_expired_and_drops_it_from_the_index(scheduler, db, make_listing):
+    listing = make_listing(expires_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+    await db.listings.insert_one(dict(listing))
+    server.active_listing_index.upsert(listing)
+
+    await scheduler.expire("listing", listing["id"])
+
+    assert (await db.listings.find_one({"id": listing["id"]}))["status"] == "expired"
+    assert listing["id"] not in server.active_listing_index.listings
+    assert server.change_counters.versions["listings"][0] == 1
+    assert scheduler.stats()["expired"]["listing"] == 1
+
+
+async def test_expire_skips_listing_renewed_since_it_was_scheduled(scheduler, db, make_listing):
+    listing = make_listing()  # expires in 12h
+    await db.listings.insert_one(dict(listing))
+
+    await scheduler.expire("listing", listing["id"])
+
+    assert (await db.listings.find_one({"id": listing["id"]}))["status"] == "active"
+    assert scheduler.stats()["stale"] == 1
+
+
+async def test_warn_notifies_once(scheduler, db, make_listing):
+    listing = make_listing(expires_at=datetime.now(timezone.utc) + timedelta(minutes=5))
+    await db.listings.insert_one(dict(listing))
+
+    await scheduler.warn("listing", listing["id"])
+    await scheduler.warn("listing", listing["id"])
+
+    notifications = await db.notifications.find({"user_id": "seller"}).to_list(None)
+    assert [n["type"] for n in notifications] == ["listing_expiring"]
+    assert scheduler.stats()["warned"] == 1
+    assert scheduler.stats()["stale"] == 1
+
+
+async def test_exchange_warning_notifies_both_parties(scheduler, db):
+    await db.exchange_confirmations.insert_one({
+        "id": "e1", "status": "pending", "user1_id": "a", "user2_id": "b",
+        "deadline": datetime.now(timezone.utc) + timedelta(minutes=5)
+    })
+
+    await scheduler.warn("exchange", "e1")
+
+    assert sorted(n["user_id"] for n in await db.notifications.find().to_list(None)) == ["a", "b"]
+
+
+async def test_fire_swallows_errors(scheduler, monkeypatch):
+    async def broken(kind, doc_id):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(scheduler, "expire", broken)
+    await scheduler.fire(("listing", "l1", "expire"))
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import httpx
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    real_sleep = server.asyncio.sleep
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(server.asyncio, "sleep", fake_sleep)
+    return delays
+
+
+def make_client(responses, retries=2):
+    """An OutboundHTTPClient whose upstream answers with `responses` in order"""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return responses[len(calls) - 1]
+
+    http_client = server.OutboundHTTPClient(5, 10, 5, retries, backoff=0.2, max_retry_after=5)
+    http_client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return http_client, calls
+
+
+async def test_retries_5xx_with_jittered_backoff(sleeps):
+    http_client, calls = make_client([httpx.Response(503), httpx.Response(502), httpx.Response(200)])
+
+    response = await http_client.get("https://api.example.com/rates")
+
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert 0 <= sleeps[0] <= 0.2 and 0 <= sleeps[1] <= 0.4
+    assert http_client.stats()["api.example.com"]["retries"] == 2
+
+
+async def test_429_waits_for_retry_after_seconds(sleeps):
+    http_client, calls = make_client([httpx.Response(429, headers={"Retry-After": "3"}), httpx.Response(200)])
+
+    response = await http_client.get("https://api.example.com/rates")
+
+    assert response.status_code == 200
+    assert sleeps == [3.0]
+
+
+async def test_429_with_http_date_retry_after(sleeps):
+    retry_at = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=2), usegmt=True)
+    http_client, calls = make_client([httpx.Response(429, headers={"Retry-After": retry_at}), httpx.Response(200)])
+
+    await http_client.get("https://api.example.com/rates")
+
+    assert 0 < sleeps[0] <= 2
+
+
+async def test_retry_after_beyond_cap_returns_without_retrying(sleeps):
+    http_client, calls = make_client([httpx.Response(429, headers={"Retry-After": "120"}), httpx.Response(200)])
+
+    response = await http_client.get("https://api.example.com/rates")
+
+    assert response.status_code == 429
+    assert len(calls) == 1
+    assert sleeps == []
+    assert http_client.stats()["api.example.com"]["errors"] == 1
+
+
+async def test_post_is_not_retried(sleeps):
+    http_client, calls = make_client([httpx.Response(503), httpx.Response(200)])
+
+    response = await http_client.request("POST", "https://api.example.com/session")
+
+    assert response.status_code == 503
+    assert len(calls) == 1
+
+
+def test_retry_after_parsing():
+    assert server.OutboundHTTPClient.retry_after(httpx.Response(429)) is None
+    assert server.OutboundHTTPClient.retry_after(httpx.Response(429, headers={"Retry-After": "soon"})) is None
+    assert server.OutboundHTTPClient.retry_after(httpx.Response(429, headers={"Retry-After": "-4"})) == 0.0
+    past = format_datetime(datetime.now(timezone.utc) - timedelta(minutes=1), usegmt=True)
+    assert server.OutboundHTTPClient.retry_after(httpx.Response(503, headers={"Retry-After": past})) == 0.0
@@ -0,0 +1,220 @@
+import io
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def image_bytes(size=(1600, 900), image_format="JPEG", exif=None, frames=1):
+    buffer = io.BytesIO()
+    options = {"exif": exif} if exif is not None else {}
+    if frames > 1:
+        extra = [Image.new("RGB", size, (30, 100 * i, 200)) for i in range(frames - 1)]
+        options.update(save_all=True, append_images=extra, duration=100)
+    Image.new("RGB", size, (200, 30, 30)).save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def exif_with_gps_and_orientation(orientation=1):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x010F] = "CameraMaker"
+    exif.get_ifd(0x8825)[2] = (41.0, 0.0, 29.0)  # GPSLatitude
+    return exif
+
+
+def test_strips_exif_and_writes_variants(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(image_bytes(exif=exif_with_gps_and_orientation()))
+
+    record = server.process_image(str(path))
+
+    with Image.open(path) as saved:
+        assert saved.format == "JPEG"
+        assert not saved.getexif()
+        assert saved.size == (1600, 900)
+    assert record["width"] == 1600 and record["height"] == 900
+    assert (record["thumb"]["width"], record["thumb"]["height"]) == (320, 320)
+    assert (record["medium"]["width"], record["medium"]["height"]) == (1280, 720)
+    for name in server.IMAGE_VARIANTS:
+        with Image.open(tmp_path / record[name]["filename"]) as variant:
+            assert variant.format == "WEBP"
+            assert (variant.width, variant.height) == (record[name]["width"], record[name]["height"])
+    assert not (tmp_path / ".photo.jpg.tmp").exists()
+
+
+def test_phone_mpo_is_resaved_as_plain_jpeg(tmp_path):
+    path = tmp_path / "phone.jpg"
+    path.write_bytes(image_bytes(size=(800, 600), image_format="MPO", exif=exif_with_gps_and_orientation(), frames=2))
+    with Image.open(path) as original:
+        assert (original.format, original.is_animated) == ("MPO", True)
+        assert 0x8825 in original.getexif()
+
+    record = server.process_image(str(path))
+
+    with Image.open(path) as saved:
+        assert saved.format == "JPEG"
+        assert getattr(saved, "n_frames", 1) == 1
+        assert not saved.getexif()
+    assert (record["width"], record["height"]) == (800, 600)
+
+
+@pytest.mark.parametrize("image_format", ["WEBP", "PNG"])
+def test_animated_images_keep_frames_but_lose_exif(tmp_path, image_format):
+    path = tmp_path / f"animated.{image_format.lower()}"
+    path.write_bytes(image_bytes(size=(200, 100), image_format=image_format, exif=exif_with_gps_and_orientation(), frames=3))
+
+    record = server.process_image(str(path))
+
+    with Image.open(path) as saved:
+        assert saved.format == image_format
+        assert saved.n_frames == 3
+        assert not saved.getexif()
+    assert (record["thumb"]["width"], record["thumb"]["height"]) == (100, 100)
+
+
+def test_formats_that_cannot_be_resaved_are_rejected(tmp_path):
+    path = tmp_path / "scan.tiff"
+    path.write_bytes(image_bytes(size=(100, 100), image_format="TIFF", exif=exif_with_gps_and_orientation()))
+
+    with pytest.raises(ValueError, match="unsupported format TIFF"):
+        server.process_image(str(path))
+
+
+def test_applies_orientation_before_dropping_it(tmp_path):
+    path = tmp_path / "rotated.jpg"
+    path.write_bytes(image_bytes(size=(400, 200), exif=exif_with_gps_and_orientation(orientation=6)))
+
+    record = server.process_image(str(path))
+
+    assert (record["width"], record["height"]) == (200, 400)
+    with Image.open(path) as saved:
+        assert saved.size == (200, 400)
+
+
+def test_small_images_are_not_upscaled(tmp_path):
+    path = tmp_path / "small.png"
+    path.write_bytes(image_bytes(size=(64, 48), image_format="PNG"))
+
+    record = server.process_image(str(path))
+
+    assert (record["medium"]["width"], record["medium"]["height"]) == (64, 48)
+    assert (record["thumb"]["width"], record["thumb"]["height"]) == (48, 48)
+    with Image.open(tmp_path / record["thumb"]["filename"]) as thumb:
+        assert thumb.size == (48, 48)
+
+
+def test_rejects_files_that_are_not_images(tmp_path):
+    path = tmp_path / "fake.jpg"
+    path.write_bytes(b"definitely not a jpeg")
+
+    with pytest.raises(ValueError, match="not a valid image"):
+        server.process_image(str(path))
+
+
+def test_rejects_images_over_the_pixel_limit_before_decoding(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "IMAGE_MAX_PIXELS", 1000)
+    path = tmp_path / "big.png"
+    path.write_bytes(image_bytes(size=(100, 11), image_format="PNG"))
+
+    with pytest.raises(ValueError, match="exceeds 1000 pixels"):
+        server.process_image(str(path))
+
+
+class BrokenExecutor(Executor):
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker killed"))
+        return future
+
+
+async def test_broken_pool_is_replaced_and_reported_as_503(tmp_path):
+    processor = server.ImageProcessor(max_workers=1, max_queue=1)
+    processor.executor = BrokenExecutor()
+    try:
+        with pytest.raises(HTTPException) as excinfo:
+            await processor.process(tmp_path / "photo.jpg")
+        assert excinfo.value.status_code == 503
+        assert not isinstance(processor.executor, BrokenExecutor)
+        assert processor.stats()["restarts"] == 1
+        assert processor.stats()["failed"] == 1
+    finally:
+        processor.shutdown()
+
+
+@pytest.fixture
+async def upload(db, tmp_path, monkeypatch):
+    """Posts files to a listing's upload-photos endpoint, with uploads written
+    to tmp_path and images processed in-process by `outcomes` (path -> record
+    or exception), in order"""
+    seller = {"id": "seller", "username": "seller", "email": "seller@example.com", "country": "TR"}
+    await db.users.insert_one(dict(seller))
+    await db.listings.insert_one({"id": "l1", "user_id": "seller", "status": "closed", "photos": []})
+    monkeypatch.setattr(server, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(server, "user_cache", server.UserCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(server, "change_counters", server.ChangeCounters(("listings",)))
+    outcomes = []
+
+    async def process(path):
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return server.process_image(str(path))
+
+    monkeypatch.setattr(server, "image_processor", SimpleNamespace(process=process))
+    client = TestClient(server.app)
+    headers = {"Authorization": f"Bearer {server.create_user_tokens(seller)['token']}"}
+
+    def post(*files, results):
+        outcomes[:] = results
+        return client.post(
+            "/api/listings/l1/upload-photos",
+            files=[("files", (name, content, content_type)) for name, content, content_type in files],
+            headers=headers
+        )
+    return post
+
+
+GOOD = ("good.jpg", image_bytes(), "image/jpeg")
+
+
+async def test_upload_stores_photos_and_variants(upload, db, tmp_path):
+    response = upload(GOOD, GOOD, results=["ok", "ok"])
+
+    assert response.status_code == 200
+    filenames = response.json()["filenames"]
+    assert len(filenames) == 2
+    assert (await db.listings.find_one({"id": "l1"}))["photos"] == filenames
+    assert len(list(tmp_path.iterdir())) == 2 * (1 + len(server.IMAGE_VARIANTS))
+
+
+@pytest.mark.parametrize("failure, status", [
+    (ValueError("not a valid image"), 400),
+    (HTTPException(status_code=503, detail="Server is busy, please try again shortly"), 503),
+    (HTTPException(status_code=503, detail="Image processing unavailable, please try again"), 503),
+])
+async def test_failed_upload_removes_every_file_it_wrote(upload, db, tmp_path, failure, status):
+    response = upload(GOOD, GOOD, results=["ok", failure])
+
+    assert response.status_code == status
+    assert list(tmp_path.iterdir()) == []
+    assert (await db.listings.find_one({"id": "l1"}))["photos"] == []
+
+
+@pytest.mark.parametrize("rejected", [
+    ("notes.txt", b"hello", "text/plain"),
+    ("scan.tiff", image_bytes(size=(10, 10), image_format="TIFF"), "image/tiff"),
+])
+async def test_rejected_file_type_removes_earlier_files(upload, tmp_path, rejected):
+    response = upload(GOOD, rejected, results=["ok"])
+
+    assert response.status_code == 400
+    assert list(tmp_path.iterdir()) == []
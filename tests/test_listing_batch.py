@@ -0,0 +1,121 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+SELLER = {"id": "seller", "username": "seller", "email": "seller@example.com", "country": "TR"}
+
+
+@pytest.fixture
+async def api(db, monkeypatch):
+    monkeypatch.setattr(server, "user_cache", server.UserCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(server, "market_rates", server.MarketRates(ttl_seconds=60))
+    monkeypatch.setattr(server, "change_counters", server.ChangeCounters(("listings",)))
+    monkeypatch.setattr(server, "active_listing_index", server.ActiveListingIndex())
+    monkeypatch.setattr(server, "expiry_scheduler", server.ExpiryScheduler())
+    await db.users.insert_one(dict(SELLER))
+    client = TestClient(server.app)
+    headers = {"Authorization": f"Bearer {server.create_user_tokens(SELLER)['token']}"}
+    return lambda *operations: client.post("/api/listings/batch", json={"operations": list(operations)}, headers=headers)
+
+
+def scheduled(listing_id):
+    return ("listing", listing_id, "expire") in server.expiry_scheduler.wheel.slot_of
+
+
+NEW_LISTING = {"from_currency": "USD", "from_amount": 100, "to_currency": "TRY", "to_amount": 3400, "country": "TR", "city": "Izmir", "description": "Cash"}
+
+
+async def test_create_close_and_republish(api, db, make_listing):
+    open_listing = make_listing()
+    expired = make_listing(status="expired", expires_at=datetime.now(timezone.utc) - timedelta(hours=1))
+    await db.listings.insert_many([dict(open_listing), dict(expired)])
+    server.active_listing_index.upsert(open_listing)
+
+    response = api(
+        {"action": "create", "listing": NEW_LISTING},
+        {"action": "close", "listing_id": open_listing["id"]},
+        {"action": "republish", "listing_id": expired["id"]},
+    )
+
+    body = response.json()
+    assert [result["ok"] for result in body["results"]] == [True, True, True]
+    assert (body["created"], body["closed"], body["republished"], body["failed"]) == (1, 1, 1, 0)
+    created_id = body["results"][0]["listing_id"]
+    assert (await db.listings.find_one({"id": open_listing["id"]}))["status"] == "closed"
+    assert (await db.listings.find_one({"id": expired["id"]}))["status"] == "active"
+    assert set(server.active_listing_index.listings) == {created_id, expired["id"]}
+    assert scheduled(created_id) and scheduled(expired["id"]) and not scheduled(open_listing["id"])
+
+
+async def test_rejected_operations(api, db, make_listing):
+    theirs = make_listing(user_id="someone-else")
+    active, still_active = make_listing(), make_listing()
+    await db.listings.insert_many([dict(theirs), dict(active), dict(still_active)])
+
+    response = api(
+        {"action": "close", "listing_id": "missing"},
+        {"action": "close", "listing_id": theirs["id"]},
+        {"action": "republish", "listing_id": still_active["id"]},
+        {"action": "close", "listing_id": active["id"]},
+        {"action": "close", "listing_id": active["id"]},
+        {"action": "create", "listing": {"city": "Izmir"}},
+        {"action": "delete", "listing_id": active["id"]},
+    )
+
+    details = [result["detail"] for result in response.json()["results"]]
+    assert details[:3] == ["Listing not found", "Not authorized", "Only expired listings can be republished"]
+    assert details[3] is None
+    assert details[4] == "Listing already changed in this batch"
+    assert "from_currency" in details[5]
+    assert details[6] == "Unknown action"
+    assert (await db.listings.find_one({"id": theirs["id"]}))["status"] == "active"
+
+
+async def test_republish_lost_to_a_concurrent_request_is_not_reported_or_indexed(api, db, make_listing, monkeypatch):
+    expired = make_listing(status="expired", expires_at=datetime.now(timezone.utc) - timedelta(hours=1))
+    await db.listings.insert_one(dict(expired))
+    elsewhere = datetime.now(timezone.utc) + timedelta(hours=1)
+    real_scores = server.listing_rate_scores
+
+    async def republished_elsewhere(listing):
+        # Another request republishes after this batch read the listing
+        await db.listings.update_one({"id": expired["id"]}, {"$set": {"status": "active", "expires_at": elsewhere}})
+        return await real_scores(listing)
+
+    monkeypatch.setattr(server, "listing_rate_scores", republished_elsewhere)
+    body = api({"action": "republish", "listing_id": expired["id"]}).json()
+
+    assert body["results"][0]["ok"] is False
+    assert body["results"][0]["detail"] == "Listing was changed by another request"
+    assert (body["republished"], body["failed"]) == (0, 1)
+    assert expired["id"] not in server.active_listing_index.listings
+    assert not scheduled(expired["id"])
+    stored = await db.listings.find_one({"id": expired["id"]})
+    assert abs(stored["expires_at"] - elsewhere) < timedelta(milliseconds=1)
+
+
+async def test_close_of_listing_deleted_mid_batch_fails_alone(api, db, make_listing, monkeypatch):
+    doomed = make_listing()
+    await db.listings.insert_one(dict(doomed))
+    server.active_listing_index.upsert(doomed)
+    real_scores = server.listing_rate_scores
+
+    async def deleted_elsewhere(listing):
+        # Scoring the created listing runs after the close was queued
+        await db.listings.delete_one({"id": doomed["id"]})
+        return await real_scores(listing)
+
+    monkeypatch.setattr(server, "listing_rate_scores", deleted_elsewhere)
+    body = api(
+        {"action": "close", "listing_id": doomed["id"]},
+        {"action": "create", "listing": NEW_LISTING},
+    ).json()
+
+    assert [result["ok"] for result in body["results"]] == [False, True]
+    assert (body["closed"], body["created"]) == (0, 1)
+    assert await db.listings.count_documents({"id": doomed["id"]}) == 0
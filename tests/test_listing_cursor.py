@@ -0,0 +1,94 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def listings_api(request, db, monkeypatch):
+    """A client for GET /listings served from the in-memory index or from Mongo,
+    plus a function that stores listings for it"""
+    index = server.ActiveListingIndex()
+    index.ready = request.param == "memory"
+    monkeypatch.setattr(server, "active_listing_index", index)
+
+    async def store(*listings):
+        await db.listings.insert_many([dict(listing) for listing in listings])
+        for listing in listings:
+            index.upsert(listing)
+
+    return TestClient(server.app), store
+
+
+def page_through(client, limit, **params):
+    pages, cursor = [], None
+    while True:
+        response = client.get("/api/listings", params={**params, "limit": limit, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        pages.append([listing["id"] for listing in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+
+
+def test_cursor_round_trip(make_listing):
+    listing = make_listing(created_at=datetime(2026, 5, 1, 12, 30, tzinfo=timezone.utc))
+    assert server.decode_listing_cursor(server.encode_listing_cursor(listing)) == (listing["created_at"], listing["id"])
+
+    legacy = {**listing, "created_at": "2026-05-01T12:30:00+00:00"}
+    assert server.decode_listing_cursor(server.encode_listing_cursor(legacy)) == (listing["created_at"], listing["id"])
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "bm90IGpzb24", "WzFd"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(server.HTTPException) as excinfo:
+        server.decode_listing_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+
+async def test_pages_cover_every_listing_once_in_order(listings_api, make_listing):
+    client, store = listings_api
+    listings = [make_listing() for _ in range(7)]
+    await store(*listings)
+
+    pages = page_through(client, limit=3)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == [listing["id"] for listing in listings]
+
+
+async def test_exact_multiple_of_limit_has_no_trailing_cursor(listings_api, make_listing):
+    client, store = listings_api
+    await store(*[make_listing() for _ in range(4)])
+
+    assert [len(page) for page in page_through(client, limit=2)] == [2, 2]
+
+
+async def test_equal_timestamps_are_split_by_id(listings_api, make_listing):
+    client, store = listings_api
+    same_time = datetime(2026, 5, 1, tzinfo=timezone.utc)
+    listings = [make_listing(created_at=same_time) for _ in range(5)]
+    await store(*listings)
+
+    pages = page_through(client, limit=2)
+
+    assert sum(pages, []) == sorted((listing["id"] for listing in listings), reverse=True)
+
+
+async def test_paging_with_filters(listings_api, make_listing):
+    client, store = listings_api
+    wanted = [make_listing(country="DE") for _ in range(3)]
+    await store(*wanted, *[make_listing(country="TR") for _ in range(3)])
+
+    pages = page_through(client, limit=2, country="DE")
+
+    assert sum(pages, []) == [listing["id"] for listing in wanted]
+
+
+def test_invalid_cursor_returns_400(listings_api):
+    client, _ = listings_api
+    assert client.get("/api/listings", params={"cursor": "garbage!"}).status_code == 400
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def test_repeat_views_within_window_count_once(clock):
+    counter = server.ListingViewCounter()
+    assert counter.record("l1", "seller", "viewer")
+    assert not counter.record("l1", "seller", "viewer")
+    assert counter.record("l1", "seller", "other")
+    assert counter.record("l2", "seller", "viewer")
+
+    clock.advance(server.VIEW_DEDUP_WINDOW_SECONDS)
+    assert counter.record("l1", "seller", "viewer")
+
+    assert counter.pending_views("l1") == 3
+    assert counter.pending_users == {"seller": 4}
+    assert counter.stats()["duplicate_views"] == 1
+
+
+async def test_flush_increments_counts_and_invalidates_cached_sellers(db, monkeypatch):
+    cache = server.UserCache(max_size=10, ttl_seconds=60)
+    monkeypatch.setattr(server, "user_cache", cache)
+    await db.users.insert_many([{"id": "seller", "listing_views": 5}, {"id": "bystander", "listing_views": 0}])
+    await db.listings.insert_one({"id": "l1", "view_count": 5})
+    cache.set("seller", {"id": "seller", "listing_views": 5})
+    cache.set("bystander", {"id": "bystander", "listing_views": 0})
+    counter = server.ListingViewCounter()
+    counter.record("l1", "seller", "a")
+    counter.record("l1", "seller", "b")
+
+    await counter.flush()
+
+    assert (await db.listings.find_one({"id": "l1"}))["view_count"] == 7
+    assert (await db.users.find_one({"id": "seller"}))["listing_views"] == 7
+    assert await counter.total_views("seller") == 7
+    assert cache.get("seller") is None
+    assert cache.get("bystander") is not None
+    assert counter.pending_listings == {} and counter.pending_users == {}
+    assert counter.stats()["flushed_updates"] == 2
+
+
+async def test_flush_forgets_viewers_past_the_window(db, clock):
+    counter = server.ListingViewCounter()
+    counter.record("l1", "seller", "early")
+    clock.advance(server.VIEW_DEDUP_WINDOW_SECONDS / 2)
+    counter.record("l1", "seller", "late")
+    clock.advance(server.VIEW_DEDUP_WINDOW_SECONDS / 2)
+
+    await counter.flush()
+
+    assert list(counter.recent) == [("l1", "late")]
+
+
+async def test_failed_flush_keeps_views_and_cache(monkeypatch):
+    cache = server.UserCache(max_size=10, ttl_seconds=60)
+    cache.set("seller", {"id": "seller", "listing_views": 5})
+    monkeypatch.setattr(server, "user_cache", cache)
+    counter = server.ListingViewCounter()
+    counter.record("l1", "seller", "a")
+
+    async def failing_bulk_write(operations, ordered):
+        counter.record("l1", "seller", "b")  # a view recorded while the write was in flight
+        raise RuntimeError("connection reset")
+
+    collection = SimpleNamespace(bulk_write=failing_bulk_write)
+    monkeypatch.setattr(server, "db", SimpleNamespace(listings=collection, users=collection))
+    await counter.flush()
+
+    assert counter.pending_listings == {"l1": 2}
+    assert counter.pending_users == {"seller": 2}
+    assert counter.stats()["failed_flushes"] == 2
+    assert cache.get("seller") is not None
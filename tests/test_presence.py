@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_flush_writes_pending_in_one_batch(db):
+    await db.users.insert_many([{"id": "u1", "is_online": False}, {"id": "u2", "is_online": False}])
+    tracker = server.PresenceTracker()
+    tracker.touch("u1")
+    seen_at = tracker.touch("u2")
+
+    await tracker.flush()
+
+    user = await db.users.find_one({"id": "u2"})
+    assert user["is_online"] is True
+    assert user["last_seen"] == seen_at.replace(microsecond=seen_at.microsecond // 1000 * 1000)
+    assert tracker.pending == {}
+    assert tracker.stats()["flushes"] == 1
+    assert tracker.stats()["flushed_updates"] == 2
+
+
+async def test_flush_without_pending_is_a_no_op(db):
+    tracker = server.PresenceTracker()
+    await tracker.flush()
+    assert tracker.stats()["flushes"] == 0
+
+
+async def test_failed_flush_keeps_batch_without_clobbering_newer_activity(monkeypatch):
+    tracker = server.PresenceTracker()
+    tracker.touch("u1")
+    tracker.touch("u2")
+
+    async def failing_bulk_write(operations, ordered):
+        tracker.touch("u2")  # activity recorded while the write was in flight
+        raise RuntimeError("connection reset")
+
+    monkeypatch.setattr(server, "db", SimpleNamespace(users=SimpleNamespace(bulk_write=failing_bulk_write)))
+    first_u1 = tracker.pending["u1"]
+    await tracker.flush()
+
+    assert set(tracker.pending) == {"u1", "u2"}
+    assert tracker.pending["u1"] == first_u1
+    assert tracker.pending["u2"] == tracker.last_seen["u2"]
+    assert tracker.stats()["failed_flushes"] == 1
+
+
+async def test_flush_drops_users_outside_online_window(db):
+    tracker = server.PresenceTracker()
+    tracker.touch("active")
+    tracker.last_seen["stale"] = datetime.now(timezone.utc) - server.ONLINE_WINDOW - timedelta(seconds=1)
+
+    await tracker.flush()
+
+    assert set(tracker.last_seen) == {"active"}
+    assert tracker.get_last_seen("stale") is None
+
+
+def test_forget():
+    tracker = server.PresenceTracker()
+    tracker.touch("u1")
+    tracker.forget("u1")
+    assert tracker.stats()["tracked_users"] == 0
+    assert tracker.stats()["pending_updates"] == 0
@@ -0,0 +1,96 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import server
+
+
+def make_request(forwarded_for=None, peer="10.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 1234)})
+
+
+def test_allows_limit_attempts_per_window(clock):
+    limiter = server.SlidingWindowLimiter("test", limit=3, window_seconds=60, max_keys=100)
+    for _ in range(3):
+        assert limiter.retry_after("k") == 0
+        limiter.record("k")
+
+    assert limiter.retry_after("k") == pytest.approx(60, abs=0.1)
+    assert limiter.retry_after("other") == 0
+
+
+def test_window_slides(clock):
+    limiter = server.SlidingWindowLimiter("test", limit=2, window_seconds=60, max_keys=100)
+    limiter.record("k")
+    clock.advance(30)
+    limiter.record("k")
+
+    clock.advance(20)
+    assert limiter.retry_after("k") == pytest.approx(10, abs=0.1)
+    clock.advance(11)  # the first attempt has left the window
+    assert limiter.retry_after("k") == 0
+    limiter.record("k")
+    assert limiter.retry_after("k") == pytest.approx(29, abs=0.1)  # until the second one leaves
+
+
+def test_evicts_least_recently_used_keys():
+    limiter = server.SlidingWindowLimiter("test", limit=2, window_seconds=60, max_keys=2)
+    limiter.record("a")
+    limiter.record("b")
+    limiter.record("a")
+    limiter.record("c")
+
+    assert list(limiter.attempts) == ["a", "c"]
+    assert limiter.stats()["evictions"] == 1
+
+
+def test_enforce_rejects_without_recording(clock):
+    ip_limiter = server.SlidingWindowLimiter("ip", limit=5, window_seconds=60, max_keys=100)
+    email_limiter = server.SlidingWindowLimiter("email", limit=1, window_seconds=60, max_keys=100)
+    server.enforce_rate_limits((ip_limiter, "1.2.3.4"), (email_limiter, "a@b.c"))
+
+    with pytest.raises(HTTPException) as excinfo:
+        server.enforce_rate_limits((ip_limiter, "1.2.3.4"), (email_limiter, "a@b.c"))
+
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.headers["Retry-After"] == "60"
+    assert len(ip_limiter.attempts["1.2.3.4"]) == 1
+    assert email_limiter.stats()["rejected"] == 1
+
+
+def test_client_ip_ignores_forwarded_for_by_default(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_COUNT", 0)
+    assert server.client_ip(make_request("6.6.6.6")) == "10.0.0.1"
+
+
+@pytest.mark.parametrize("forwarded_for, proxies, expected", [
+    ("203.0.113.7", 1, "203.0.113.7"),
+    ("6.6.6.6, 203.0.113.7", 1, "203.0.113.7"),  # client-forged entry on the left
+    ("6.6.6.6, 203.0.113.7, 10.1.1.1", 2, "203.0.113.7"),
+    ("203.0.113.7", 2, "203.0.113.7"),
+    (" , ", 1, "10.0.0.1"),
+])
+def test_client_ip_counts_trusted_proxies_from_the_right(monkeypatch, forwarded_for, proxies, expected):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_COUNT", proxies)
+    assert server.client_ip(make_request(forwarded_for)) == expected
+
+
+def test_spoofed_forwarded_for_does_not_reset_login_limit(db, monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXY_COUNT", 1)
+    limiter = server.SlidingWindowLimiter("login_ip", limit=2, window_seconds=60, max_keys=100)
+    monkeypatch.setattr(server, "login_ip_limiter", limiter)
+    client = TestClient(server.app)
+
+    statuses = [
+        client.post(
+            "/api/auth/login",
+            json={"email": f"user{i}@example.com", "password": "wrong"},
+            headers={"X-Forwarded-For": f"6.6.6.{i}, 198.51.100.9"}
+        ).status_code
+        for i in range(3)
+    ]
+
+    assert statuses == [401, 401, 429]
+    assert list(limiter.attempts) == ["198.51.100.9"]
@@ -0,0 +1,81 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def payload(sub="u1", jti="j1", ver=0, expires_in=900):
+    return {"sub": sub, "jti": jti, "ver": ver, "exp": int(time.time()) + expires_in}
+
+
+async def test_revoke_token_rejects_only_that_jti(db):
+    revocations = server.RevocationList()
+    await revocations.revoke_token(payload(jti="j1"))
+
+    assert revocations.is_revoked(payload(jti="j1"))
+    assert not revocations.is_revoked(payload(jti="j2"))
+    assert await db.revoked_tokens.count_documents({"kind": "jti"}) == 1
+
+
+async def test_revoke_user_tokens_rejects_older_versions(db):
+    revocations = server.RevocationList()
+    await revocations.revoke_user_tokens("u1", token_version=2)
+
+    assert revocations.is_revoked(payload(ver=1))
+    assert not revocations.is_revoked(payload(ver=2))
+    assert not revocations.is_revoked(payload(sub="u2", ver=0))
+    # Tokens minted before versions existed count as version 0
+    assert revocations.is_revoked({"sub": "u1", "jti": "old"})
+
+
+async def test_older_user_entry_does_not_lower_min_version(db):
+    revocations = server.RevocationList()
+    expires_at = datetime.now(timezone.utc) + timedelta(days=1)
+    revocations.apply({"kind": "user", "user_id": "u1", "token_version": 3, "expires_at": expires_at})
+    revocations.apply({"kind": "user", "user_id": "u1", "token_version": 1, "expires_at": expires_at})
+
+    assert revocations.min_token_versions["u1"][0] == 3
+
+
+async def test_sync_picks_up_other_workers_and_prunes_expired(db):
+    worker_a, worker_b = server.RevocationList(), server.RevocationList()
+    await worker_b.sync()
+    await worker_a.revoke_token(payload(jti="j1"))
+    await worker_a.revoke_user_tokens("u2", token_version=1)
+
+    await worker_b.sync()
+    assert worker_b.is_revoked(payload(jti="j1"))
+    assert worker_b.is_revoked(payload(sub="u2", jti="x", ver=0))
+
+    worker_b.revoked_jtis["gone"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+    await worker_b.sync()
+    assert "gone" not in worker_b.revoked_jtis
+    assert "j1" in worker_b.revoked_jtis
+
+
+async def test_logout_revokes_access_and_refresh_tokens(db, monkeypatch):
+    monkeypatch.setattr(server, "revocation_list", server.RevocationList())
+    monkeypatch.setattr(server, "user_cache", server.UserCache(max_size=10, ttl_seconds=60))
+    user = {"id": "u1", "username": "ali", "email": "ali@example.com", "country": "TR"}
+    await db.users.insert_one(dict(user))
+    tokens = server.create_user_tokens(user)
+    client = TestClient(server.app)
+    headers = {"Authorization": f"Bearer {tokens['token']}"}
+
+    response = client.post("/api/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+    assert client.post("/api/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    refresh_payload = jwt.decode(tokens["refresh_token"], server.SECRET_KEY, algorithms=[server.ALGORITHM])
+    assert server.revocation_list.is_revoked(refresh_payload)
+
+
+def test_logout_requires_a_token():
+    assert TestClient(server.app).post("/api/auth/logout", json={}).status_code in (401, 403)
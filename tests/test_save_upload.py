@@ -0,0 +1,78 @@
+import io
+
+import pytest
+from fastapi import HTTPException
+from starlette.datastructures import UploadFile
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+class CountingStream(io.BytesIO):
+    """A request body that records how much was read from it"""
+
+    def __init__(self, data, fail_after=None):
+        super().__init__(data)
+        self.reads = []
+        self.fail_after = fail_after
+
+    def read(self, size=-1):
+        if self.fail_after is not None and len(self.reads) >= self.fail_after:
+            raise ConnectionResetError("client went away")
+        chunk = super().read(size)
+        self.reads.append(len(chunk))
+        return chunk
+
+
+def upload_of(data, size=None, fail_after=None):
+    return UploadFile(CountingStream(data, fail_after), size=size, filename="photo.jpg")
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(server, "UPLOAD_CHUNK_SIZE", 4)
+
+
+async def test_streams_file_into_place(tmp_path):
+    destination = tmp_path / "photo.jpg"
+    file = upload_of(b"0123456789")
+
+    await server.save_upload(file, destination, max_size=10, too_large_detail="too large")
+
+    assert destination.read_bytes() == b"0123456789"
+    assert max(file.file.reads) <= 4
+    assert list(tmp_path.iterdir()) == [destination]
+
+
+async def test_declared_size_over_limit_is_rejected_before_reading(tmp_path):
+    file = upload_of(b"0123456789", size=10)
+
+    with pytest.raises(HTTPException) as excinfo:
+        await server.save_upload(file, tmp_path / "photo.jpg", max_size=9, too_large_detail="too large")
+
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.detail == "too large"
+    assert file.file.reads == []
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_stream_over_limit_stops_reading_and_leaves_nothing(tmp_path):
+    file = upload_of(b"x" * 100)
+
+    with pytest.raises(HTTPException):
+        await server.save_upload(file, tmp_path / "photo.jpg", max_size=10, too_large_detail="too large")
+
+    assert sum(file.file.reads) == 12  # stopped at the first chunk past the limit
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_failed_upload_keeps_existing_destination(tmp_path):
+    destination = tmp_path / "photo.jpg"
+    destination.write_bytes(b"previous")
+
+    with pytest.raises(ConnectionResetError):
+        await server.save_upload(upload_of(b"x" * 20, fail_after=2), destination, max_size=100, too_large_detail="too large")
+
+    assert destination.read_bytes() == b"previous"
+    assert list(tmp_path.iterdir()) == [destination]
@@ -0,0 +1,108 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+
+def index_of(*listings):
+    index = server.ActiveListingIndex()
+    for listing in listings:
+        index.upsert(listing)
+    return index
+
+
+def ids(listings):
+    return [listing["id"] for listing in listings]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("İzmir", ["izmir"]),
+    ("IZMIR, Çeşme!", ["izmir", "cesme"]),
+    ("Kadıköy cash-only", ["kadikoy", "cash", "only"]),
+    ("", []),
+    (None, []),
+])
+def test_search_tokens_fold_case_and_diacritics(text, expected):
+    assert server.search_tokens(text) == expected
+
+
+def test_city_match_outranks_description_match(make_listing):
+    in_city = make_listing(city="Izmir", description="Cash")
+    in_description = make_listing(city="Istanbul", description="Can meet in İzmir")
+    in_both = make_listing(city="İzmir", description="Izmir center")
+    unrelated = make_listing(city="Ankara", description="Cash")
+    index = index_of(in_description, unrelated, in_city, in_both)
+
+    results = index.search(["izmir"])
+
+    assert ids(results) == ids([in_both, in_city, in_description])
+    assert [result["score"] for result in results] == [4.0, 3.0, 1.0]
+
+
+def test_any_term_matches_and_more_terms_score_higher(make_listing):
+    both = make_listing(city="Izmir", description="euro cash")
+    one = make_listing(city="Izmir", description="dollars")
+    index = index_of(one, both)
+
+    assert ids(index.search(["izmir", "euro"])) == ids([both, one])
+    assert ids(index.search(["euro"])) == ids([both])
+
+
+def test_equal_scores_are_newest_first_then_filtered(make_listing):
+    newer = make_listing(city="Izmir")
+    older = make_listing(city="Izmir")
+    german = make_listing(city="Izmir", country="DE")
+    blocked = make_listing(city="Izmir", user_id="blocked")
+    index = index_of(older, german, blocked, newer)
+
+    assert ids(index.search(["izmir"], country="TR", exclude_user_ids={"blocked"})) == ids([newer, older])
+    assert ids(index.search(["izmir"], to_currency="EUR")) == []
+
+
+def test_reindexed_listing_drops_old_tokens(make_listing):
+    listing = make_listing(city="Izmir")
+    index = index_of(listing)
+    index.upsert({**listing, "city": "Bursa"})
+
+    assert index.search(["izmir"]) == []
+    assert ids(index.search(["bursa"])) == ids([listing])
+
+
+def test_search_cursor_round_trip():
+    listing = {"id": "l1", "score": 3.0, "created_at": datetime(2026, 5, 1, tzinfo=timezone.utc)}
+    assert server.decode_search_cursor(server.encode_search_cursor(listing)) == (3.0, listing["created_at"], "l1")
+
+
+@pytest.fixture
+def search_api(monkeypatch):
+    index = server.ActiveListingIndex()
+    index.ready = True
+    monkeypatch.setattr(server, "active_listing_index", index)
+    return TestClient(server.app), index
+
+
+def test_endpoint_pages_through_ranked_results(search_api, make_listing):
+    client, index = search_api
+    city = [make_listing(city="Izmir") for _ in range(3)]
+    description = [make_listing(description="Izmir pickup") for _ in range(2)]
+    for listing in description + city:
+        index.upsert(listing)
+
+    seen, cursor = [], None
+    while True:
+        response = client.get("/api/listings/search", params={"q": "izmir", "limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        seen.append(ids(response.json()))
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert seen == [ids(city[:2]), ids(city[2:] + description[:1]), ids(description[1:])]
+
+
+@pytest.mark.parametrize("params", [{"q": "!!"}, {"q": "izmir", "cursor": "garbage!"}])
+def test_endpoint_rejects_bad_input(search_api, params):
+    client, _ = search_api
+    assert client.get("/api/listings/search", params=params).status_code == 400
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2026-05-01T12:30:00+00:00", datetime(2026, 5, 1, 12, 30, tzinfo=timezone.utc)),
+    ("2026-05-01T12:30:00Z", datetime(2026, 5, 1, 12, 30, tzinfo=timezone.utc)),
+    ("2026-05-01T12:30:00", datetime(2026, 5, 1, 12, 30, tzinfo=timezone.utc)),
+    (datetime(2026, 5, 1, 12, 30), datetime(2026, 5, 1, 12, 30, tzinfo=timezone.utc)),
+    ("yesterday", None),
+    (None, None),
+    (12345, None),
+])
+def test_parse_datetime(value, expected):
+    assert server.parse_datetime(value) == expected
+
+
+async def test_converts_strings_and_records_completion(db):
+    created = datetime(2026, 5, 1, 12, 30, tzinfo=timezone.utc)
+    await db.users.insert_many([
+        {"id": "u1", "created_at": created.isoformat(), "last_seen": "2026-05-02T08:00:00Z"},
+        {"id": "u2", "created_at": created},
+    ])
+    await db.listings.insert_one({"id": "l1", "created_at": created.isoformat(), "expires_at": "not a date"})
+
+    await server.migrate_timestamps_to_dates(batch_size=1)
+
+    u1 = await db.users.find_one({"id": "u1"})
+    assert u1["created_at"] == created
+    assert u1["last_seen"] == datetime(2026, 5, 2, 8, tzinfo=timezone.utc)
+    assert (await db.users.find_one({"id": "u2"}))["created_at"] == created
+    listing = await db.listings.find_one({"id": "l1"})
+    assert listing["created_at"] == created
+    assert listing["expires_at"] == "not a date"  # unparseable values are left alone
+    state = await db.migrations.find_one({"_id": "timestamps_to_dates"})
+    assert state["completed_at"]
+    assert "listings.expires_at" in state["done"]
+
+
+async def test_second_run_is_a_no_op(db):
+    await server.migrate_timestamps_to_dates()
+    await db.users.insert_one({"id": "late", "created_at": "2026-05-01T00:00:00+00:00"})
+
+    await server.migrate_timestamps_to_dates()
+
+    assert (await db.users.find_one({"id": "late"}))["created_at"] == "2026-05-01T00:00:00+00:00"
+
+
+async def test_resumes_with_the_remaining_fields(db):
+    done = [f"{collection}.{field}" for collection, fields in server.TIMESTAMP_FIELDS.items() for field in fields]
+    done.remove("messages.timestamp")
+    await db.migrations.insert_one({"_id": "timestamps_to_dates", "done": done})
+    await db.users.insert_one({"id": "u1", "created_at": "2026-05-01T00:00:00+00:00"})
+    await db.messages.insert_one({"id": "m1", "timestamp": "2026-05-01T00:00:00+00:00"})
+
+    await server.migrate_timestamps_to_dates()
+
+    assert (await db.users.find_one({"id": "u1"}))["created_at"] == "2026-05-01T00:00:00+00:00"
+    assert isinstance((await db.messages.find_one({"id": "m1"}))["timestamp"], datetime)
+
+
+@pytest.fixture
+def api(db, monkeypatch):
+    monkeypatch.setattr(server, "user_cache", server.UserCache(max_size=10, ttl_seconds=60))
+    monkeypatch.setattr(server, "presence_tracker", server.PresenceTracker())
+    return TestClient(server.app)
+
+
+@pytest.mark.parametrize("last_seen, online", [
+    (lambda: datetime.now(timezone.utc).isoformat(), True),
+    (lambda: (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat(), False),
+    (lambda: "garbage", False),
+])
+async def test_user_status_reads_unmigrated_last_seen(api, db, last_seen, online):
+    await db.users.insert_one({"id": "u1", "username": "ali", "last_seen": last_seen()})
+
+    response = api.get("/api/users/u1/status")
+
+    assert response.status_code == 200
+    assert response.json()["is_online"] is online
+
+
+async def test_my_listings_reads_unmigrated_expiry(api, db, make_listing):
+    user = {"id": "seller", "username": "seller", "email": "s@example.com", "country": "TR"}
+    await db.users.insert_one(dict(user))
+    fresh = make_listing()
+    fresh["expires_at"] = (datetime.now(timezone.utc) + timedelta(hours=1)).isoformat()
+    broken = make_listing()
+    broken["expires_at"] = "garbage"
+    await db.listings.insert_many([fresh, broken])
+    token = server.create_user_tokens(user)["token"]
+
+    response = api.get("/api/listings/my-listings", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    assert {listing["id"] for listing in response.json()} == {fresh["id"], broken["id"]}
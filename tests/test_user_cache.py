@@ -0,0 +1,61 @@
+import pytest
+
+import server
+
+pytestmark = pytest.mark.anyio
+
+
+def test_get_returns_copy():
+    cache = server.UserCache(max_size=10, ttl_seconds=60)
+    cache.set("u1", {"id": "u1", "password": "hash"})
+
+    user = cache.get("u1")
+    user.pop("password")
+
+    assert cache.get("u1") == {"id": "u1", "password": "hash"}
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = server.UserCache(max_size=10, ttl_seconds=60)
+    cache.set("u1", {"id": "u1"})
+
+    clock.advance(59)
+    assert cache.get("u1") is not None
+    clock.advance(2)
+    assert cache.get("u1") is None
+    assert "u1" not in cache.entries
+    assert cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used():
+    cache = server.UserCache(max_size=2, ttl_seconds=60)
+    cache.set("u1", {"id": "u1"})
+    cache.set("u2", {"id": "u2"})
+    cache.get("u1")  # u2 is now the oldest
+    cache.set("u3", {"id": "u3"})
+
+    assert list(cache.entries) == ["u1", "u3"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate():
+    cache = server.UserCache(max_size=10, ttl_seconds=60)
+    cache.set("u1", {"id": "u1"})
+    cache.invalidate("u1")
+    cache.invalidate("missing")
+
+    assert cache.get("u1") is None
+
+
+async def test_load_user_reads_through_cache(db, monkeypatch):
+    monkeypatch.setattr(server, "user_cache", server.UserCache(max_size=10, ttl_seconds=60))
+    await db.users.insert_one({"id": "u1", "username": "ali"})
+
+    assert (await server.load_user("u1"))["username"] == "ali"
+    await db.users.update_one({"id": "u1"}, {"$set": {"username": "veli"}})
+    assert (await server.load_user("u1"))["username"] == "ali"
+
+    server.user_cache.invalidate("u1")
+    assert (await server.load_user("u1"))["username"] == "veli"
+    assert await server.load_user("missing") is None
+    assert server.user_cache.stats()["hits"] == 1